@@ -0,0 +1,54 @@
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.db.models import CharField, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Lower, NullIf
+
+# Выражение уникального индекса auth_user_email_ci_unique (миграция 0010):
+# индекс используется, только если запрос сравнивает то же выражение. Пустая
+# строка вписана в SQL, а не передана параметром: SQLite не сопоставляет
+# параметр запроса с литералом в выражении индекса
+EMAIL_KEY = NullIf(Lower('email'), RawSQL("''", (), output_field=CharField()))
+
+
+def users_by_email(email):
+    """Пользователи с данным email без учёта регистра, поиск по индексу"""
+    return User.objects.alias(email_key=EMAIL_KEY).filter(email_key=Lower(Value(email)))
+
+
+# Сколько раз пробовать новое имя, если параллельная регистрация заняла выбранное
+USERNAME_ATTEMPTS = 5
+
+
+def next_username(base):
+    """Свободное имя вида base_N одним запросом: N на единицу больше наибольшего занятого"""
+    suffixes = [
+        int(suffix)
+        for suffix in (
+            username[len(base) + 1:]
+            for username in User.objects.filter(username__startswith=f'{base}_').values_list('username', flat=True)
+        )
+        if suffix.isdigit()
+    ]
+    return f'{base}_{max(suffixes, default=0) + 1}'
+
+
+def save_new_user(user, base):
+    """Сохраняет нового пользователя под именем base, а если оно занято — base_N.
+
+    Имя строится из ИНН, который уникален среди профилей, поэтому обычно оно
+    свободно и сохранение обходится одним INSERT без предварительных проверок.
+    Конфликт имени ловится по уникальному индексу: вставка повторяется в
+    точке сохранения со следующим свободным суффиксом.
+    """
+    user.username = base
+    for attempt in range(USERNAME_ATTEMPTS):
+        try:
+            with transaction.atomic():
+                user.save()
+            return user
+        except IntegrityError:
+            # Другое нарушение целостности (например, email) не исправить сменой имени
+            if attempt == USERNAME_ATTEMPTS - 1 or not User.objects.filter(username=user.username).exists():
+                raise
+            user.username = next_username(base)
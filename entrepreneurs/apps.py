@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class EntrepreneursConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'entrepreneurs'
+
+    def ready(self):
+        # Сброс кеша профилей при изменении профиля и реквизитов, PRAGMA для
+        # SQLite, проверки объектов БД вне состояния моделей
+        from . import checks, database, profiles  # noqa: F401
@@ -0,0 +1,64 @@
+import io
+import os
+from zipfile import ZipFile, ZipInfo, ZIP_STORED
+
+ARCHIVE_CHUNK_SIZE = 64 * 1024
+
+
+class _StreamBuffer(io.RawIOBase):
+    """Несбрасываемый поток для ZipFile: накопленные байты забираются через drain()"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _unique_name(name, used_names):
+    """Добавляет к имени номер, если в архиве уже есть файл с таким именем"""
+    stem, extension = os.path.splitext(name)
+    candidate = name
+    counter = 1
+    while candidate in used_names:
+        candidate = f'{stem} ({counter}){extension}'
+        counter += 1
+    used_names.add(candidate)
+    return candidate
+
+
+def stream_documents_zip(documents):
+    """Генератор ZIP-архива из документов.
+
+    Архив собирается по мере отдачи: в памяти держится только текущий блок
+    файла и записи центрального каталога, поэтому потребление памяти не
+    зависит от числа документов. DOCX уже сжаты, так что файлы кладутся без
+    повторного сжатия (ZIP_STORED). Отсутствующие в хранилище файлы пропускаются.
+    """
+    buffer = _StreamBuffer()
+    used_names = set()
+    with ZipFile(buffer, 'w', compression=ZIP_STORED) as archive:
+        for document in documents:
+            try:
+                source = document.file.open('rb')
+            except FileNotFoundError:
+                continue
+
+            with source:
+                info = ZipInfo(_unique_name(document.download_name, used_names), date_time=document.created_at.timetuple()[:6])
+                info.compress_type = ZIP_STORED
+                with archive.open(info, 'w') as target:
+                    for chunk in iter(lambda: source.read(ARCHIVE_CHUNK_SIZE), b''):
+                        target.write(chunk)
+                        yield buffer.drain()
+            yield buffer.drain()
+    yield buffer.drain()
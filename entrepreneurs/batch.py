@@ -0,0 +1,245 @@
+import csv
+import io
+import json
+import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+
+from .database import retry_on_locked
+from .documents import RENDERERS, get_renderer, render_invoices
+from .forms import InvoiceGenerationForm, InvoiceItemForm
+from .invoices import (
+    confirm_batch_numbers, create_invoices, find_documents, invoice_content_key, number_batch,
+    release_batch_numbers,
+)
+from .models import GeneratedDocument
+
+ITEM_FIELDS = ('description', 'quantity', 'unit', 'price', 'vat_rate')
+CUSTOMER_FIELDS = ('customer_name', 'customer_address', 'customer_inn', 'date', 'payment_due_date')
+
+
+class BatchError(Exception):
+    pass
+
+
+def read_batch(file, file_format=None):
+    """Читает счета из CSV или JSON.
+
+    JSON — список объектов с полями заказчика и списком items. CSV — по строке
+    на позицию; позиции с одинаковыми полями заказчика и датами объединяются в
+    один счёт в порядке появления.
+    """
+    name = getattr(file, 'name', '') or ''
+    if file_format is None:
+        file_format = 'json' if name.lower().endswith('.json') else 'csv'
+
+    content = file.read()
+    if isinstance(content, bytes):
+        content = content.decode('utf-8-sig')
+
+    if file_format == 'json':
+        try:
+            invoices = json.loads(content)
+        except ValueError as e:
+            raise BatchError(f'Некорректный JSON: {e}')
+        if not isinstance(invoices, list):
+            raise BatchError('JSON должен содержать список счетов')
+        return invoices
+
+    try:
+        dialect = csv.Sniffer().sniff(content[:4096], delimiters=',;')
+    except csv.Error:
+        dialect = csv.excel
+    invoices = {}
+    for row in csv.DictReader(io.StringIO(content), dialect=dialect):
+        key = tuple(row.get(field) for field in CUSTOMER_FIELDS)
+        invoice = invoices.get(key)
+        if invoice is None:
+            invoice = invoices[key] = {field: row.get(field) for field in CUSTOMER_FIELDS}
+            invoice['items'] = []
+        invoice['items'].append({field: row.get(field) for field in ITEM_FIELDS})
+    return list(invoices.values())
+
+
+def clean_batch(invoices):
+    """Проверяет счета теми же формами, что и create_invoice.
+
+    Возвращает список пар (items, form_data) из простых объектов, которые можно
+    передать в дочерние процессы без настроенного Django.
+    """
+    cleaned = []
+    for number, invoice in enumerate(invoices, 1):
+        form = InvoiceGenerationForm(invoice)
+        if not form.is_valid():
+            raise BatchError(f'Счёт {number}: {form.errors.as_text()}')
+
+        items = []
+        for item_data in invoice.get('items') or []:
+            item_form = InvoiceItemForm(item_data)
+            if not item_form.is_valid():
+                raise BatchError(f'Счёт {number}: {item_form.errors.as_text()}')
+            items.append(SimpleNamespace(**{field: item_form.cleaned_data[field] for field in ITEM_FIELDS}))
+        if not items:
+            raise BatchError(f'Счёт {number}: нет позиций')
+
+        cleaned.append((items, form.cleaned_data))
+    return cleaned
+
+
+def _chunks(sequence, size):
+    for start in range(0, len(sequence), size):
+        yield sequence[start:start + size]
+
+
+def _render_and_store(entrepreneur, supplier, bank, invoices, document_format, workers, chunk_size, progress):
+    """Рендерит счета пулом процессов и пишет файлы пулом потоков.
+
+    Возвращает пары (имя в хранилище, имя для скачивания). При ошибке уже
+    записанные файлы не удаляются: файл с тем же содержимым может быть общим
+    с документом, который ещё не закоммичен, а ничейные файлы старше
+    DOCUMENT_BLOB_GRACE_HOURS убирает collect_document_blobs.
+    """
+    chunks = list(_chunks(invoices, chunk_size))
+    file_field = GeneratedDocument._meta.get_field('file')
+    timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
+    extension = RENDERERS[document_format].extension
+    names = [None] * len(invoices)
+    done = 0
+
+    def save_file(index, content):
+        filename = f'Счет_{entrepreneur.inn}_{timestamp}_{index + 1}{extension}'
+        name = file_field.storage.save(file_field.generate_filename(None, filename), ContentFile(content))
+        names[index] = (name, filename)
+
+    with ThreadPoolExecutor(max_workers=settings.BATCH_INVOICE_IO_THREADS) as io_pool:
+        if workers > 1 and len(chunks) > 1:
+            pool = ProcessPoolExecutor(max_workers=workers, initializer=partial(get_renderer, document_format))
+            rendered = pool.map(partial(render_invoices, supplier, bank, document_format=document_format), chunks)
+        else:
+            pool = None
+            rendered = (render_invoices(supplier, bank, chunk, document_format) for chunk in chunks)
+
+        try:
+            writes = []
+            for chunk_index, contents in enumerate(rendered):
+                for offset, content in enumerate(contents):
+                    writes.append(io_pool.submit(save_file, chunk_index * chunk_size + offset, content))
+                done += len(contents)
+                if progress:
+                    progress(done, len(invoices))
+            for write in writes:
+                write.result()
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+    return names
+
+
+@retry_on_locked
+def _number_fresh(entrepreneur, invoices, keys, holder):
+    """Отбирает ещё не сформированные счета и резервирует им номера за пачкой holder.
+
+    Возвращает ({ключ: id готового документа}, новые счета, их ключи).
+    Уже сформированные счета и повторы внутри пачки не рендерятся.
+    """
+    with transaction.atomic():
+        found = find_documents(entrepreneur, set(keys))
+        seen = set(found)
+        fresh = []
+        fresh_keys = []
+        for invoice, key in zip(invoices, keys):
+            if key not in seen:
+                seen.add(key)
+                fresh.append(invoice)
+                fresh_keys.append(key)
+
+        number_batch(entrepreneur, fresh, holder)
+    return found, fresh, fresh_keys
+
+
+@retry_on_locked
+def _save_batch(entrepreneur, invoices, content_keys, names, holder):
+    with transaction.atomic():
+        if not confirm_batch_numbers(holder, len(invoices)):
+            raise BatchError('Резерв номеров истёк, и часть номеров уже выдана другим счетам; повторите загрузку')
+        documents = GeneratedDocument.objects.bulk_create([
+            GeneratedDocument(
+                entrepreneur=entrepreneur,
+                document_type='Счёт на оплату',
+                file=name,
+                filename=filename,
+                status=GeneratedDocument.STATUS_READY,
+                content_key=key,
+            )
+            for (name, filename), key in zip(names, content_keys)
+        ])
+        create_invoices(entrepreneur, invoices, documents)
+    return documents
+
+
+def generate_batch(entrepreneur, invoices, document_format='docx', workers=None, chunk_size=None, progress=None):
+    """Генерирует пачку счетов одного предпринимателя в формате document_format.
+
+    Профиль, реквизиты и шаблон загружаются один раз; счета рендерятся пулом
+    процессов, файлы пишутся в хранилище пулом потоков, строки
+    GeneratedDocument, Invoice и InvoiceLine вставляются через bulk_create.
+    Счета, уже сформированные ранее (по invoice_content_key), не рендерятся
+    повторно: в documents для них возвращаются существующие документы.
+    Номера резервируются за пачкой в отдельной короткой транзакции, файлы
+    рендерятся и пишутся вне транзакций, строки вставляются второй короткой
+    транзакцией, которая снимает резерв. При ошибке номера освобождаются
+    (release_batch_numbers) и достаются следующим счетам.
+    progress(done, total) вызывается по мере готовности файлов.
+    """
+    bank_details = entrepreneur.bank_details
+    supplier = SimpleNamespace(
+        company_name=entrepreneur.company_name,
+        inn=entrepreneur.inn,
+        ogrnip=entrepreneur.ogrnip,
+    )
+    bank = SimpleNamespace(
+        bank_name=bank_details.bank_name,
+        bik=bank_details.bik,
+        correspondent_account=bank_details.correspondent_account,
+        payment_account=bank_details.payment_account,
+    )
+
+    if workers is None:
+        workers = settings.BATCH_INVOICE_WORKERS or os.cpu_count() or 1
+    chunk_size = chunk_size or settings.BATCH_INVOICE_CHUNK_SIZE
+    started = time.perf_counter()
+
+    keys = [
+        invoice_content_key(entrepreneur, bank_details, form_data, items, document_format)
+        for items, form_data in invoices
+    ]
+    # Транзакции короткие: рендер и запись файлов идут без блокировки БД
+    holder = uuid.uuid4().hex
+    found, fresh, fresh_keys = _number_fresh(entrepreneur, invoices, keys, holder)
+    try:
+        names = _render_and_store(
+            entrepreneur, supplier, bank, fresh, document_format, workers, chunk_size, progress
+        )
+        documents = _save_batch(entrepreneur, fresh, fresh_keys, names, holder)
+    except BaseException:
+        retry_on_locked(release_batch_numbers)(holder)
+        raise
+    found.update((document.content_key, document.pk) for document in documents)
+
+    elapsed = time.perf_counter() - started
+    return {
+        'documents': [found[key] for key in keys],
+        'count': len(documents),
+        'reused': len(invoices) - len(documents),
+        'elapsed': elapsed,
+        'invoices_per_second': len(documents) / elapsed if elapsed else None,
+    }
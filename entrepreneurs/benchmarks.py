@@ -0,0 +1,226 @@
+"""Набор замеров производительности для manage.py run_benchmarks.
+
+Каждый замер — несколько повторов после прогрева; в отчёт идут медиана и
+минимум. Сравнение с эталоном идёт по минимуму: он меньше всего зависит от
+посторонней нагрузки на машину. Представления замеряются тестовым клиентом
+Django во временной тестовой БД, поэтому рабочие данные не затрагиваются. Результаты сохраняются в JSON и
+сравниваются с эталоном: замер, ставший медленнее эталона больше чем на
+порог, считается регрессией.
+"""
+import json
+import math
+import platform
+import statistics
+from datetime import date, timedelta
+from decimal import Decimal
+from time import perf_counter
+from types import SimpleNamespace
+
+import django
+import docx
+from django.contrib.auth.models import User
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from .documents import RENDERERS, generate_invoice
+from .models import BankDetails, EntrepreneurProfile, GeneratedDocument
+
+INVOICE_ITEMS = (10, 100, 1000)
+DOCUMENT_COUNTS = (10, 1000, 100000)
+PASSWORD = 'Secret-pass-123'
+# Минимальная длительность одного повтора замера, в секундах
+MIN_SAMPLE_TIME = 0.02
+
+
+def sample_invoice(items_count):
+    """Тестовые данные счёта без обращения к БД"""
+    entrepreneur = SimpleNamespace(company_name='Иванов Иван Иванович', inn='123456789012', ogrnip='123456789012345')
+    bank_details = SimpleNamespace(
+        bank_name='ПАО Сбербанк',
+        bik='044525225',
+        correspondent_account='30101810400000000225',
+        payment_account='40802810900000000001',
+    )
+    items = [
+        SimpleNamespace(
+            description=f'Товар {i}',
+            quantity=Decimal('3.00'),
+            unit='шт',
+            price=Decimal('149.90'),
+            vat_rate=Decimal('20.00'),
+        )
+        for i in range(1, items_count + 1)
+    ]
+    form_data = {
+        'number': 1,
+        'customer_name': 'ООО «Ромашка»',
+        'customer_address': 'г. Москва, ул. Ленина, д. 1',
+        'customer_inn': '7701234567',
+        'date': date(2025, 6, 1),
+        'payment_due_date': date(2025, 6, 15),
+    }
+    return entrepreneur, bank_details, items, form_data
+
+
+def measure(func, iterations, warmup=1):
+    """Время одного вызова func: медиана и минимум по iterations повторам.
+
+    Быстрые функции (как timeit) вызываются пачкой не короче MIN_SAMPLE_TIME,
+    иначе погрешность таймера и планировщика сравнима с самим замером.
+    """
+    for _ in range(warmup):
+        started = perf_counter()
+        func()
+        elapsed = perf_counter() - started
+    number = max(1, math.ceil(MIN_SAMPLE_TIME / elapsed)) if warmup else 1
+    timings = []
+    for _ in range(iterations):
+        started = perf_counter()
+        for _ in range(number):
+            func()
+        timings.append((perf_counter() - started) / number)
+    return {'median': statistics.median(timings), 'min': min(timings), 'iterations': iterations}
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'python-docx': getattr(docx, '__version__', 'unknown'),
+        'machine': platform.machine(),
+    }
+
+
+def _create_entrepreneur(n):
+    user = User.objects.create_user(f'bench_{n}', f'bench{n}@example.com', PASSWORD)
+    entrepreneur = EntrepreneurProfile.objects.create(
+        user=user,
+        company_name=f'Замер {n}',
+        inn=f'{n:012d}',
+        ogrnip=f'{n:015d}',
+        phone='+7 (900) 000-00-00',
+    )
+    BankDetails.objects.create(
+        entrepreneur=entrepreneur,
+        bank_name='ПАО Сбербанк',
+        bik='044525225',
+        correspondent_account='30101810400000000225',
+        payment_account='40802810900000000001',
+    )
+    return entrepreneur
+
+
+def bench_generate_invoice(iterations):
+    results = {}
+    for items_count in INVOICE_ITEMS:
+        invoice = sample_invoice(items_count)
+        for document_format in RENDERERS:
+            results[f'generate_invoice[{document_format},{items_count}]'] = measure(
+                lambda: generate_invoice(*invoice, document_format=document_format), iterations
+            )
+    return results
+
+
+def bench_invoice_flow(iterations):
+    """Черновик → предпросмотр → генерация → скачивание, как в браузере"""
+    entrepreneur = _create_entrepreneur(1)
+    client = Client()
+    client.force_login(entrepreneur.user)
+    counter = iter(range(10 ** 9))
+
+    def flow():
+        data = {
+            'customer_name': f'ООО «Ромашка» {next(counter)}',
+            'customer_address': 'г. Москва',
+            'customer_inn': '7701234567',
+            'date': '2025-06-01',
+            'payment_due_date': '2025-06-15',
+            'form-TOTAL_FORMS': '10',
+            'form-INITIAL_FORMS': '0',
+            'form-MIN_NUM_FORMS': '0',
+            'form-MAX_NUM_FORMS': '1000',
+        }
+        for n in range(10):
+            data.update({
+                f'form-{n}-description': f'Товар {n}',
+                f'form-{n}-quantity': '2',
+                f'form-{n}-unit': 'шт',
+                f'form-{n}-price': '100.50',
+                f'form-{n}-vat_rate': '20',
+            })
+        preview_url = client.post(reverse('entrepreneurs:create_invoice'), data).url
+        client.get(preview_url)
+        detail_url = client.post(preview_url, {'generate': '1'}).url
+        document_id = int(detail_url.rstrip('/').rsplit('/', 1)[1])
+        response = client.get(reverse('entrepreneurs:download_document', args=[document_id]))
+        b''.join(response.streaming_content)
+
+    return {'invoice_flow': measure(flow, iterations)}
+
+
+def bench_documents_list(iterations, counts=DOCUMENT_COUNTS):
+    results = {}
+    created_at = timezone.now()
+    for n, count in enumerate(counts, 2):
+        entrepreneur = _create_entrepreneur(n)
+        for start in range(0, count, 5000):
+            GeneratedDocument.objects.bulk_create([
+                GeneratedDocument(
+                    entrepreneur=entrepreneur,
+                    document_type='Счёт на оплату',
+                    file=f'{i}.docx',
+                    status=GeneratedDocument.STATUS_READY,
+                    created_at=created_at - timedelta(seconds=i),
+                )
+                for i in range(start, min(start + 5000, count))
+            ])
+        client = Client()
+        client.force_login(entrepreneur.user)
+        url = reverse('entrepreneurs:documents')
+        results[f'documents_list[{count}]'] = measure(lambda: client.get(url), iterations)
+    return results
+
+
+def bench_login(iterations):
+    entrepreneur = _create_entrepreneur(len(DOCUMENT_COUNTS) + 2)
+    url = reverse('entrepreneurs:login')
+
+    def login():
+        response = Client().post(url, {'username': entrepreneur.user.username, 'password': PASSWORD})
+        assert response.status_code == 302, response.status_code
+
+    return {'login': measure(login, iterations)}
+
+
+def run_suite(iterations=20, document_counts=DOCUMENT_COUNTS):
+    results = {}
+    results.update(bench_generate_invoice(iterations))
+    results.update(bench_invoice_flow(iterations))
+    results.update(bench_documents_list(iterations, document_counts))
+    results.update(bench_login(max(iterations // 2, 1)))
+    return {'environment': environment(), 'results': results}
+
+
+def compare(report, baseline, threshold):
+    """Регрессии относительно эталона: [(замер, эталон, сейчас)] по минимальному времени.
+
+    Сравниваются только замеры, которые есть в обоих отчётах.
+    """
+    regressions = []
+    for name, result in report['results'].items():
+        reference = baseline['results'].get(name)
+        if reference and result['min'] > reference['min'] * (1 + threshold):
+            regressions.append((name, reference['min'], result['min']))
+    return regressions
+
+
+def load_report(path):
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)
+
+
+def save_report(report, path):
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(report, file, ensure_ascii=False, indent=2, sort_keys=True)
+        file.write('\n')
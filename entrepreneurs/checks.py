@@ -0,0 +1,74 @@
+"""Проверки объектов БД, созданных миграциями вне состояния моделей.
+
+Такие объекты makemigrations не отслеживает, а пересоздание таблицы в SQLite
+(например, при AlterField) удаляет их без ошибки. Проверки с тегом database
+выполняются в manage.py migrate и manage.py check --database default.
+"""
+from django.contrib.auth.models import User
+from django.core.checks import Error, Tags, register
+from django.db import connections
+
+from .models import DocumentSearchText
+from .search import FTS_TABLE
+
+# Уникальный индекс по email без учёта регистра (миграция 0010, accounts.EMAIL_KEY)
+EMAIL_INDEX = 'auth_user_email_ci_unique'
+# Поддержка полнотекстового индекса (миграция 0012): триггеры FTS5 в SQLite,
+# GIN-индекс в PostgreSQL
+SEARCH_TRIGGERS = tuple(f'{FTS_TABLE}_{event}' for event in ('insert', 'delete', 'update'))
+SEARCH_INDEX = 'document_search_content_gin'
+
+
+def _constraints(connection, table):
+    """Ограничения и индексы таблицы или None, если таблицы ещё нет"""
+    with connection.cursor() as cursor:
+        if table not in connection.introspection.table_names(cursor):
+            return None
+        return connection.introspection.get_constraints(cursor, table)
+
+
+@register(Tags.database)
+def check_email_index(app_configs, databases=None, **kwargs):
+    errors = []
+    for alias in databases or ():
+        constraints = _constraints(connections[alias], User._meta.db_table)
+        if constraints is not None and EMAIL_INDEX not in constraints:
+            errors.append(Error(
+                f'В базе {alias} нет индекса {EMAIL_INDEX}: email пользователей не уникален '
+                'и поиск по нему идёт без индекса',
+                hint='Пересоздайте индекс: откатите и заново примените миграцию entrepreneurs 0010',
+                id='entrepreneurs.E001',
+            ))
+    return errors
+
+
+def _missing_search_objects(connection):
+    table = DocumentSearchText._meta.db_table
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            if table not in connection.introspection.table_names(cursor):
+                return []
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = %s", [table])
+            triggers = {name for name, in cursor.fetchall()}
+        return [trigger for trigger in SEARCH_TRIGGERS if trigger not in triggers]
+    if connection.vendor == 'postgresql':
+        constraints = _constraints(connection, table)
+        if constraints is not None and SEARCH_INDEX not in constraints:
+            return [SEARCH_INDEX]
+    return []
+
+
+@register(Tags.database)
+def check_search_index(app_configs, databases=None, **kwargs):
+    errors = []
+    for alias in databases or ():
+        missing = _missing_search_objects(connections[alias])
+        if missing:
+            errors.append(Error(
+                f'В базе {alias} нет объектов полнотекстового поиска: {", ".join(missing)}; '
+                'поиск по документам не видит новых и изменённых текстов',
+                hint='Пересоздайте индекс: откатите и заново примените миграцию entrepreneurs 0012, '
+                     'затем выполните manage.py index_documents',
+                id='entrepreneurs.E002',
+            ))
+    return errors
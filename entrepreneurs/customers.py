@@ -0,0 +1,154 @@
+"""Справочник заказчиков предпринимателя и автодополнение по нему.
+
+Заказчики сохраняются при формировании счетов (по одному на ИНН, с именем и
+адресом из последнего счёта). Автодополнение ищет по началу ИНН или имени:
+каждый запрос — один проход по индексу (entrepreneur, search_name) или
+(entrepreneur, inn) с LIMIT, а ответы кешируются на предпринимателя.
+"""
+import re
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import F
+from django.db.models.lookups import StartsWith
+from django.utils import timezone
+
+from .models import Customer
+from .profiles import cache_timeout
+
+# Организационно-правовая форма в начале имени не участвует в поиске:
+# «ООО «Ромашка»» находится по «ром»
+_LEGAL_FORM_RE = re.compile(r'^(?:ооо|оао|зао|пао|ао|ип|нко|ано)\s+')
+_PUNCTUATION_RE = re.compile(r'[^\w\s]+')
+_GLOB_SPECIAL_RE = re.compile(r'[*?\[]')
+
+
+def search_key(name):
+    """Имя для поиска: нижний регистр, ё → е, без знаков препинания и организационно-правовой формы"""
+    key = ' '.join(_PUNCTUATION_RE.sub(' ', name.lower().replace('ё', 'е')).split())
+    return _LEGAL_FORM_RE.sub('', key)
+
+
+class PrefixMatch(StartsWith):
+    """startswith, для которого SQLite использует обычный индекс.
+
+    LIKE в SQLite не учитывает регистр и идёт по индексу только с COLLATE
+    NOCASE, поэтому там начало строки ищется через GLOB: с учётом регистра,
+    что для заранее нормализованных ключей и нужно. На PostgreSQL это
+    LIKE 'префикс%' по индексу с varchar_pattern_ops.
+    """
+
+    def as_sqlite(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        pattern = _GLOB_SPECIAL_RE.sub(r'[\g<0>]', self.rhs) + '*'
+        return f'{lhs} GLOB %s', (*lhs_params, pattern)
+
+
+def _search_terms(query):
+    """(поле, префикс): цифры ищутся по ИНН, остальное — по имени"""
+    query = query.strip()
+    if query.isdigit():
+        return 'inn', query
+    return 'search_name', search_key(query)
+
+
+def search_customers(entrepreneur_id, query):
+    """Заказчики, у которых с query начинается ИНН или имя.
+
+    Без ORDER BY: строки идут в порядке индекса, и LIMIT останавливает его
+    просмотр. Сортировка по имени на PostgreSQL шла бы по правилам сортировки
+    БД, а индекс с varchar_pattern_ops упорядочен побайтно, и совпадения
+    пришлось бы сортировать отдельно.
+    """
+    field, prefix = _search_terms(query)
+    if not prefix:
+        return Customer.objects.none()
+    return Customer.objects.filter(PrefixMatch(F(field), prefix), entrepreneur_id=entrepreneur_id).order_by()
+
+
+def find_customers(entrepreneur_id, query):
+    customers = search_customers(entrepreneur_id, query).values('name', 'address', 'inn')
+    return list(customers[:settings.CUSTOMER_AUTOCOMPLETE_LIMIT])
+
+
+def _cache():
+    return caches[settings.ENTREPRENEUR_CACHE_ALIAS]
+
+
+def _version_key(entrepreneur_id):
+    return f'customer-autocomplete-version:{entrepreneur_id}'
+
+
+def _cache_version(entrepreneur_id):
+    """Текущая версия справочника в кеше; новая, если записи о версии нет"""
+    key = _version_key(entrepreneur_id)
+    version = _cache().get(key)
+    if version is None:
+        _cache().add(key, uuid.uuid4().hex, None)
+        version = _cache().get(key)
+    return version
+
+
+def _cache_key(entrepreneur_id, version):
+    return f'customer-autocomplete:{entrepreneur_id}:{version}'
+
+
+def autocomplete(entrepreneur_id, query):
+    """find_customers с кешем.
+
+    Все ответы предпринимателю хранятся в одной записи кеша (до
+    CUSTOMER_CACHE_QUERIES последних запросов), поэтому нажатие клавиши —
+    два чтения из кеша (версия и ответы), а при промахе ещё один запрос к БД.
+    Ключ ответов включает версию справочника: ответ, прочитанный из БД до
+    изменения и записанный после него, попадает под старую версию и больше
+    не читается.
+    """
+    field, prefix = _search_terms(query)
+    if not prefix:
+        return []
+    key = _cache_key(entrepreneur_id, _cache_version(entrepreneur_id))
+    answers = _cache().get(key) or {}
+    term = f'{field}:{prefix}'
+    if term not in answers:
+        answers[term] = find_customers(entrepreneur_id, query)
+        while len(answers) > settings.CUSTOMER_CACHE_QUERIES:
+            del answers[next(iter(answers))]
+        _cache().set(key, answers, cache_timeout(_cache(), settings.CUSTOMER_CACHE_TIMEOUT))
+    return answers[term]
+
+
+def invalidate_customers(entrepreneur_id):
+    """Переводит справочник на новую версию; ответы старой истекут сами"""
+    _cache().set(_version_key(entrepreneur_id), uuid.uuid4().hex, None)
+
+
+def remember_customers(entrepreneur_id, forms_data):
+    """Добавляет заказчиков счетов в справочник или обновляет имя и адрес по ИНН.
+
+    forms_data — cleaned_data форм счетов; одним запросом INSERT ... ON
+    CONFLICT. Версия кеша автодополнения меняется после фиксации транзакции,
+    чтобы параллельный запрос не закешировал справочник до изменения.
+    """
+    now = timezone.now()
+    customers = {
+        form_data['customer_inn']: Customer(
+            entrepreneur_id=entrepreneur_id,
+            name=form_data['customer_name'],
+            address=form_data['customer_address'],
+            inn=form_data['customer_inn'],
+            search_name=search_key(form_data['customer_name']),
+            last_used_at=now,
+        )
+        for form_data in forms_data
+    }
+    if not customers:
+        return
+    Customer.objects.bulk_create(
+        customers.values(),
+        update_conflicts=True,
+        unique_fields=['entrepreneur', 'inn'],
+        update_fields=['name', 'address', 'search_name', 'last_used_at'],
+    )
+    transaction.on_commit(lambda: invalidate_customers(entrepreneur_id))
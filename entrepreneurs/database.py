@@ -0,0 +1,54 @@
+import random
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db import OperationalError, connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    """Применяет SQLITE_PRAGMAS к каждому новому соединению с SQLite"""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for pragma, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {pragma} = {value}')
+
+
+def is_locked_error(error):
+    return isinstance(error, OperationalError) and 'database is locked' in str(error)
+
+
+def retry_on_locked(func=None, using='default'):
+    """Повторяет запись, если SQLite ответил «database is locked».
+
+    busy_timeout не помогает, когда транзакция уже читала и не может
+    перейти к записи, пока пишет другая: SQLite сразу возвращает ошибку.
+    Тогда вся функция выполняется заново с экспоненциальной задержкой, до
+    SQLITE_WRITE_RETRIES раз. Внутри внешней транзакции повтор невозможен,
+    и ошибка передаётся дальше. Функция должна быть безопасна для повтора:
+    одна транзакция или идемпотентная запись.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            connection = connections[using]
+            for attempt in range(settings.SQLITE_WRITE_RETRIES + 1):
+                try:
+                    return func(*args, **kwargs)
+                except OperationalError as e:
+                    if (
+                        not is_locked_error(e)
+                        or connection.in_atomic_block
+                        or attempt == settings.SQLITE_WRITE_RETRIES
+                    ):
+                        raise
+                # Случайная добавка разводит повторы параллельных писателей
+                delay = settings.SQLITE_WRITE_RETRY_BACKOFF * 2 ** attempt
+                time.sleep(delay * random.uniform(1, 1.5))
+        return wrapper
+
+    return decorator(func) if func is not None else decorator
@@ -1,92 +1,513 @@
 from docx import Document
 from docx.shared import Pt, Inches
 from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
+from django.conf import settings
+from django.core.files import File
 from io import BytesIO
 from datetime import datetime
+from functools import lru_cache
+from tempfile import SpooledTemporaryFile
+from xml.sax.saxutils import escape
+from zipfile import ZipFile, ZipInfo, ZIP_DEFLATED
+import re
 
-def generate_invoice(entrepreneur, bank_details, items, form_data):
+from .pdf import PdfDocument, load_font
+from .profiling import timed
+from .totals import compute_totals, footer_rows, line_amount
+
+DOCUMENT_PART = 'word/document.xml'
+# Фиксированная дата элементов пакета: одинаковые счета дают одинаковые байты
+# и хранятся в хранилище одним файлом
+_PACKAGE_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+# Маркеры слотов в скомпилированном шаблоне (символы из области частного использования)
+_SLOT_OPEN = '\ue000'
+_SLOT_CLOSE = '\ue001'
+_SLOT_RUN_RE = re.compile(
+    '<w:r>(<w:rPr>(?:(?!</w:r>).)*?</w:rPr>)?'
+    f'<w:t>{_SLOT_OPEN}(\\w+){_SLOT_CLOSE}</w:t></w:r>'
+)
+_TEXT_SLOTS = ('title', 'date', 'supplier', 'bank', 'accounts', 'customer', 'customer_address', 'signature')
+_RUN_BREAK_RE = re.compile(r'([\t\r\n])')
+_XML_INVALID_RE = re.compile('[^\t\n\r\x20-\ud7ff\ue000-\ufffd\U00010000-\U0010ffff]')
+# Строк таблицы на одну запись в поток document.xml
+_XML_ROWS_PER_WRITE = 256
+
+TABLE_HEADER = ('№', 'Наименование', 'Кол-во', 'Ед.', 'Цена', 'Сумма')
+
+
+def invoice_texts(entrepreneur, bank_details, form_data):
+    """Возвращает тексты переменных фрагментов счёта (кроме таблицы)"""
+    return {
+        'title': f"СЧЕТ НА ОПЛАТУ № {form_data['number']}",
+        'date': f"от {form_data['date'].strftime('%d.%m.%Y')}",
+        'supplier': f"ИП {entrepreneur.company_name}, ИНН {entrepreneur.inn}, ОГРНИП {entrepreneur.ogrnip}",
+        'bank': f"{bank_details.bank_name}, БИК {bank_details.bik}, ",
+        'accounts': f"к/с {bank_details.correspondent_account}, р/с {bank_details.payment_account}",
+        'customer': f"{form_data['customer_name']}, ИНН {form_data['customer_inn']}, ",
+        'customer_address': f"адрес: {form_data['customer_address']}",
+        'signature': f"ИП {entrepreneur.company_name}",
+    }
+
+
+def _invoice_row(i, item, sum_row):
+    return (
+        str(i),
+        item.description,
+        str(item.quantity),
+        item.unit,
+        f"{item.price:.2f}",
+        f"{sum_row:.2f}",
+    )
+
+
+def invoice_rows(items):
+    """Возвращает тексты ячеек строк таблицы и итоги счёта (totals.InvoiceTotals)"""
+    totals = compute_totals(items)
+    rows = [_invoice_row(i, item, amount) for i, (item, amount) in enumerate(zip(items, totals.amounts), 1)]
+    return rows, totals
+
+
+def iter_invoice_rows(items):
+    """Тексты ячеек строк таблицы по одной строке, без накопления списка"""
+    for i, item in enumerate(items, 1):
+        yield _invoice_row(i, item, line_amount(item.quantity, item.price))
+
+
+def build_invoice_document(texts, rows, footer):
+    """Собирает счёт средствами python-docx (эталон для скомпилированного шаблона)"""
     document = Document()
-    
+
     # Настройка стилей
     style = document.styles['Normal']
     font = style.font
     font.name = 'Times New Roman'
     font.size = Pt(12)
-    
+
     # Заголовок
     title = document.add_paragraph()
     title.alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
-    title_run = title.add_run('СЧЕТ НА ОПЛАТУ № 1')
+    title_run = title.add_run(texts['title'])
     title_run.bold = True
     title_run.font.size = Pt(14)
-    
-    document.add_paragraph(f"от {form_data['date'].strftime('%d.%m.%Y')}")
+
+    document.add_paragraph(texts['date'])
     document.add_paragraph()
-    
+
     # Поставщик
     supplier = document.add_paragraph()
     supplier.add_run('Поставщик: ').bold = True
-    supplier.add_run(f"ИП {entrepreneur.company_name}, ИНН {entrepreneur.inn}, ОГРНИП {entrepreneur.ogrnip}")
-    
+    supplier.add_run(texts['supplier'])
+
     # Банковские реквизиты
     bank = document.add_paragraph()
     bank.add_run('Банковские реквизиты: ').bold = True
-    bank.add_run(f"{bank_details.bank_name}, БИК {bank_details.bik}, ")
-    bank.add_run(f"к/с {bank_details.correspondent_account}, р/с {bank_details.payment_account}")
-    
+    bank.add_run(texts['bank'])
+    bank.add_run(texts['accounts'])
+
     document.add_paragraph()
-    
+
     # Покупатель
     customer = document.add_paragraph()
     customer.add_run('Покупатель: ').bold = True
-    customer.add_run(f"{form_data['customer_name']}, ИНН {form_data['customer_inn']}, ")
-    customer.add_run(f"адрес: {form_data['customer_address']}")
-    
+    customer.add_run(texts['customer'])
+    customer.add_run(texts['customer_address'])
+
     document.add_paragraph()
-    
+
     # Таблица с товарами
     table = document.add_table(rows=1, cols=6)
     table.style = 'Table Grid'
-    
+
     # Заголовки таблицы
     hdr_cells = table.rows[0].cells
-    hdr_cells[0].text = '№'
-    hdr_cells[1].text = 'Наименование'
-    hdr_cells[2].text = 'Кол-во'
-    hdr_cells[3].text = 'Ед.'
-    hdr_cells[4].text = 'Цена'
-    hdr_cells[5].text = 'Сумма'
-    
+    for cell, text in zip(hdr_cells, TABLE_HEADER):
+        cell.text = text
+
     # Добавление товаров
-    total = 0
-    for i, item in enumerate(items, 1):
+    for row in rows:
         row_cells = table.add_row().cells
-        row_cells[0].text = str(i)
-        row_cells[1].text = item.description
-        row_cells[2].text = str(item.quantity)
-        row_cells[3].text = item.unit
-        row_cells[4].text = f"{item.price:.2f}"
-        sum_row = item.quantity * item.price
-        row_cells[5].text = f"{sum_row:.2f}"
-        total += sum_row
-    
+        for cell, text in zip(row_cells, row):
+            cell.text = text
+
     # Итого
-    total_row = table.add_row().cells
-    for i in range(4):
-        total_row[i].text = ''
-    total_row[4].text = 'Итого:'
-    total_row[5].text = f"{total:.2f}"
-    
+    for label, value in footer:
+        total_row = table.add_row().cells
+        for i in range(4):
+            total_row[i].text = ''
+        total_row[4].text = label
+        total_row[5].text = value
+
     document.add_paragraph()
-    
+
     # Подпись
     sign = document.add_paragraph()
-    sign.add_run(f"ИП {entrepreneur.company_name}").bold = True
+    sign.add_run(texts['signature']).bold = True
     sign.add_run(' ___________________________')
-    
 
+    return document
+
+
+def _slot(name):
+    return f'{_SLOT_OPEN}{name}{_SLOT_CLOSE}'
+
+
+def _compile_fragment(xml):
+    """Разбивает XML на статические куски и слоты вида (имя или номер ячейки, rPr)"""
+    pieces = []
+    position = 0
+    for match in _SLOT_RUN_RE.finditer(xml):
+        pieces.append(xml[position:match.start()])
+        name = match.group(2)
+        pieces.append((int(name) if name.isdigit() else name, match.group(1) or ''))
+        position = match.end()
+    pieces.append(xml[position:])
+    return pieces
+
+
+def _text_xml(text):
+    if _XML_INVALID_RE.search(text):
+        raise ValueError(
+            'All strings must be XML compatible: Unicode or ASCII, no NULL bytes or control characters'
+        )
+    if len(text.strip()) < len(text):
+        return f'<w:t xml:space="preserve">{escape(text)}</w:t>'
+    return f'<w:t>{escape(text)}</w:t>'
+
+
+def _run_xml(rpr, text):
+    """Сериализует run так же, как python-docx (w:tab, w:br, xml:space)"""
+    content = []
+    for chunk in _RUN_BREAK_RE.split(text):
+        if chunk == '\t':
+            content.append('<w:tab/>')
+        elif chunk in ('\r', '\n'):
+            content.append('<w:br/>')
+        elif chunk:
+            content.append(_text_xml(chunk))
+    if not rpr and not content:
+        return '<w:r/>'
+    return f"<w:r>{rpr}{''.join(content)}</w:r>"
+
+
+def _render_fragment(pieces, values, out):
+    for piece in pieces:
+        if isinstance(piece, str):
+            out.append(piece)
+        else:
+            name, rpr = piece
+            out.append(_run_xml(rpr, values[name]))
+
+
+def _package_member(name):
+    info = ZipInfo(name, date_time=_PACKAGE_DATE_TIME)
+    info.compress_type = ZIP_DEFLATED
+    return info
+
+
+class InvoiceRenderer:
+    """Рендерер счёта в одном формате.
+
+    Реализации пишут документ прямо в переданный поток (render_to); render()
+    возвращает BytesIO для совместимости с FileField.save.
+    """
+    format = None
+    extension = None
+
+    def render_to(self, out, texts, rows, footer):
+        """rows — тексты ячеек строк таблицы, footer — строки итогов [(подпись, сумма)]"""
+        raise NotImplementedError
+
+    def render(self, texts, rows, footer):
+        file_stream = BytesIO()
+        self.render_to(file_stream, texts, rows, footer)
+        file_stream.seek(0)
+        return file_stream
+
+
+class InvoiceTemplate(InvoiceRenderer):
+    """Скомпилированный шаблон счёта в DOCX.
+
+    Статическая часть пакета (стили, тема, настройки) собирается python-docx один
+    раз и хранится уже сжатой; при генерации заново пишется только word/document.xml.
+    """
+    format = 'docx'
+    extension = '.docx'
+
+    def __init__(self):
+        texts = {name: _slot(name) for name in _TEXT_SLOTS}
+        row = tuple(_slot(str(n)) for n in range(6))
+        footer = (_slot('label'), _slot('value'))
+        document = build_invoice_document(texts, [row], [footer])
+
+        xml = document.part.blob.decode('utf-8')
+        row_start = xml.rfind('<w:tr>', 0, xml.index(row[0]))
+        row_end = xml.index('</w:tr>', xml.index(row[-1])) + len('</w:tr>')
+        footer_end = xml.index('</w:tr>', xml.index(footer[-1])) + len('</w:tr>')
+        self._head = _compile_fragment(xml[:row_start])
+        self._row = _compile_fragment(xml[row_start:row_end])
+        self._footer = _compile_fragment(xml[row_end:footer_end])
+        self._tail = _compile_fragment(xml[footer_end:])
+
+        source = BytesIO()
+        document.save(source)
+        package = BytesIO()
+        with ZipFile(source) as src, ZipFile(package, 'w', compression=ZIP_DEFLATED) as dst:
+            for info in src.infolist():
+                if info.filename != DOCUMENT_PART:
+                    dst.writestr(_package_member(info.filename), src.read(info))
+        self._package = package.getvalue()
+
+    def iter_xml(self, texts, rows, footer):
+        """Отдаёт document.xml частями по _XML_ROWS_PER_WRITE строк таблицы"""
+        out = []
+        _render_fragment(self._head, texts, out)
+        for n, row in enumerate(rows, 1):
+            _render_fragment(self._row, row, out)
+            if n % _XML_ROWS_PER_WRITE == 0:
+                yield ''.join(out).encode('utf-8')
+                out.clear()
+        for label, value in footer:
+            _render_fragment(self._footer, {'label': label, 'value': value}, out)
+        _render_fragment(self._tail, texts, out)
+        yield ''.join(out).encode('utf-8')
+
+    def render_xml(self, texts, rows, footer):
+        return b''.join(self.iter_xml(texts, rows, footer))
+
+    def render_to(self, out, texts, rows, footer):
+        # Готовый пакет дописывается на месте, поэтому out должен поддерживать
+        # чтение и позиционирование (BytesIO, временный файл)
+        out.write(self._package)
+        with ZipFile(out, 'a', compression=ZIP_DEFLATED) as package:
+            with package.open(_package_member(DOCUMENT_PART), 'w') as part:
+                for chunk in self.iter_xml(texts, rows, footer):
+                    part.write(chunk)
+
+
+class _PdfLayout:
+    """Раскладка абзацев и таблицы по страницам PdfDocument сверху вниз"""
+
+    leading = 1.15
+    cell_padding = 4
+
+    def __init__(self, pdf, margin):
+        width, height = pdf.page_size
+        self.pdf = pdf
+        self.left = margin
+        self.width = width - 2 * margin
+        self.top = height - margin
+        self.bottom = margin
+        self.new_page()
+
+    def new_page(self):
+        self.pdf.new_page()
+        self.y = self.top
+
+    def wrap(self, runs, width, size):
+        """Разбивает [(текст, шрифт)] на строки не шире width: [[(текст, шрифт, x)]]"""
+        pdf = self.pdf
+        lines = [[]]
+        x = 0
+        for text, font in runs:
+            for word in re.findall(r'\S+\s*|\s+', text):
+                word_width = pdf.width(word.rstrip(), font, size)
+                if x and x + word_width > width:
+                    lines.append([])
+                    x = 0
+                    word = word.lstrip()
+                # Слово шире строки переносится по символам
+                while word_width > width and len(word) > 1:
+                    cut = len(word) - 1
+                    while cut > 1 and pdf.width(word[:cut], font, size) > width:
+                        cut -= 1
+                    lines[-1].append((word[:cut], font, x))
+                    lines.append([])
+                    x = 0
+                    word = word[cut:]
+                    word_width = pdf.width(word.rstrip(), font, size)
+                if word:
+                    line = lines[-1]
+                    if line and line[-1][1] == font:
+                        # Соседние слова одним шрифтом выводятся одной командой
+                        line[-1] = (line[-1][0] + word, font, line[-1][2])
+                    else:
+                        line.append((word, font, x))
+                    x += pdf.width(word, font, size)
+        return lines
+
+    def _line_width(self, line, size):
+        if not line:
+            return 0
+        text, font, x = line[-1]
+        return x + self.pdf.width(text.rstrip(), font, size)
+
+    def paragraph(self, runs=(), size=12, center=False):
+        height = size * self.leading
+        for line in self.wrap(runs, self.width, size) if runs else [[]]:
+            if self.y - height < self.bottom:
+                self.new_page()
+            offset = (self.width - self._line_width(line, size)) / 2 if center else 0
+            for text, font, x in line:
+                self.pdf.text(self.left + offset + x, self.y - size, text, font, size)
+            self.y -= height
+
+    def table_row(self, cells, widths, size, font='regular'):
+        """Рисует строку таблицы; возвращает False, если она не поместилась на страницу"""
+        padding = self.cell_padding
+        height = size * self.leading
+        cell_lines = [self.wrap([(text, font)], width - 2 * padding, size) for text, width in zip(cells, widths)]
+        row_height = max(len(lines) for lines in cell_lines) * height + 2 * padding
+        if self.y - row_height < self.bottom:
+            return False
+
+        pdf = self.pdf
+        bottom = self.y - row_height
+        x = self.left
+        borders = [(x, self.y, x, bottom)]
+        for lines, width in zip(cell_lines, widths):
+            for number, line in enumerate(lines):
+                for text, run_font, offset in line:
+                    pdf.text(x + padding + offset, self.y - padding - number * height - size, text, run_font, size)
+            x += width
+            borders.append((x, self.y, x, bottom))
+        borders.append((self.left, bottom, x, bottom))
+        pdf.lines(borders)
+        self.y = bottom
+        return True
+
+    def table(self, header, rows, widths, size):
+        """Таблица с сеткой; при переносе на новую страницу шапка повторяется"""
+        def start():
+            self.pdf.lines([(self.left, self.y, self.left + sum(widths), self.y)])
+            self.table_row(header, widths, size)
+
+        start()
+        for row in rows:
+            if not self.table_row(row, widths, size):
+                self.new_page()
+                start()
+                self.table_row(row, widths, size)
+
+
+class PdfInvoiceRenderer(InvoiceRenderer):
+    """Счёт в PDF с той же раскладкой, что и DOCX.
+
+    Шрифты (обычный и полужирный) берутся из INVOICE_PDF_FONTS; страницы
+    пишутся в поток по мере заполнения.
+    """
+    format = 'pdf'
+    extension = '.pdf'
+    margin = 56.7  # 2 см
+    font_size = 12
+    title_size = 14
+    # Ширины столбцов, пт; «Наименование» занимает остаток строки
+    column_widths = (40, None, 56, 40, 72, 80)
+
+    def __init__(self, fonts=None):
+        self.fonts = fonts or settings.INVOICE_PDF_FONTS
+        for path in self.fonts.values():
+            load_font(path)
+
+    def render_to(self, out, texts, rows, footer):
+        pdf = PdfDocument(out, self.fonts)
+        layout = _PdfLayout(pdf, self.margin)
+        size = self.font_size
+        widths = [width or layout.width - sum(filter(None, self.column_widths)) for width in self.column_widths]
+
+        layout.paragraph([(texts['title'], 'bold')], self.title_size, center=True)
+        layout.paragraph([(texts['date'], 'regular')], size)
+        layout.paragraph()
+        layout.paragraph([('Поставщик: ', 'bold'), (texts['supplier'], 'regular')], size)
+        layout.paragraph([
+            ('Банковские реквизиты: ', 'bold'), (texts['bank'], 'regular'), (texts['accounts'], 'regular'),
+        ], size)
+        layout.paragraph()
+        layout.paragraph([
+            ('Покупатель: ', 'bold'), (texts['customer'], 'regular'), (texts['customer_address'], 'regular'),
+        ], size)
+        layout.paragraph()
+        layout.table(TABLE_HEADER, _rows_with_footer(rows, footer), widths, size)
+        layout.paragraph()
+        layout.paragraph([(texts['signature'], 'bold'), (' ___________________________', 'regular')], size)
+        pdf.close()
+
+
+def _rows_with_footer(rows, footer):
+    yield from rows
+    for label, value in footer:
+        yield ('', '', '', '', label, value)
+
+
+RENDERERS = {
+    InvoiceTemplate.format: InvoiceTemplate,
+    PdfInvoiceRenderer.format: PdfInvoiceRenderer,
+}
+DOCUMENT_FORMAT_CHOICES = [('docx', 'Word (DOCX)'), ('pdf', 'PDF')]
+
+
+@lru_cache(maxsize=None)
+def get_renderer(document_format='docx'):
+    """Рендерер создаётся (и шаблон компилируется) один раз на процесс"""
+    try:
+        renderer_class = RENDERERS[document_format]
+    except KeyError:
+        raise ValueError(f'Неизвестный формат документа: {document_format}')
+    return renderer_class()
+
+
+def get_invoice_template():
+    return get_renderer('docx')
+
+
+def generate_invoice_docx(entrepreneur, bank_details, items, form_data):
+    """Генерация счёта напрямую через python-docx, без скомпилированного шаблона"""
+    rows, totals = invoice_rows(items)
+    document = build_invoice_document(
+        invoice_texts(entrepreneur, bank_details, form_data), rows, footer_rows(totals)
+    )
     file_stream = BytesIO()
     document.save(file_stream)
     file_stream.seek(0)
-    
-    return file_stream
\ No newline at end of file
+    return file_stream
+
+
+@timed('render')
+def generate_invoice(entrepreneur, bank_details, items, form_data, document_format='docx'):
+    rows, totals = invoice_rows(items)
+    return get_renderer(document_format).render(
+        invoice_texts(entrepreneur, bank_details, form_data), rows, footer_rows(totals)
+    )
+
+
+def render_invoices(entrepreneur, bank_details, invoices, document_format='docx'):
+    """Рендерит пачку счетов [(items, form_data), ...] и возвращает содержимое файлов.
+
+    Не обращается к БД и моделям, поэтому подходит для пула процессов.
+    """
+    return [
+        generate_invoice(entrepreneur, bank_details, items, form_data, document_format).getvalue()
+        for items, form_data in invoices
+    ]
+
+
+@timed('render')
+def stream_invoice(entrepreneur, bank_details, items, form_data, totals, document_format='docx'):
+    """Генерация счёта с любым числом строк при ограниченном расходе памяти.
+
+    Строки берутся из итератора items по одной (например, QuerySet.iterator()),
+    итоги totals передаются заранее (Invoice.get_totals()), чтобы не проходить по
+    строкам дважды. Документ пишется во временный файл, который после
+    INVOICE_SPOOL_MAX_SIZE байт переносится из памяти на диск. Возвращает File
+    для FileField.save; закрывать его должен вызывающий.
+    """
+    out = SpooledTemporaryFile(max_size=settings.INVOICE_SPOOL_MAX_SIZE)
+    try:
+        get_renderer(document_format).render_to(
+            out, invoice_texts(entrepreneur, bank_details, form_data), iter_invoice_rows(items), footer_rows(totals)
+        )
+    except BaseException:
+        out.close()
+        raise
+    out.seek(0)
+    return File(out)
@@ -2,7 +2,9 @@ from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
 from django.core.validators import RegexValidator
+from .accounts import save_new_user, users_by_email
 from .models import EntrepreneurProfile, InvoiceItem, BankDetails
+from .documents import DOCUMENT_FORMAT_CHOICES
 from django.contrib.auth.forms import AuthenticationForm
 from django.contrib.auth import authenticate
 
@@ -19,7 +21,7 @@ class CustomAuthenticationForm(AuthenticationForm):
         if username is not None and password:
             # Пробуем найти пользователя по email
             try:
-                user = User.objects.get(email=username)
+                user = users_by_email(username).get()
                 self.user_cache = authenticate(
                     self.request,
                     username=user.username,
@@ -124,34 +126,26 @@ class EntrepreneurRegistrationForm(UserCreationForm):
     
     def clean_email(self):
         email = self.cleaned_data['email']
-        if User.objects.filter(email=email).exists():
+        if users_by_email(email).exists():
             raise forms.ValidationError('Пользователь с таким email уже зарегистрирован')
         return email
     
     def generate_username(self):
-        """Генерирует уникальное имя пользователя на основе ИНН"""
+        """Имя пользователя на основе ИНН; при занятости save() добавит суффикс"""
         inn = self.cleaned_data.get('inn', 'user')
-        base_username = f"ip_{inn}"
-        username = base_username
-        counter = 1
-        
-        while User.objects.filter(username=username).exists():
-            username = f"{base_username}_{counter}"
-            counter += 1
-            
-        return username
+        return f"ip_{inn}"
     
     def save(self, commit=True):
     # Создаем пользователя, но не сохраняем в БД пока
         user = super().save(commit=False)
         
-        # Генерируем уникальное имя пользователя
+        # Генерируем имя пользователя
         user.username = self.generate_username()
         user.email = self.cleaned_data['email']
         
         if commit:
-            # Сохраняем пользователя
-            user.save()
+            # Сохраняем пользователя; занятое имя получит суффикс
+            save_new_user(user, user.username)
             
             # Для форм, унаследованных от UserCreationForm
             if hasattr(self, 'save_m2m'):
@@ -213,4 +207,56 @@ class InvoiceGenerationForm(forms.Form):
     )
     payment_due_date = forms.DateField(
         label='Срок оплаты',
-        widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}))
\ No newline at end of file
+        widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}))
+
+class DocumentFormatForm(forms.Form):
+    document_format = forms.ChoiceField(
+        label='Формат документа',
+        choices=DOCUMENT_FORMAT_CHOICES,
+        initial='docx',
+        required=False,
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+
+class BatchInvoiceForm(forms.Form):
+    file = forms.FileField(label='Файл со счетами (CSV или JSON)')
+    format = forms.ChoiceField(
+        label='Формат',
+        choices=[('', 'По расширению файла'), ('csv', 'CSV'), ('json', 'JSON')],
+        required=False
+    )
+    document_format = forms.ChoiceField(
+        label='Формат документов',
+        choices=DOCUMENT_FORMAT_CHOICES,
+        required=False
+    )
+
+
+class DocumentIdsField(forms.Field):
+    widget = forms.MultipleHiddenInput
+    
+    def to_python(self, value):
+        try:
+            return [int(pk) for pk in value or []]
+        except (TypeError, ValueError):
+            raise forms.ValidationError('Некорректный список документов')
+
+
+class DocumentArchiveForm(forms.Form):
+    ids = DocumentIdsField(required=False)
+    date_from = forms.DateField(
+        label='С',
+        required=False,
+        widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'})
+    )
+    date_to = forms.DateField(
+        label='По',
+        required=False,
+        widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'})
+    )
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        if not cleaned_data.get('ids') and not (cleaned_data.get('date_from') or cleaned_data.get('date_to')):
+            raise forms.ValidationError('Выберите документы или укажите период')
+        return cleaned_data
\ No newline at end of file
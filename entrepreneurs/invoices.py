@@ -0,0 +1,231 @@
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .customers import remember_customers
+from .database import retry_on_locked
+from .models import GeneratedDocument, Invoice, InvoiceLine, InvoiceNumberSequence, SpareInvoiceNumber
+from .search import index_invoices
+from .totals import compute_totals
+
+LINE_FIELDS = ('description', 'quantity', 'unit', 'price', 'vat_rate')
+# Меняется вместе с форматом документа, чтобы старые ключи перестали совпадать
+CONTENT_KEY_VERSION = 1
+
+
+def allocate_invoice_numbers(entrepreneur, year, count=1):
+    """Выделяет count номеров счетов за год и возвращает их по возрастанию.
+
+    entrepreneur — профиль предпринимателя или его id.
+
+    Сначала выдаются свободные номера SpareInvoiceNumber (оставшиеся от
+    неудавшихся пачек), остальные — из счётчика. Счётчик увеличивается одним
+    атомарным UPDATE, который блокирует строку счётчика до конца транзакции,
+    поэтому параллельные вызовы не получат одинаковых номеров. Вызывать нужно
+    внутри транзакции, сохраняющей пронумерованные записи: при её откате
+    откатится и счётчик, и пропусков в нумерации не будет. Пакетная генерация,
+    которой номера нужны до сохранения, резервирует их через number_batch.
+    """
+    entrepreneur_id = getattr(entrepreneur, 'pk', entrepreneur)
+    sequences = InvoiceNumberSequence.objects.filter(entrepreneur_id=entrepreneur_id, year=year)
+    with transaction.atomic():
+        # UPDATE идёт первым, чтобы транзакция сразу захватила блокировку на запись;
+        # номера, взятые из свободных, затем возвращаются в счётчик
+        if not sequences.update(last_number=F('last_number') + count):
+            try:
+                with transaction.atomic():
+                    InvoiceNumberSequence.objects.create(entrepreneur_id=entrepreneur_id, year=year, last_number=count)
+            except IntegrityError:
+                # Счётчик только что создан параллельной транзакцией
+                sequences.update(last_number=F('last_number') + count)
+
+        spare = list(
+            SpareInvoiceNumber.objects.filter(entrepreneur_id=entrepreneur_id, year=year)
+            .filter(Q(leased_until__isnull=True) | Q(leased_until__lt=timezone.now()))
+            .order_by('number').values_list('pk', 'number')[:count]
+        )
+        if spare:
+            # Порциями, чтобы не упереться в лимит параметров запроса SQLite
+            for start in range(0, len(spare), 500):
+                SpareInvoiceNumber.objects.filter(pk__in=[pk for pk, _ in spare[start:start + 500]]).delete()
+            sequences.update(last_number=F('last_number') - len(spare))
+        last_number = sequences.values_list('last_number', flat=True).get()
+
+    fresh = count - len(spare)
+    return [number for _, number in spare] + list(range(last_number - fresh + 1, last_number + 1))
+
+
+def invoice_content_key(entrepreneur, bank_details, form_data, items, document_format='docx'):
+    """Ключ идемпотентности счёта: sha256 от формата и всех исходных данных, кроме номера.
+
+    Суммы приводятся к двум знакам, поэтому строки из БД и cleaned_data форм
+    с одинаковыми значениями дают одинаковый ключ.
+    """
+    def line(item):
+        if isinstance(item, dict):
+            item = InvoiceLine(**{field: item[field] for field in LINE_FIELDS})
+        return [item.description, f'{item.quantity:.2f}', item.unit, f'{item.price:.2f}', f'{item.vat_rate:.2f}']
+
+    data = [
+        CONTENT_KEY_VERSION,
+        document_format,
+        [entrepreneur.pk, entrepreneur.company_name, entrepreneur.inn, entrepreneur.ogrnip],
+        [bank_details.bank_name, bank_details.bik, bank_details.correspondent_account, bank_details.payment_account],
+        [
+            form_data['customer_name'],
+            form_data['customer_address'],
+            form_data['customer_inn'],
+            form_data['date'].isoformat(),
+            form_data['payment_due_date'].isoformat(),
+        ],
+        [line(item) for item in items],
+    ]
+    return hashlib.sha256(json.dumps(data, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def find_documents(entrepreneur, content_keys):
+    """Возвращает {ключ: id документа} для сформированных или формирующихся документов"""
+    content_keys = list(content_keys)
+    found = {}
+    # Порциями, чтобы не упереться в лимит параметров запроса SQLite
+    for start in range(0, len(content_keys), 500):
+        found.update(
+            GeneratedDocument.objects.filter(
+                entrepreneur=entrepreneur,
+                content_key__in=content_keys[start:start + 500],
+            ).exclude(status=GeneratedDocument.STATUS_FAILED).values_list('content_key', 'pk')
+        )
+    return found
+
+
+def number_invoice(invoice):
+    """Присваивает черновику очередной номер (внутри транзакции генерации)"""
+    invoice.number_year = invoice.date.year
+    invoice.number = allocate_invoice_numbers(invoice.entrepreneur_id, invoice.number_year)[0]
+
+
+def build_invoice_lines(items):
+    """Строки счёта из cleaned_data форм позиций (словари или объекты с атрибутами).
+
+    Возвращает (строки, итоги); суммы строк считает compute_totals.
+    """
+    lines = []
+    for position, item in enumerate(items, 1):
+        if isinstance(item, dict):
+            values = {field: item[field] for field in LINE_FIELDS}
+        else:
+            values = {field: getattr(item, field) for field in LINE_FIELDS}
+        lines.append(InvoiceLine(position=position, **values))
+    totals = compute_totals(lines)
+    for line, amount in zip(lines, totals.amounts):
+        line.amount = amount
+    return lines, totals
+
+
+def apply_totals(invoice, totals):
+    invoice.net_total = totals.net
+    invoice.vat_total = totals.vat
+    invoice.total = totals.gross
+
+
+@retry_on_locked
+def save_invoice_draft(entrepreneur, form_data, items, invoice=None):
+    """Создаёт или перезаписывает черновик счёта вместе со строками в одной транзакции"""
+    lines, totals = build_invoice_lines(items)
+
+    with transaction.atomic():
+        if invoice is None:
+            invoice = Invoice(entrepreneur=entrepreneur)
+        for field, value in form_data.items():
+            setattr(invoice, field, value)
+        apply_totals(invoice, totals)
+        invoice.save()
+
+        invoice.lines.all().delete()
+        for line in lines:
+            line.invoice = invoice
+        InvoiceLine.objects.bulk_create(lines)
+
+    return invoice
+
+
+def number_batch(entrepreneur, invoices, holder):
+    """Проставляет номера в form_data пачки счетов и резервирует их за пачкой holder.
+
+    Вызывается в короткой транзакции до рендера: номера попадают в файлы,
+    а транзакция, сохраняющая счета, снимает резерв (confirm_batch_numbers).
+    Резерв держится INVOICE_NUMBER_LEASE_TIMEOUT секунд; если пачка не
+    сохранилась — release_batch_numbers или, после падения процесса,
+    истечение резерва — номера выдаются следующим счетам, и пропусков нет.
+    """
+    leased_until = timezone.now() + timedelta(seconds=settings.INVOICE_NUMBER_LEASE_TIMEOUT)
+    by_year = {}
+    for items, form_data in invoices:
+        by_year.setdefault(form_data['date'].year, []).append(form_data)
+    reserved = []
+    with transaction.atomic():
+        for year, forms_data in by_year.items():
+            numbers = allocate_invoice_numbers(entrepreneur, year, len(forms_data))
+            for form_data, number in zip(forms_data, numbers):
+                form_data['number'] = number
+                reserved.append(SpareInvoiceNumber(
+                    entrepreneur_id=entrepreneur.pk,
+                    year=year,
+                    number=number,
+                    holder=holder,
+                    leased_until=leased_until,
+                ))
+        SpareInvoiceNumber.objects.bulk_create(reserved)
+
+
+def confirm_batch_numbers(holder, count):
+    """Снимает резерв пачки в транзакции, сохраняющей её счета.
+
+    Возвращает False, если резерв истёк и часть номеров уже выдана другим
+    счетам: тогда сохранять пачку нельзя.
+    """
+    deleted, _ = SpareInvoiceNumber.objects.filter(holder=holder).delete()
+    return deleted == count
+
+
+def release_batch_numbers(holder):
+    """Освобождает номера несохранившейся пачки: их получат следующие счета"""
+    SpareInvoiceNumber.objects.filter(holder=holder).update(holder='', leased_until=None)
+
+
+def create_invoices(entrepreneur, invoices, documents):
+    """Сохраняет счета пакетной генерации: [(items, form_data)] и документы к ним.
+
+    Номера должны быть уже проставлены number_batch. Счета, все их строки и
+    тексты для поиска вставляются тремя bulk_create.
+    """
+    records = []
+    all_lines = []
+    for (items, form_data), document in zip(invoices, documents):
+        lines, totals = build_invoice_lines(items)
+        invoice = Invoice(
+            entrepreneur=entrepreneur,
+            document=document,
+            number_year=form_data['date'].year,
+            **form_data
+        )
+        apply_totals(invoice, totals)
+        records.append((invoice, lines))
+
+    with transaction.atomic():
+        created = Invoice.objects.bulk_create([invoice for invoice, _ in records])
+        for invoice, (_, lines) in zip(created, records):
+            for line in lines:
+                line.invoice = invoice
+            all_lines.extend(lines)
+        InvoiceLine.objects.bulk_create(all_lines, batch_size=1000)
+        remember_customers(entrepreneur.pk, [form_data for _, form_data in invoices])
+        index_invoices(
+            (invoice, [line.description for line in lines]) for invoice, (_, lines) in zip(created, records)
+        )
+    return created
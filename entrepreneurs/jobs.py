@@ -0,0 +1,196 @@
+import os
+import socket
+import time
+import traceback
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .customers import remember_customers
+from .database import retry_on_locked
+from .documents import RENDERERS, stream_invoice
+from .invoices import find_documents, invoice_content_key, number_invoice
+from .models import BankDetails, DocumentJob, GeneratedDocument, Invoice
+from .search import index_invoices
+
+
+@retry_on_locked
+def enqueue_invoice(invoice, document_format='docx'):
+    """Создаёт документ в статусе «формируется» и задание на генерацию счёта в document_format.
+
+    Возвращает (документ, created). Если такой же счёт уже сформирован или
+    формируется, рендер не запускается: возвращается существующий документ
+    и created=False, а черновик остаётся черновиком — сообщить пользователю,
+    что документ уже есть, должен вызывающий.
+    """
+    entrepreneur = invoice.entrepreneur
+    content_key = invoice_content_key(
+        entrepreneur, entrepreneur.bank_details, invoice.form_data, invoice.lines.all(), document_format
+    )
+    existing = find_documents(entrepreneur, [content_key])
+    if existing:
+        return GeneratedDocument.objects.get(pk=existing[content_key]), False
+
+    try:
+        with transaction.atomic():
+            document = GeneratedDocument.objects.create(
+                entrepreneur_id=invoice.entrepreneur_id,
+                document_type='Счёт на оплату',
+                status=GeneratedDocument.STATUS_PENDING,
+                content_key=content_key,
+            )
+            invoice.document = document
+            number_invoice(invoice)
+            invoice.save(update_fields=['document', 'number', 'number_year', 'updated_at'])
+            remember_customers(invoice.entrepreneur_id, [invoice.form_data])
+            index_invoices([(invoice, invoice.lines.values_list('description', flat=True))])
+            job = DocumentJob.objects.create(
+                document=document,
+                payload={'invoice_id': invoice.pk, 'format': document_format},
+                run_after=timezone.now(),
+            )
+    except IntegrityError:
+        # Параллельный запрос успел создать документ с тем же ключом
+        existing = find_documents(entrepreneur, [content_key])
+        if not existing:
+            raise
+        # Транзакция откатилась: черновик остаётся без документа и номера
+        invoice.document = None
+        invoice.number = invoice.number_year = None
+        return GeneratedDocument.objects.get(pk=existing[content_key]), False
+
+    if settings.DOCUMENT_JOBS_EAGER:
+        run_job(job)
+        document.refresh_from_db()
+    return document, True
+
+
+@retry_on_locked
+def claim_job(worker_id):
+    """Забирает ближайшее готовое к выполнению задание.
+
+    Захват делается условным UPDATE по прежнему значению locked_at, поэтому
+    одно задание не достанется двум обработчикам ни в SQLite, ни в PostgreSQL.
+    Зависшие задания (locked_at старше DOCUMENT_JOB_LOCK_TIMEOUT) забираются повторно.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.DOCUMENT_JOB_LOCK_TIMEOUT)
+    candidates = DocumentJob.objects.filter(
+        Q(locked_at__isnull=True) | Q(locked_at__lt=stale),
+        run_after__lte=now,
+        attempts__lt=settings.DOCUMENT_JOB_MAX_ATTEMPTS,
+    ).values_list('pk', 'locked_at')[:10]
+
+    for pk, locked_at in candidates:
+        claimed = DocumentJob.objects.filter(pk=pk, locked_at=locked_at).update(
+            locked_at=now,
+            locked_by=worker_id,
+            attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return DocumentJob.objects.select_related('document__entrepreneur').get(pk=pk)
+    return None
+
+
+@retry_on_locked
+def fail_abandoned_jobs():
+    """Помечает ошибкой документы заданий, обработчик которых пропал на последней попытке.
+
+    claim_job такие задания уже не заберёт, и _retry_or_fail для них не
+    выполнится, поэтому без этой проверки документ остался бы «формируется»
+    навсегда. Возвращает число таких заданий.
+    """
+    stale = timezone.now() - timedelta(seconds=settings.DOCUMENT_JOB_LOCK_TIMEOUT)
+    abandoned = DocumentJob.objects.filter(
+        locked_at__lt=stale,
+        attempts__gte=settings.DOCUMENT_JOB_MAX_ATTEMPTS,
+    )
+    # Сначала только чтение, чтобы пустая проверка не брала блокировку на запись
+    document_ids = list(abandoned.values_list('document_id', flat=True))
+    if not document_ids:
+        return 0
+    with transaction.atomic():
+        GeneratedDocument.objects.filter(pk__in=document_ids).update(status=GeneratedDocument.STATUS_FAILED)
+        return abandoned.filter(document_id__in=document_ids).update(
+            locked_at=None,
+            locked_by='',
+            last_error='Обработчик не завершил последнюю попытку',
+        )
+
+
+def run_job(job):
+    document = job.document
+    try:
+        entrepreneur = document.entrepreneur
+        bank_details = BankDetails.objects.get(entrepreneur=entrepreneur)
+        invoice = Invoice.objects.get(pk=job.payload['invoice_id'])
+        document_format = job.payload.get('format', 'docx')
+        # Строки читаются из БД порциями и сразу пишутся в документ, поэтому
+        # память не зависит от числа позиций в счёте
+        lines = invoice.lines.iterator(chunk_size=settings.INVOICE_LINES_CHUNK_SIZE)
+        with stream_invoice(
+            entrepreneur, bank_details, lines, invoice.form_data, invoice.get_totals(), document_format
+        ) as file_stream:
+            document.status = GeneratedDocument.STATUS_READY
+            extension = RENDERERS[document_format].extension
+            document.filename = f'Счет_{entrepreneur.inn}_{datetime.now().strftime("%Y%m%d%H%M%S")}{extension}'
+            document.file.save(document.filename, file_stream, save=False)
+        # Файл уже в хранилище, повторяется только запись строки
+        retry_on_locked(document.save)()
+    except Exception:
+        _retry_or_fail(job, traceback.format_exc())
+        return False
+
+    job.delete()
+    return True
+
+
+@retry_on_locked
+def _retry_or_fail(job, error):
+    job.refresh_from_db(fields=['attempts'])
+    if job.attempts >= settings.DOCUMENT_JOB_MAX_ATTEMPTS:
+        GeneratedDocument.objects.filter(pk=job.document_id).update(status=GeneratedDocument.STATUS_FAILED)
+        run_after = job.run_after
+    else:
+        # Экспоненциальная задержка: 1x, 2x, 4x ... от DOCUMENT_JOB_RETRY_BACKOFF
+        delay = settings.DOCUMENT_JOB_RETRY_BACKOFF * 2 ** (job.attempts - 1)
+        run_after = timezone.now() + timedelta(seconds=delay)
+
+    DocumentJob.objects.filter(pk=job.pk).update(
+        locked_at=None,
+        locked_by='',
+        last_error=error,
+        run_after=run_after,
+    )
+
+
+def default_worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def work(worker_id=None, poll_interval=None, once=False):
+    """Цикл обработчика: берёт задания, пока не остановят.
+
+    С once=True выходит, как только очередь опустела. Когда заданий нет,
+    завершает ошибкой брошенные на последней попытке (fail_abandoned_jobs).
+    Возвращает число обработанных заданий.
+    """
+    worker_id = worker_id or default_worker_id()
+    if poll_interval is None:
+        poll_interval = settings.DOCUMENT_WORKER_POLL_INTERVAL
+
+    processed = 0
+    while True:
+        close_old_connections()
+        job = claim_job(worker_id)
+        if job is None:
+            fail_abandoned_jobs()
+            if once:
+                return processed
+            time.sleep(poll_interval)
+            continue
+        run_job(job)
+        processed += 1
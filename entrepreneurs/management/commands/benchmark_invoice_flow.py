@@ -0,0 +1,118 @@
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from entrepreneurs.models import BankDetails, EntrepreneurProfile
+
+SESSION_ENGINES = (
+    ('БД', 'django.contrib.sessions.backends.db'),
+    ('кеш + БД', 'entrepreneurs.sessions'),
+)
+
+# Номера для служебных пользователей замера, чтобы не пересекаться с настоящими ИНН
+_INN_BASE = 990000000000
+
+
+def _flow_data():
+    data = {
+        'customer_name': 'ООО «Ромашка»',
+        'customer_address': 'г. Москва',
+        'customer_inn': '7701234567',
+        'date': '2025-06-01',
+        'payment_due_date': '2025-06-15',
+        'form-TOTAL_FORMS': '5',
+        'form-INITIAL_FORMS': '0',
+        'form-MIN_NUM_FORMS': '0',
+        'form-MAX_NUM_FORMS': '1000',
+    }
+    for n in range(5):
+        data.update({
+            f'form-{n}-description': f'Товар {n}',
+            f'form-{n}-quantity': '2',
+            f'form-{n}-unit': 'шт',
+            f'form-{n}-price': '100.50',
+            f'form-{n}-vat_rate': '20',
+        })
+    return data
+
+
+class Command(BaseCommand):
+    help = 'Замер запросов в секунду на сценарии «создание счёта → предпросмотр» для разных хранилищ сессий'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=8, help='Одновременных пользователей')
+        parser.add_argument('--flows', type=int, default=20, help='Сценариев на пользователя')
+
+    def handle(self, *args, **options):
+        users = self.create_users(options['users'])
+        try:
+            for name, engine in SESSION_ENGINES:
+                with override_settings(SESSION_ENGINE=engine):
+                    requests, elapsed, errors = self.run(users, options['flows'])
+                self.stdout.write(
+                    f'{name:<10} | {options["users"]:>3} польз. | {requests / elapsed:8.1f} запросов/с '
+                    f'| ошибок: {errors}'
+                )
+        finally:
+            User.objects.filter(pk__in=[user.pk for user in users]).delete()
+
+    def create_users(self, count):
+        users = []
+        for n in range(count):
+            user = User.objects.create_user(f'bench_flow_{n}', password=None)
+            entrepreneur = EntrepreneurProfile.objects.create(
+                user=user,
+                company_name=f'Замер {n}',
+                inn=str(_INN_BASE + n),
+                ogrnip=str(_INN_BASE * 1000 + n),
+                phone='+7 (900) 000-00-00',
+            )
+            BankDetails.objects.create(
+                entrepreneur=entrepreneur,
+                bank_name='ПАО Сбербанк',
+                bik='044525225',
+                correspondent_account='30101810400000000225',
+                payment_account='40802810900000000001',
+            )
+            users.append(user)
+        return users
+
+    def run(self, users, flows):
+        """Каждый пользователь в своём потоке проходит сценарий flows раз"""
+        data = _flow_data()
+        create_url = reverse('entrepreneurs:create_invoice')
+        counters = {'requests': 0, 'errors': 0}
+        lock = threading.Lock()
+        start = threading.Barrier(len(users) + 1)
+
+        def user_flow(user):
+            client = Client(SERVER_NAME='localhost')
+            client.force_login(user)
+            requests = errors = 0
+            start.wait()
+            try:
+                for _ in range(flows):
+                    responses = [client.get(create_url), client.post(create_url, data)]
+                    if responses[-1].status_code == 302:
+                        responses.append(client.get(responses[-1].url))
+                    requests += len(responses)
+                    errors += sum(response.status_code >= 400 for response in responses)
+            finally:
+                connection.close()
+            with lock:
+                counters['requests'] += requests
+                counters['errors'] += errors
+
+        threads = [threading.Thread(target=user_flow, args=(user,)) for user in users]
+        for thread in threads:
+            thread.start()
+        start.wait()
+        started = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        return counters['requests'], time.perf_counter() - started, counters['errors']
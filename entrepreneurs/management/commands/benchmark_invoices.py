@@ -0,0 +1,36 @@
+import time
+from functools import partial
+
+from django.core.management.base import BaseCommand
+
+from entrepreneurs.benchmarks import sample_invoice
+from entrepreneurs.documents import RENDERERS, generate_invoice, generate_invoice_docx, get_renderer
+
+
+class Command(BaseCommand):
+    help = 'Замер скорости и размера счетов: python-docx, скомпилированный шаблон DOCX и PDF'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, nargs='+', default=[10, 100, 1000])
+        parser.add_argument('--iterations', type=int, default=20)
+
+    def handle(self, *args, **options):
+        generators = (
+            ('python-docx', generate_invoice_docx),
+            ('шаблон DOCX', partial(generate_invoice, document_format='docx')),
+            ('PDF', partial(generate_invoice, document_format='pdf')),
+        )
+        for document_format in RENDERERS:
+            get_renderer(document_format)
+
+        for items_count in options['items']:
+            invoice = sample_invoice(items_count)
+            for name, generator in generators:
+                started = time.perf_counter()
+                for _ in range(options['iterations']):
+                    size = len(generator(*invoice).getvalue())
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f'{items_count:>6} поз. | {name:<12} | {options["iterations"] / elapsed:10.1f} счетов/с '
+                    f'| {size / 1024:8.1f} КБ'
+                )
@@ -0,0 +1,218 @@
+import argparse
+import asyncio
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from wsgiref.util import setup_testing_defaults
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+
+from entrepreneurs.benchmarks import sample_invoice
+from entrepreneurs.documents import generate_invoice
+from entrepreneurs.models import BankDetails, EntrepreneurProfile, GeneratedDocument
+
+SERVERS = (
+    ('WSGI, синхронные представления', 'wsgi'),
+    ('ASGI, асинхронные представления', 'asgi'),
+)
+
+_INN = '970000000000'
+
+
+class InFlight:
+    """Счётчик одновременно отдаваемых ответов и его максимум"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.current = self.peak = 0
+
+    def started(self):
+        with self._lock:
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+
+    def finished(self):
+        with self._lock:
+            self.current -= 1
+
+
+class Command(BaseCommand):
+    help = (
+        'Замер одновременных медленных скачиваний документа одним процессом: '
+        'WSGI с пулом потоков против ASGI с асинхронными представлениями'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=100, help='Одновременных клиентов')
+        parser.add_argument('--bandwidth', type=float, default=32, help='Скорость клиента, КБ/с')
+        parser.add_argument(
+            '--wsgi-threads', type=int, default=8, help='Потоков WSGI-процесса (как gunicorn --threads)'
+        )
+        # Служебные параметры дочернего процесса, который и обслуживает запросы
+        parser.add_argument('--serve', choices=[server for _, server in SERVERS], help=argparse.SUPPRESS)
+        parser.add_argument('--path', help=argparse.SUPPRESS)
+        parser.add_argument('--cookie', help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options['serve']:
+            self.serve(options)
+            return
+
+        user, path, cookie = self.create_document()
+        try:
+            for name, server in SERVERS:
+                result = self.run_server(server, path, cookie, options)
+                self.stdout.write(
+                    f'{name:<32} | {result["downloads"] / result["elapsed"]:7.1f} скачиваний/с '
+                    f'| одновременно до {result["peak"]:>4} '
+                    f'| p50 {result["p50"]:6.2f} с, max {result["max"]:6.2f} с | ошибок: {result["errors"]}'
+                )
+        finally:
+            user.delete()
+
+    def create_document(self):
+        user = User.objects.create_user('bench_slow_downloads', password=None)
+        entrepreneur = EntrepreneurProfile.objects.create(
+            user=user,
+            company_name='Замер скачиваний',
+            inn=_INN,
+            ogrnip=_INN + '000',
+            phone='+7 (900) 000-00-00',
+        )
+        BankDetails.objects.create(
+            entrepreneur=entrepreneur,
+            bank_name='ПАО Сбербанк',
+            bik='044525225',
+            correspondent_account='30101810400000000225',
+            payment_account='40802810900000000001',
+        )
+        document = GeneratedDocument(entrepreneur=entrepreneur, document_type='Счёт на оплату', filename='счёт.pdf')
+        content = generate_invoice(*sample_invoice(500), document_format='pdf').getvalue()
+        document.file.save('счёт.pdf', ContentFile(content))
+
+        client = Client()
+        client.force_login(user)
+        cookie = f'{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}'
+        return user, reverse('entrepreneurs:download_document', args=[document.pk]), cookie
+
+    def run_server(self, server, path, cookie, options):
+        """Запускает замер в отдельном процессе: ASYNC_VIEWS читается при импорте URL"""
+        env = dict(os.environ, ASYNC_VIEWS='1' if server == 'asgi' else '0')
+        command = [
+            sys.executable, '-m', 'django', 'benchmark_slow_downloads', '--serve', server,
+            '--path', path, '--cookie', cookie, '--clients', str(options['clients']),
+            '--bandwidth', str(options['bandwidth']), '--wsgi-threads', str(options['wsgi_threads']),
+        ]
+        completed = subprocess.run(
+            command, env=env, cwd=settings.BASE_DIR, capture_output=True, text=True, check=False
+        )
+        if completed.returncode:
+            raise CommandError(completed.stderr)
+        return json.loads(completed.stdout)
+
+    def serve(self, options):
+        bytes_per_second = options['bandwidth'] * 1024
+        in_flight = InFlight()
+        if options['serve'] == 'wsgi':
+            results, elapsed = self.serve_wsgi(options, bytes_per_second, in_flight)
+        else:
+            results, elapsed = asyncio.run(self.serve_asgi(options, bytes_per_second, in_flight))
+        connection.close()
+
+        timings = [elapsed for status, elapsed in results if status == 200]
+        self.stdout.write(json.dumps({
+            'downloads': len(timings),
+            'errors': len(results) - len(timings),
+            'elapsed': elapsed,
+            'peak': in_flight.peak,
+            'p50': statistics.median(timings) if timings else 0.0,
+            'max': max(timings, default=0.0),
+        }))
+
+    def serve_wsgi(self, options, bytes_per_second, in_flight):
+        """Каждое скачивание занимает поток WSGI-процесса, пока клиент не примет файл целиком"""
+        handler = WSGIHandler()
+        # Клиенты приходят одновременно: время скачивания включает ожидание свободного потока
+        started = time.perf_counter()
+
+        def download(_):
+            environ = {
+                'PATH_INFO': options['path'],
+                'HTTP_HOST': 'localhost',
+                'HTTP_COOKIE': options['cookie'],
+                'wsgi.input': io.BytesIO(),
+            }
+            setup_testing_defaults(environ)
+            status = []
+            body = handler(environ, lambda code, headers, exc_info=None: status.append(int(code.split()[0])))
+            in_flight.started()
+            try:
+                for chunk in body:
+                    time.sleep(len(chunk) / bytes_per_second)
+            finally:
+                in_flight.finished()
+                body.close()
+            return status[0], time.perf_counter() - started
+
+        with ThreadPoolExecutor(options['wsgi_threads']) as pool:
+            results = list(pool.map(download, range(options['clients'])))
+        return results, time.perf_counter() - started
+
+    async def serve_asgi(self, options, bytes_per_second, in_flight):
+        """Все скачивания идут в одном цикле событий; медленный клиент — это медленный send"""
+        application = ASGIHandler()
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': 'GET',
+            'scheme': 'http',
+            'path': options['path'],
+            'raw_path': options['path'].encode(),
+            'query_string': b'',
+            'root_path': '',
+            'headers': [(b'host', b'localhost'), (b'cookie', options['cookie'].encode())],
+            'client': ('127.0.0.1', 0),
+            'server': ('localhost', 80),
+        }
+        started = time.perf_counter()
+
+        async def download():
+            request_sent = asyncio.Event()
+            status = []
+
+            async def receive():
+                if not request_sent.is_set():
+                    request_sent.set()
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                # Клиент не отключается: ждём, пока сервер не отменит ожидание
+                await asyncio.Future()
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    status.append(message['status'])
+                    in_flight.started()
+                elif message['type'] == 'http.response.body':
+                    await asyncio.sleep(len(message.get('body', b'')) / bytes_per_second)
+                    if not message.get('more_body'):
+                        in_flight.finished()
+
+            await application(dict(scope), receive, send)
+            return status[0], time.perf_counter() - started
+
+        results = await asyncio.gather(*(download() for _ in range(options['clients'])))
+        return results, time.perf_counter() - started
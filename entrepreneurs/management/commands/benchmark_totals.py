@@ -0,0 +1,69 @@
+import random
+import time
+from decimal import Decimal
+from fractions import Fraction
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand
+
+from entrepreneurs.totals import compute_totals
+
+VAT_RATES = (Decimal('0'), Decimal('10'), Decimal('20'))
+
+
+def sample_items(items_count, seed=0):
+    """Позиции со случайными количествами, ценами и ставками НДС"""
+    rnd = random.Random(seed)
+    return [
+        SimpleNamespace(
+            quantity=Decimal(rnd.randint(1, 100000)) / 1000,
+            price=Decimal(rnd.randint(-100000, 10000000)) / 100,
+            vat_rate=rnd.choice(VAT_RATES),
+        )
+        for _ in range(items_count)
+    ]
+
+
+def _round_kopecks(value):
+    # Округление до копейки половиной от нуля на точных дробях
+    kopecks = abs(value) * 100
+    rounded = int(kopecks) + (kopecks - int(kopecks) >= Fraction(1, 2))
+    return Decimal(rounded if value >= 0 else -rounded) / 100
+
+
+def reference_totals(items):
+    """Эталон для проверки compute_totals: прямой цикл на Fraction.
+
+    Возвращает (суммы строк, итого без НДС, {ставка: НДС}, всего к оплате).
+    """
+    amounts = []
+    net_by_rate = {}
+    for item in items:
+        amount = _round_kopecks(Fraction(item.quantity) * Fraction(item.price))
+        amounts.append(amount)
+        net_by_rate[item.vat_rate] = net_by_rate.get(item.vat_rate, 0) + amount
+    vat_by_rate = {
+        rate: _round_kopecks(Fraction(net) * Fraction(rate) / 100) for rate, net in net_by_rate.items()
+    }
+    net = sum(amounts, Decimal(0))
+    return amounts, net, vat_by_rate, net + sum(vat_by_rate.values(), Decimal(0))
+
+
+class Command(BaseCommand):
+    help = 'Замер скорости расчёта итогов счёта в сравнении с эталонным циклом'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, nargs='+', default=[1000, 100000, 1000000])
+
+    def handle(self, *args, **options):
+        for items_count in options['items']:
+            items = sample_items(items_count)
+            timings = []
+            for calculate in (compute_totals, reference_totals):
+                started = time.perf_counter()
+                calculate(items)
+                timings.append(time.perf_counter() - started)
+            self.stdout.write(
+                f'{items_count:>8} поз. | итоги {timings[0]:8.3f} с | эталон {timings[1]:8.3f} с '
+                f'| {items_count / timings[0]:12.0f} поз./с'
+            )
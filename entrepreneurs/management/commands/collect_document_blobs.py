@@ -0,0 +1,46 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from entrepreneurs.models import GeneratedDocument
+from entrepreneurs.storage import document_storage
+
+
+class Command(BaseCommand):
+    help = 'Удаляет из хранилища документов файлы, на которые не ссылается ни один документ'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace-hours', type=float, default=settings.DOCUMENT_BLOB_GRACE_HOURS,
+            help='Не трогать файлы моложе указанного числа часов'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, что будет удалено'
+        )
+
+    def handle(self, *args, **options):
+        # Ссылки считаются по строкам GeneratedDocument, отдельного счётчика нет.
+        # Свежие файлы пропускаем: их ссылка может быть ещё не закоммичена.
+        referenced = set(
+            GeneratedDocument.objects.exclude(file='')
+            .values_list('file', flat=True).distinct().iterator()
+        )
+        threshold = time.time() - options['grace_hours'] * 3600
+
+        kept = removed = reclaimed = 0
+        for name, size, mtime in document_storage.iter_blobs():
+            if name in referenced or mtime > threshold:
+                kept += 1
+                continue
+            if not options['dry_run']:
+                document_storage.delete(name)
+            removed += 1
+            reclaimed += size
+
+        action = 'К удалению' if options['dry_run'] else 'Удалено'
+        self.stdout.write(
+            f'Ссылок: {len(referenced)}, файлов оставлено: {kept}, '
+            f'{action}: {removed} ({reclaimed} байт)'
+        )
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from entrepreneurs.batch import BatchError, clean_batch, generate_batch, read_batch
+from entrepreneurs.documents import RENDERERS
+from entrepreneurs.models import EntrepreneurProfile
+
+
+class Command(BaseCommand):
+    help = 'Пакетная генерация счетов из CSV или JSON файла'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV или JSON файл со счетами')
+        parser.add_argument('--inn', required=True, help='ИНН предпринимателя')
+        parser.add_argument('--format', choices=['csv', 'json'], help='Формат файла (по умолчанию по расширению)')
+        parser.add_argument(
+            '--document-format', choices=sorted(RENDERERS), default='docx', help='Формат создаваемых документов'
+        )
+        parser.add_argument('--workers', type=int, help='Число процессов рендеринга')
+        parser.add_argument('--chunk-size', type=int, help='Счетов на одно задание пула')
+
+    def handle(self, *args, **options):
+        try:
+            entrepreneur = EntrepreneurProfile.objects.select_related('bank_details').get(inn=options['inn'])
+        except EntrepreneurProfile.DoesNotExist:
+            raise CommandError(f"Предприниматель с ИНН {options['inn']} не найден")
+        if not hasattr(entrepreneur, 'bank_details'):
+            raise CommandError('У предпринимателя не заполнены банковские реквизиты')
+
+        try:
+            with open(options['path'], 'rb') as file:
+                invoices = clean_batch(read_batch(file, options['format']))
+        except (OSError, BatchError) as e:
+            raise CommandError(str(e))
+
+        def progress(done, total):
+            self.stdout.write(f'\rСформировано {done}/{total}', ending='')
+            self.stdout.flush()
+
+        try:
+            result = generate_batch(
+                entrepreneur,
+                invoices,
+                document_format=options['document_format'],
+                workers=options['workers'],
+                chunk_size=options['chunk_size'],
+                progress=progress,
+            )
+        except BatchError as e:
+            raise CommandError(str(e))
+        self.stdout.write('')
+        # При нулевом времени (например, все счета уже сформированы) скорости нет
+        rate = result['invoices_per_second']
+        speed = f' ({rate:.1f} счетов/с)' if rate is not None else ''
+        self.stdout.write(self.style.SUCCESS(
+            f"Создано документов: {result['count']} за {result['elapsed']:.2f} с{speed}"
+        ))
+        if result['reused']:
+            self.stdout.write(f"Уже сформированы ранее: {result['reused']}")
@@ -0,0 +1,108 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from entrepreneurs.database import retry_on_locked
+from entrepreneurs.models import GeneratedDocument, Invoice, InvoiceLine
+from entrepreneurs.search import docx_text, index_invoices, normalize, store_texts
+from entrepreneurs.storage import document_storage
+
+# Сколько извлечённых текстов файлов держать в памяти: документы нередко
+# ссылаются на один и тот же blob, и он разбирается один раз
+_TEXT_CACHE_SIZE = 10000
+
+
+def extract_text(path):
+    """(текст, ошибка) для пула процессов: битый или пропавший файл не останавливает индексацию"""
+    try:
+        return docx_text(path), None
+    except Exception as e:
+        return '', f'{type(e).__name__}: {e}'
+
+
+class Command(BaseCommand):
+    help = (
+        'Индексирует для поиска документы, сформированные до появления поиска: текст берётся '
+        'из сохранённого счёта, а если его нет — извлекается из DOCX-файла пулом процессов'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, help='Процессов для разбора DOCX (по умолчанию по числу процессоров)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Документов за один проход')
+        parser.add_argument('--rebuild', action='store_true', help='Переиндексировать и уже проиндексированные документы')
+
+    def handle(self, *args, **options):
+        workers = options['workers'] or settings.BATCH_INVOICE_WORKERS or os.cpu_count() or 1
+        documents = GeneratedDocument.objects.order_by('pk')
+        if not options['rebuild']:
+            documents = documents.filter(search_text__isnull=True)
+
+        pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+        texts = {}
+        indexed = failed = 0
+        last_pk = 0
+        try:
+            while batch := list(
+                documents.filter(pk__gt=last_pk).values('pk', 'document_type', 'file', 'invoice')[:options['batch_size']]
+            ):
+                last_pk = batch[-1]['pk']
+                invoices = [document for document in batch if document['invoice'] is not None]
+                files = [document for document in batch if document['invoice'] is None]
+                failed += self.index_files(files, texts, pool, workers)
+                self.index_invoices([document['invoice'] for document in invoices])
+                indexed += len(batch)
+                self.stdout.write(f'Проиндексировано документов: {indexed}')
+                if len(texts) > _TEXT_CACHE_SIZE:
+                    texts.clear()
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        if failed:
+            self.stdout.write(self.style.WARNING(f'Файлов, из которых не удалось извлечь текст: {failed}'))
+        self.stdout.write(self.style.SUCCESS(f'Готово: {indexed} документов'))
+
+    @retry_on_locked
+    def index_invoices(self, invoice_ids):
+        """Документы со счётом в БД: текст из полей счёта, как при формировании"""
+        descriptions = {}
+        lines = InvoiceLine.objects.filter(invoice_id__in=invoice_ids).values_list('invoice_id', 'description')
+        for invoice_id, description in lines:
+            descriptions.setdefault(invoice_id, []).append(description)
+        with transaction.atomic():
+            index_invoices(
+                (invoice, descriptions.get(invoice.pk, []))
+                for invoice in Invoice.objects.filter(pk__in=invoice_ids)
+            )
+
+    def index_files(self, documents, texts, pool, workers):
+        """Документы без счёта в БД: текст извлекается из DOCX, у PDF индексируется только тип.
+
+        Возвращает число файлов, которые не удалось прочитать; такие документы
+        тоже индексируются по типу, чтобы следующий запуск их не повторял.
+        """
+        paths = sorted({
+            document['file'] for document in documents
+            if document['file'].lower().endswith('.docx') and document['file'] not in texts
+        })
+        full_paths = [document_storage.path(name) for name in paths]
+        if pool is not None and len(paths) > 1:
+            # Порции по нескольку файлов: меньше обменов с процессами на мелких документах
+            results = pool.map(extract_text, full_paths, chunksize=max(1, len(paths) // (workers * 4)))
+        else:
+            results = map(extract_text, full_paths)
+
+        failed = 0
+        for name, (text, error) in zip(paths, results):
+            if error:
+                failed += 1
+                self.stderr.write(f'{name}: {error}')
+            texts[name] = text
+        retry_on_locked(store_texts)({
+            document['pk']: normalize(document['document_type'], texts.get(document['file'], ''))
+            for document in documents
+        })
+        return failed
@@ -0,0 +1,206 @@
+import random
+import statistics
+import threading
+import time
+from http.client import HTTPException
+from http.cookiejar import CookieJar
+from urllib.parse import urlencode, urljoin
+from urllib.request import HTTPCookieProcessor, build_opener
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.urls import reverse
+
+from entrepreneurs.management.commands.seed_load_data import TENANT_PASSWORD, seeded_users
+from entrepreneurs.models import GeneratedDocument
+
+# Доли сценариев по умолчанию: чаще всего смотрят список и скачивают документы
+DEFAULT_MIX = 'login=1,list=5,create=2,download=4'
+# Сколько документов каждого предпринимателя участвует в скачивании
+DOWNLOAD_SAMPLE = 50
+
+
+def parse_mix(value):
+    """'login=1,list=5' → {'login': 1.0, 'list': 5.0}"""
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name not in VirtualUser.SCENARIOS:
+            raise ValueError(f'Неизвестный сценарий: {name}')
+        mix[name] = float(weight)
+    return mix
+
+
+def percentile_summary(latencies):
+    """p50/p95/p99 и среднее в секундах"""
+    if len(latencies) < 2:
+        value = latencies[0] if latencies else 0.0
+        return {'p50': value, 'p95': value, 'p99': value, 'mean': value}
+    cuts = statistics.quantiles(latencies, n=100, method='inclusive')
+    return {'p50': cuts[49], 'p95': cuts[94], 'p99': cuts[98], 'mean': statistics.fmean(latencies)}
+
+
+class VirtualUser:
+    """Браузер одного предпринимателя: своя сессия и CSRF-cookie"""
+
+    SCENARIOS = ('login', 'list', 'create', 'download')
+
+    def __init__(self, base_url, email, document_ids):
+        self.base_url = base_url
+        self.email = email
+        self.document_ids = document_ids
+        self.requests = 0
+        self.login()
+
+    def open(self, path, data=None):
+        if data is not None:
+            data['csrfmiddlewaretoken'] = self.csrf_token()
+            data = urlencode(data).encode()
+        # Как браузер: редиректы после POST проходят GET-запросом, тело читается целиком
+        with self.opener.open(urljoin(self.base_url, path), data, timeout=60) as response:
+            response.read()
+            self.requests += 1
+            return response.geturl()
+
+    def csrf_token(self):
+        return next((cookie.value for cookie in self.cookies if cookie.name == 'csrftoken'), '')
+
+    def login(self):
+        self.cookies = CookieJar()
+        self.opener = build_opener(HTTPCookieProcessor(self.cookies))
+        self.open(reverse('entrepreneurs:login'))
+        self.open(reverse('entrepreneurs:login'), {'username': self.email, 'password': TENANT_PASSWORD})
+
+    def list(self):
+        self.open(reverse('entrepreneurs:documents'))
+
+    def create(self):
+        create_url = reverse('entrepreneurs:create_invoice')
+        self.open(create_url)
+        data = {
+            'customer_name': f'ООО «Заказчик {random.randrange(10 ** 9)}»',
+            'customer_address': 'г. Москва, ул. Ленина, д. 1',
+            'customer_inn': '7701234567',
+            'date': '2025-06-01',
+            'payment_due_date': '2025-06-15',
+            'form-TOTAL_FORMS': '5',
+            'form-INITIAL_FORMS': '0',
+            'form-MIN_NUM_FORMS': '0',
+            'form-MAX_NUM_FORMS': '1000',
+        }
+        for n in range(5):
+            data.update({
+                f'form-{n}-description': f'Товар {n}',
+                f'form-{n}-quantity': '2',
+                f'form-{n}-unit': 'шт',
+                f'form-{n}-price': '100.50',
+                f'form-{n}-vat_rate': '20',
+            })
+        preview_url = self.open(create_url, data)
+        self.open(preview_url, {'generate': '1'})
+
+    def download(self):
+        document_id = random.choice(self.document_ids)
+        self.open(reverse('entrepreneurs:download_document', args=[document_id]))
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный тест запущенного сервера: параллельные предприниматели из seed_load_data '
+        'выполняют вход, просмотр списка, создание счетов и скачивание'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000/', help='Адрес проверяемого сервера')
+        parser.add_argument('--users', type=int, default=20, help='Одновременных пользователей')
+        parser.add_argument('--duration', type=float, default=60, help='Длительность теста в секундах')
+        parser.add_argument('--mix', default=DEFAULT_MIX, help=f'Доли сценариев (по умолчанию {DEFAULT_MIX})')
+        parser.add_argument('--seed', type=int, help='Зерно случайного выбора сценариев')
+
+    def handle(self, *args, **options):
+        try:
+            mix = parse_mix(options['mix'])
+        except ValueError as e:
+            raise CommandError(e)
+        tenants = list(
+            seeded_users().filter(entrepreneur_profile__isnull=False)
+            .order_by('?').values_list('email', 'entrepreneur_profile')[:options['users']]
+        )
+        if not tenants:
+            raise CommandError('Нет данных для теста, сначала выполните manage.py seed_load_data')
+
+        latencies, errors, requests, elapsed = self.run(options, mix, tenants)
+        total = sum(len(values) for values in latencies.values())
+        self.stdout.write(
+            f'{len(tenants)} польз. | {elapsed:.1f} с | сценариев: {total / elapsed:.1f}/с '
+            f'| HTTP-запросов: {requests / elapsed:.1f}/с | ошибок: {sum(errors.values())}'
+        )
+        self.stdout.write(f'{"сценарий":<10} {"число":>7} {"ошибок":>7} {"p50":>9} {"p95":>9} {"p99":>9} {"среднее":>9}')
+        for name in mix:
+            stats = percentile_summary(latencies[name])
+            self.stdout.write(
+                f'{name:<10} {len(latencies[name]):>7} {errors[name]:>7} '
+                + ' '.join(f'{stats[key] * 1000:7.1f}мс' for key in ('p50', 'p95', 'p99', 'mean'))
+            )
+
+    def run(self, options, mix, tenants):
+        """Каждый пользователь в своём потоке выполняет случайные сценарии до конца теста"""
+        names, weights = list(mix), list(mix.values())
+        latencies = {name: [] for name in names}
+        errors = dict.fromkeys(names, 0)
+        counters = {'requests': 0}
+        lock = threading.Lock()
+        timing = {}
+
+        def begin():
+            # Вход и выборка документов — подготовка, в результаты теста не входят
+            timing['started'] = time.perf_counter()
+            timing['deadline'] = timing['started'] + options['duration']
+
+        start = threading.Barrier(len(tenants), action=begin)
+
+        def user_loop(n, email, entrepreneur_id):
+            rng = random.Random(None if options['seed'] is None else options['seed'] + n)
+            document_ids = list(
+                GeneratedDocument.objects.filter(
+                    entrepreneur_id=entrepreneur_id, status=GeneratedDocument.STATUS_READY
+                ).values_list('id', flat=True)[:DOWNLOAD_SAMPLE]
+            )
+            connection.close()
+            local = {name: [] for name in names}
+            local_errors = dict.fromkeys(names, 0)
+            try:
+                user = VirtualUser(options['url'], email, document_ids)
+            except (OSError, HTTPException) as e:
+                start.wait()
+                with lock:
+                    errors['login'] = errors.get('login', 0) + 1
+                self.stderr.write(f'{email}: не удалось войти: {e}')
+                return
+            start.wait()
+            while time.perf_counter() < timing['deadline']:
+                name = rng.choices(names, weights)[0]
+                if name == 'download' and not document_ids:
+                    continue
+                started = time.perf_counter()
+                try:
+                    getattr(user, name)()
+                except (OSError, HTTPException):
+                    local_errors[name] += 1
+                else:
+                    local[name].append(time.perf_counter() - started)
+            with lock:
+                for name in names:
+                    latencies[name] += local[name]
+                    errors[name] += local_errors[name]
+                counters['requests'] += user.requests
+
+        threads = [
+            threading.Thread(target=user_loop, args=(n, email, entrepreneur_id))
+            for n, (email, entrepreneur_id) in enumerate(tenants)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return latencies, errors, counters['requests'], time.perf_counter() - timing['started']
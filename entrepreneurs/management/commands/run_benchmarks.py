@@ -0,0 +1,73 @@
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from django.test.utils import (
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+    teardown_test_environment,
+)
+
+from entrepreneurs.benchmarks import DOCUMENT_COUNTS, compare, load_report, run_suite, save_report
+
+
+class Command(BaseCommand):
+    help = 'Набор замеров производительности с сравнением с эталоном (во временной тестовой БД)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20, help='Повторов каждого замера')
+        parser.add_argument(
+            '--documents', type=int, nargs='+', default=list(DOCUMENT_COUNTS),
+            help='Размеры списка документов для замера documents_list'
+        )
+        parser.add_argument('--output', help='Сохранить результаты в JSON')
+        parser.add_argument(
+            '--baseline', default=settings.BENCHMARK_BASELINE, help='Эталонные результаты для сравнения'
+        )
+        parser.add_argument(
+            '--threshold', type=float, default=settings.BENCHMARK_REGRESSION_THRESHOLD,
+            help='Допустимое замедление относительно эталона, доля (0.25 — на 25%%)'
+        )
+        parser.add_argument('--update-baseline', action='store_true', help='Записать результаты как новый эталон')
+
+    def handle(self, *args, **options):
+        report = self.run(options)
+
+        for name, result in report['results'].items():
+            self.stdout.write(f'{name:<32} {result["median"] * 1000:10.2f} мс  (мин. {result["min"] * 1000:.2f})')
+        if options['output']:
+            save_report(report, options['output'])
+
+        baseline_path = options['baseline']
+        if options['update_baseline']:
+            save_report(report, baseline_path)
+            self.stdout.write(self.style.SUCCESS(f'Эталон обновлён: {baseline_path}'))
+            return
+        if not os.path.exists(baseline_path):
+            self.stdout.write(self.style.WARNING(f'Эталон {baseline_path} не найден, сравнение пропущено'))
+            return
+
+        regressions = compare(report, load_report(baseline_path), options['threshold'])
+        for name, reference, current in regressions:
+            self.stderr.write(
+                f'{name}: {reference * 1000:.2f} мс → {current * 1000:.2f} мс ({current / reference - 1:+.0%})'
+            )
+        if regressions:
+            raise CommandError(f'Замедление больше {options["threshold"]:.0%} в {len(regressions)} замерах')
+        self.stdout.write(self.style.SUCCESS('Регрессий нет'))
+
+    def run(self, options):
+        media_root = tempfile.mkdtemp()
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            with override_settings(MEDIA_ROOT=media_root, DOCUMENT_JOBS_EAGER=True, REQUEST_PROFILING=False):
+                return run_suite(options['iterations'], options['documents'])
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+            shutil.rmtree(media_root, ignore_errors=True)
@@ -0,0 +1,60 @@
+import multiprocessing
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from entrepreneurs.jobs import default_worker_id, work
+from entrepreneurs.workers import worker_main
+
+
+class Command(BaseCommand):
+    help = 'Запускает пул процессов, генерирующих документы из очереди'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int, default=settings.DOCUMENT_WORKER_CONCURRENCY,
+            help='Число процессов-обработчиков'
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=settings.DOCUMENT_WORKER_POLL_INTERVAL,
+            help='Пауза между опросами пустой очереди, с'
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Завершиться, когда очередь опустеет'
+        )
+
+    def handle(self, *args, **options):
+        concurrency = options['concurrency']
+        poll_interval = options['poll_interval']
+        once = options['once']
+
+        if concurrency <= 1:
+            processed = work(poll_interval=poll_interval, once=once)
+            self.stdout.write(f'Обработано заданий: {processed}')
+            return
+
+        # Соединения с БД не должны наследоваться дочерними процессами
+        connections.close_all()
+        base_id = default_worker_id()
+        processes = [
+            multiprocessing.Process(
+                target=worker_main,
+                args=(f'{base_id}-{n}', poll_interval, once),
+                daemon=True,
+            )
+            for n in range(concurrency)
+        ]
+        for process in processes:
+            process.start()
+        self.stdout.write(f'Запущено обработчиков: {concurrency}')
+
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.join()
@@ -0,0 +1,132 @@
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from entrepreneurs.benchmarks import sample_invoice
+from entrepreneurs.documents import generate_invoice
+from entrepreneurs.models import BankDetails, EntrepreneurProfile, GeneratedDocument
+from entrepreneurs.storage import document_storage
+
+# Служебные предприниматели нагрузочного теста: имена load_000001...,
+# ИНН и ОГРНИП из диапазона, который не выдаётся настоящим ИП
+TENANT_PREFIX = 'load_'
+TENANT_PASSWORD = 'Load-test-pass-1'
+_INN_BASE = 980000000000
+
+# Доля форматов среди документов: примерно каждый третий — PDF
+_FORMATS = ('docx', 'docx', 'pdf')
+
+
+def tenant_email(n):
+    return f'load{n}@load.test'
+
+
+def seeded_users():
+    return User.objects.filter(username__startswith=TENANT_PREFIX)
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class Command(BaseCommand):
+    help = 'Заполняет БД предпринимателями и документами для нагрузочного теста (manage.py load_test)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tenants', type=int, default=1000, help='Предпринимателей')
+        parser.add_argument('--documents', type=int, default=1000, help='Документов у каждого предпринимателя')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Строк в одном bulk_create')
+        parser.add_argument('--clear', action='store_true', help='Сначала удалить ранее созданные данные теста')
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            deleted, _ = seeded_users().delete()
+            self.stdout.write(f'Удалено строк: {deleted}')
+        elif seeded_users().exists():
+            raise CommandError('Данные нагрузочного теста уже есть; для пересоздания укажите --clear')
+
+        batch_size = options['batch_size']
+        entrepreneurs = self.create_tenants(options['tenants'], batch_size)
+        self.stdout.write(f'Предпринимателей: {len(entrepreneurs)}')
+
+        # Все документы ссылаются на несколько настоящих файлов: хранилище
+        # адресуется по содержимому, поэтому на диске они лежат по одному разу
+        stubs = self.create_stub_files()
+        documents = (
+            GeneratedDocument(
+                entrepreneur_id=entrepreneur_id,
+                document_type='Счёт на оплату',
+                file=stubs[_FORMATS[i % len(_FORMATS)]],
+                filename=f'Счёт_{i + 1}.{_FORMATS[i % len(_FORMATS)]}',
+                status=GeneratedDocument.STATUS_READY,
+            )
+            for entrepreneur_id in entrepreneurs
+            for i in range(options['documents'])
+        )
+        created = 0
+        for batch in _batches(documents, batch_size):
+            with transaction.atomic():
+                GeneratedDocument.objects.bulk_create(batch)
+            created += len(batch)
+            if created % (batch_size * 20) == 0:
+                self.stdout.write(f'Документов: {created}')
+        self.stdout.write(self.style.SUCCESS(f'Готово: {len(entrepreneurs)} предпринимателей, {created} документов'))
+
+    def create_tenants(self, count, batch_size):
+        """Создаёт пользователей с профилями и реквизитами, возвращает id профилей"""
+        # Хеш пароля считается один раз: PBKDF2 на каждого занял бы минуты
+        password = make_password(TENANT_PASSWORD)
+        entrepreneur_ids = []
+        for numbers in _batches(range(1, count + 1), batch_size):
+            with transaction.atomic():
+                User.objects.bulk_create(
+                    User(username=f'{TENANT_PREFIX}{n:06d}', email=tenant_email(n), password=password)
+                    for n in numbers
+                )
+                # Первичные ключи после bulk_create есть не во всех СУБД, поэтому перечитываем
+                user_ids = dict(
+                    User.objects.filter(username__in=[f'{TENANT_PREFIX}{n:06d}' for n in numbers])
+                    .values_list('username', 'id')
+                )
+                EntrepreneurProfile.objects.bulk_create(
+                    EntrepreneurProfile(
+                        user_id=user_ids[f'{TENANT_PREFIX}{n:06d}'],
+                        company_name=f'ИП Нагрузочный {n}',
+                        inn=str(_INN_BASE + n),
+                        ogrnip=str(_INN_BASE * 1000 + n),
+                        phone='+7 (900) 000-00-00',
+                    )
+                    for n in numbers
+                )
+                profile_ids = list(
+                    EntrepreneurProfile.objects.filter(user_id__in=user_ids.values())
+                    .order_by('user__username').values_list('id', flat=True)
+                )
+                BankDetails.objects.bulk_create(
+                    BankDetails(
+                        entrepreneur_id=profile_id,
+                        bank_name='ПАО Сбербанк',
+                        bik='044525225',
+                        correspondent_account='30101810400000000225',
+                        payment_account='40802810900000000001',
+                    )
+                    for profile_id in profile_ids
+                )
+            entrepreneur_ids += profile_ids
+        return entrepreneur_ids
+
+    def create_stub_files(self):
+        invoice = sample_invoice(10)
+        return {
+            document_format: document_storage.save(
+                f'load.{document_format}',
+                ContentFile(generate_invoice(*invoice, document_format=document_format).getvalue())
+            )
+            for document_format in set(_FORMATS)
+        }
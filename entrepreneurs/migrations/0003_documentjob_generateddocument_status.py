@@ -0,0 +1,38 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:44
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('entrepreneurs', '0002_invoiceitem_bankdetails_generateddocument'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generateddocument',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Формируется'), ('ready', 'Готов'), ('failed', 'Ошибка')], default='ready', max_length=10, verbose_name='Статус'),
+        ),
+        migrations.CreateModel(
+            name='DocumentJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('payload', models.JSONField(verbose_name='Данные для генерации')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Число попыток')),
+                ('run_after', models.DateTimeField(db_index=True, verbose_name='Выполнить не раньше')),
+                ('locked_at', models.DateTimeField(blank=True, null=True, verbose_name='Взято в работу')),
+                ('locked_by', models.CharField(blank=True, max_length=100, verbose_name='Обработчик')),
+                ('last_error', models.TextField(blank=True, verbose_name='Последняя ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('document', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='job', to='entrepreneurs.generateddocument', verbose_name='Документ')),
+            ],
+            options={
+                'verbose_name': 'Задание генерации',
+                'verbose_name_plural': 'Задания генерации',
+                'ordering': ['run_after', 'id'],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('entrepreneurs', '0003_documentjob_generateddocument_status'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='generateddocument',
+            index=models.Index(fields=['entrepreneur', '-created_at', '-id'], name='document_entrepreneur_page_idx'),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('entrepreneurs', '0004_generateddocument_page_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Invoice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('customer_name', models.CharField(max_length=255, verbose_name='Имя заказчика')),
+                ('customer_address', models.CharField(max_length=255, verbose_name='Адрес заказчика')),
+                ('customer_inn', models.CharField(max_length=12, verbose_name='ИНН заказчика')),
+                ('date', models.DateField(verbose_name='Дата счёта')),
+                ('payment_due_date', models.DateField(verbose_name='Срок оплаты')),
+                ('total', models.DecimalField(decimal_places=4, default=0, max_digits=24, verbose_name='Итого')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата последнего обновления')),
+                ('document', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='invoice', to='entrepreneurs.generateddocument', verbose_name='Сгенерированный документ')),
+                ('entrepreneur', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='invoices', to='entrepreneurs.entrepreneurprofile', verbose_name='Предприниматель')),
+            ],
+            options={
+                'verbose_name': 'Счёт',
+                'verbose_name_plural': 'Счета',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='InvoiceLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField(verbose_name='№ п/п')),
+                ('description', models.CharField(max_length=255, verbose_name='Наименование товара/услуги')),
+                ('quantity', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Количество')),
+                ('unit', models.CharField(max_length=20, verbose_name='Единица измерения')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Цена за единицу')),
+                ('vat_rate', models.DecimalField(decimal_places=2, default=0, max_digits=4, verbose_name='Ставка НДС (%)')),
+                ('amount', models.DecimalField(decimal_places=4, max_digits=20, verbose_name='Сумма')),
+                ('invoice', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='entrepreneurs.invoice', verbose_name='Счёт')),
+            ],
+            options={
+                'verbose_name': 'Строка счёта',
+                'verbose_name_plural': 'Строки счёта',
+                'ordering': ['invoice', 'position'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='invoiceline',
+            constraint=models.UniqueConstraint(fields=('invoice', 'position'), name='invoice_line_position_unique'),
+        ),
+    ]
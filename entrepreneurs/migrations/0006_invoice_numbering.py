@@ -0,0 +1,49 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:51
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('entrepreneurs', '0005_invoice_invoiceline'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoiceNumberSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField(verbose_name='Год')),
+                ('last_number', models.PositiveIntegerField(default=0, verbose_name='Последний выданный номер')),
+            ],
+            options={
+                'verbose_name': 'Нумерация счетов',
+                'verbose_name_plural': 'Нумерация счетов',
+            },
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='number',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Номер счёта'),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='number_year',
+            field=models.PositiveSmallIntegerField(blank=True, null=True, verbose_name='Год нумерации'),
+        ),
+        migrations.AddConstraint(
+            model_name='invoice',
+            constraint=models.UniqueConstraint(fields=('entrepreneur', 'number_year', 'number'), name='invoice_number_unique'),
+        ),
+        migrations.AddField(
+            model_name='invoicenumbersequence',
+            name='entrepreneur',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='invoice_sequences', to='entrepreneurs.entrepreneurprofile', verbose_name='Предприниматель'),
+        ),
+        migrations.AddConstraint(
+            model_name='invoicenumbersequence',
+            constraint=models.UniqueConstraint(fields=('entrepreneur', 'year'), name='invoice_sequence_unique'),
+        ),
+    ]
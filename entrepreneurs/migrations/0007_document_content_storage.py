@@ -0,0 +1,40 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:53
+
+import os
+
+from django.db import migrations, models
+import entrepreneurs.storage
+
+
+def fill_filenames(apps, schema_editor):
+    GeneratedDocument = apps.get_model('entrepreneurs', 'GeneratedDocument')
+    batch = []
+    for document in GeneratedDocument.objects.exclude(file='').only('file').iterator(chunk_size=1000):
+        document.filename = os.path.basename(document.file.name)
+        batch.append(document)
+        if len(batch) == 1000:
+            GeneratedDocument.objects.bulk_update(batch, ['filename'])
+            batch = []
+    if batch:
+        GeneratedDocument.objects.bulk_update(batch, ['filename'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('entrepreneurs', '0006_invoice_numbering'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generateddocument',
+            name='filename',
+            field=models.CharField(blank=True, max_length=255, verbose_name='Имя файла'),
+        ),
+        migrations.AlterField(
+            model_name='generateddocument',
+            name='file',
+            field=models.FileField(storage=entrepreneurs.storage.ContentAddressedStorage(), upload_to='documents/%Y/%m/%d/', verbose_name='Файл'),
+        ),
+        migrations.RunPython(fill_filenames, migrations.RunPython.noop),
+    ]
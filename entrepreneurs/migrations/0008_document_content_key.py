@@ -0,0 +1,22 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('entrepreneurs', '0007_document_content_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generateddocument',
+            name='content_key',
+            field=models.CharField(blank=True, editable=False, max_length=64, verbose_name='Ключ содержимого'),
+        ),
+        migrations.AddConstraint(
+            model_name='generateddocument',
+            constraint=models.UniqueConstraint(condition=models.Q(models.Q(('content_key', ''), _negated=True), models.Q(('status', 'failed'), _negated=True)), fields=('entrepreneur', 'content_key'), name='document_content_key_unique'),
+        ),
+    ]
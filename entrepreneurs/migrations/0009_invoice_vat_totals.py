@@ -0,0 +1,54 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:08
+
+from django.db import migrations, models
+
+from entrepreneurs.totals import compute_totals
+
+
+def recompute_totals(apps, schema_editor):
+    # Суммы строк округляются до копейки, итоги получают НДС
+    Invoice = apps.get_model('entrepreneurs', 'Invoice')
+    InvoiceLine = apps.get_model('entrepreneurs', 'InvoiceLine')
+    invoices = []
+    lines = []
+    for invoice in Invoice.objects.prefetch_related('lines').iterator(chunk_size=500):
+        invoice_lines = list(invoice.lines.all())
+        totals = compute_totals(invoice_lines)
+        for line, amount in zip(invoice_lines, totals.amounts):
+            line.amount = amount
+        lines.extend(invoice_lines)
+        invoice.net_total, invoice.vat_total, invoice.total = totals.net, totals.vat, totals.gross
+        invoices.append(invoice)
+        if len(invoices) >= 500:
+            Invoice.objects.bulk_update(invoices, ['net_total', 'vat_total', 'total'])
+            InvoiceLine.objects.bulk_update(lines, ['amount'], batch_size=1000)
+            invoices = []
+            lines = []
+    Invoice.objects.bulk_update(invoices, ['net_total', 'vat_total', 'total'])
+    InvoiceLine.objects.bulk_update(lines, ['amount'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('entrepreneurs', '0008_document_content_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='net_total',
+            field=models.DecimalField(decimal_places=4, default=0, max_digits=24, verbose_name='Итого без НДС'),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='vat_total',
+            field=models.DecimalField(decimal_places=4, default=0, max_digits=24, verbose_name='НДС'),
+        ),
+        migrations.AlterField(
+            model_name='invoice',
+            name='total',
+            field=models.DecimalField(decimal_places=4, default=0, max_digits=24, verbose_name='Всего к оплате'),
+        ),
+        migrations.RunPython(recompute_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:20
+
+from django.db import migrations, models
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Lower, NullIf
+
+# Пустой email (например, у суперпользователя) становится NULL и не участвует
+# в уникальности; запросы должны использовать то же выражение (entrepreneurs.accounts.EMAIL_KEY)
+EMAIL_CONSTRAINT = models.UniqueConstraint(
+    NullIf(Lower('email'), RawSQL("''", (), output_field=models.CharField())),
+    name='auth_user_email_ci_unique',
+)
+
+
+def add_email_constraint(apps, schema_editor):
+    User = apps.get_model('auth', 'User')
+    duplicates = list(
+        User.objects.exclude(email='')
+        .values_list(Lower('email'), flat=True)
+        .annotate(count=models.Count('id'))
+        .filter(count__gt=1)
+    )
+    if duplicates:
+        raise RuntimeError(f'Email встречается у нескольких пользователей: {", ".join(duplicates)}')
+    schema_editor.add_constraint(User, EMAIL_CONSTRAINT)
+
+
+def remove_email_constraint(apps, schema_editor):
+    schema_editor.remove_constraint(apps.get_model('auth', 'User'), EMAIL_CONSTRAINT)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('entrepreneurs', '0009_invoice_vat_totals'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='invoiceline',
+            options={'ordering': ['invoice_id', 'position'], 'verbose_name': 'Строка счёта', 'verbose_name_plural': 'Строки счёта'},
+        ),
+        migrations.RunPython(add_email_constraint, remove_email_constraint),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:44
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('entrepreneurs', '0010_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Customer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, verbose_name='Имя заказчика')),
+                ('address', models.CharField(max_length=255, verbose_name='Адрес заказчика')),
+                ('inn', models.CharField(max_length=12, verbose_name='ИНН заказчика')),
+                ('search_name', models.CharField(editable=False, max_length=255, verbose_name='Имя для поиска')),
+                ('last_used_at', models.DateTimeField(verbose_name='Последний счёт')),
+                ('entrepreneur', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='customers', to='entrepreneurs.entrepreneurprofile', verbose_name='Предприниматель')),
+            ],
+            options={
+                'verbose_name': 'Заказчик',
+                'verbose_name_plural': 'Заказчики',
+                'ordering': ['search_name'],
+                'indexes': [models.Index(fields=['entrepreneur', 'search_name'], name='customer_name_prefix_idx', opclasses=['', 'varchar_pattern_ops']), models.Index(fields=['entrepreneur', 'inn'], name='customer_inn_prefix_idx', opclasses=['', 'varchar_pattern_ops'])],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='customer',
+            constraint=models.UniqueConstraint(fields=('entrepreneur', 'inn'), name='customer_inn_unique'),
+        ),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Таблица FTS5 с внешним содержимым: текст хранится один раз, в
+# entrepreneurs_documentsearchtext, а триггеры поддерживают индекс при
+# вставке, изменении и удалении строк. rowid записи — id документа
+SQLITE_FTS_TABLE = 'entrepreneurs_documentsearch_fts'
+SQLITE_CREATE = [
+    f"""CREATE VIRTUAL TABLE {SQLITE_FTS_TABLE} USING fts5(
+        content,
+        content='entrepreneurs_documentsearchtext',
+        content_rowid='document_id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER {SQLITE_FTS_TABLE}_insert AFTER INSERT ON entrepreneurs_documentsearchtext BEGIN
+        INSERT INTO {SQLITE_FTS_TABLE}(rowid, content) VALUES (new.document_id, new.content);
+    END""",
+    f"""CREATE TRIGGER {SQLITE_FTS_TABLE}_delete AFTER DELETE ON entrepreneurs_documentsearchtext BEGIN
+        INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}, rowid, content) VALUES ('delete', old.document_id, old.content);
+    END""",
+    f"""CREATE TRIGGER {SQLITE_FTS_TABLE}_update AFTER UPDATE ON entrepreneurs_documentsearchtext BEGIN
+        INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}, rowid, content) VALUES ('delete', old.document_id, old.content);
+        INSERT INTO {SQLITE_FTS_TABLE}(rowid, content) VALUES (new.document_id, new.content);
+    END""",
+]
+SQLITE_DROP = [
+    f'DROP TRIGGER {SQLITE_FTS_TABLE}_update',
+    f'DROP TRIGGER {SQLITE_FTS_TABLE}_delete',
+    f'DROP TRIGGER {SQLITE_FTS_TABLE}_insert',
+    f'DROP TABLE {SQLITE_FTS_TABLE}',
+]
+
+# Конфигурация и выражение должны совпадать с запросами
+# entrepreneurs.search (SEARCH_CONFIG), иначе PostgreSQL не использует индекс
+POSTGRES_INDEX_NAME = 'document_search_content_gin'
+
+
+def postgres_index():
+    # Импорт здесь: django.contrib.postgres требует драйвер PostgreSQL
+    from django.contrib.postgres.indexes import GinIndex
+    from django.contrib.postgres.search import SearchVector
+    return GinIndex(SearchVector('content', config='russian'), name=POSTGRES_INDEX_NAME)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for statement in SQLITE_CREATE:
+            schema_editor.execute(statement)
+    elif vendor == 'postgresql':
+        schema_editor.add_index(apps.get_model('entrepreneurs', 'DocumentSearchText'), postgres_index())
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for statement in SQLITE_DROP:
+            schema_editor.execute(statement)
+    elif vendor == 'postgresql':
+        schema_editor.remove_index(apps.get_model('entrepreneurs', 'DocumentSearchText'), postgres_index())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('entrepreneurs', '0011_customer'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentSearchText',
+            fields=[
+                ('document', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_text', serialize=False, to='entrepreneurs.generateddocument', verbose_name='Документ')),
+                ('content', models.TextField(verbose_name='Текст')),
+            ],
+            options={
+                'verbose_name': 'Текст для поиска',
+                'verbose_name_plural': 'Тексты для поиска',
+            },
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
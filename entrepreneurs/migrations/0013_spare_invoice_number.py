@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-18 21:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('entrepreneurs', '0012_document_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SpareInvoiceNumber',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField(verbose_name='Год')),
+                ('number', models.PositiveIntegerField(verbose_name='Номер')),
+                ('holder', models.CharField(blank=True, db_index=True, max_length=32, verbose_name='Пачка')),
+                ('leased_until', models.DateTimeField(blank=True, null=True, verbose_name='Зарезервирован до')),
+                ('entrepreneur', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='spare_invoice_numbers', to='entrepreneurs.entrepreneurprofile', verbose_name='Предприниматель')),
+            ],
+            options={
+                'verbose_name': 'Резервный номер счёта',
+                'verbose_name_plural': 'Резервные номера счетов',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='spareinvoicenumber',
+            constraint=models.UniqueConstraint(fields=('entrepreneur', 'year', 'number'), name='spare_invoice_number_unique'),
+        ),
+    ]
@@ -1,7 +1,13 @@
+import os
+
 from django.db import models
+from django.db.models import Sum
 from django.contrib.auth.models import User
 from django.core.validators import RegexValidator
 
+from .storage import document_storage
+from .totals import KOPECK, totals_from_net
+
 class EntrepreneurProfile(models.Model):
     user = models.OneToOneField(
         User,
@@ -117,6 +123,15 @@ class InvoiceItem(models.Model):
         return self.description
 
 class GeneratedDocument(models.Model):
+    STATUS_PENDING = 'pending'
+    STATUS_READY = 'ready'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Формируется'),
+        (STATUS_READY, 'Готов'),
+        (STATUS_FAILED, 'Ошибка'),
+    ]
+
     entrepreneur = models.ForeignKey(
         EntrepreneurProfile,
         on_delete=models.CASCADE,
@@ -125,13 +140,290 @@ class GeneratedDocument(models.Model):
     )
     
     document_type = models.CharField(max_length=50, verbose_name='Тип документа')
-    file = models.FileField(upload_to='documents/%Y/%m/%d/', verbose_name='Файл')
+    file = models.FileField(upload_to='documents/%Y/%m/%d/', storage=document_storage, verbose_name='Файл')
+    # Имя для скачивания: в хранилище файл лежит под хешем содержимого
+    filename = models.CharField(max_length=255, blank=True, verbose_name='Имя файла')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=STATUS_READY,
+        verbose_name='Статус'
+    )
+    # sha256 исходных данных документа (invoices.invoice_content_key): повторная
+    # генерация с теми же данными возвращает существующий документ
+    content_key = models.CharField(max_length=64, blank=True, editable=False, verbose_name='Ключ содержимого')
     
     class Meta:
         verbose_name = 'Сгенерированный документ'
         verbose_name_plural = 'Сгенерированные документы'
         ordering = ['-created_at']
+        indexes = [
+            # Постраничный вывод списка документов по ключу (created_at, id)
+            models.Index(fields=['entrepreneur', '-created_at', '-id'], name='document_entrepreneur_page_idx'),
+        ]
+        constraints = [
+            # Документ с ошибкой не мешает сформировать такой же заново
+            models.UniqueConstraint(
+                fields=['entrepreneur', 'content_key'],
+                condition=~models.Q(content_key='') & ~models.Q(status='failed'),
+                name='document_content_key_unique'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.document_type} от {self.created_at.strftime('%d.%m.%Y')}"
+    
+    @property
+    def download_name(self):
+        return self.filename or os.path.basename(self.file.name)
+
+class Invoice(models.Model):
+    entrepreneur = models.ForeignKey(
+        EntrepreneurProfile,
+        on_delete=models.CASCADE,
+        related_name='invoices',
+        verbose_name='Предприниматель'
+    )
+    
+    document = models.OneToOneField(
+        GeneratedDocument,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='invoice',
+        verbose_name='Сгенерированный документ'
+    )
+    
+    # Номер присваивается при генерации документа, у черновиков его нет
+    number = models.PositiveIntegerField(null=True, blank=True, verbose_name='Номер счёта')
+    number_year = models.PositiveSmallIntegerField(null=True, blank=True, verbose_name='Год нумерации')
+    
+    customer_name = models.CharField(max_length=255, verbose_name='Имя заказчика')
+    customer_address = models.CharField(max_length=255, verbose_name='Адрес заказчика')
+    customer_inn = models.CharField(max_length=12, verbose_name='ИНН заказчика')
+    date = models.DateField(verbose_name='Дата счёта')
+    payment_due_date = models.DateField(verbose_name='Срок оплаты')
+    # Итоги считает entrepreneurs.totals.compute_totals при сохранении строк
+    net_total = models.DecimalField(max_digits=24, decimal_places=4, default=0, verbose_name='Итого без НДС')
+    vat_total = models.DecimalField(max_digits=24, decimal_places=4, default=0, verbose_name='НДС')
+    total = models.DecimalField(max_digits=24, decimal_places=4, default=0, verbose_name='Всего к оплате')
+    
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата последнего обновления')
+    
+    class Meta:
+        verbose_name = 'Счёт'
+        verbose_name_plural = 'Счета'
+        ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['entrepreneur', 'number_year', 'number'],
+                name='invoice_number_unique'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"Счёт для {self.customer_name} от {self.date.strftime('%d.%m.%Y')}"
+    
+    @property
+    def is_draft(self):
+        return self.document_id is None
+    
+    def get_totals(self):
+        """Итоги с разбивкой НДС по ставкам из сохранённых сумм строк, без загрузки строк"""
+        net_by_rate = {
+            rate: amount.quantize(KOPECK)
+            for rate, amount in self.lines.order_by().values_list('vat_rate').annotate(Sum('amount'))
+        }
+        return totals_from_net(net_by_rate)
+    
+    @property
+    def form_data(self):
+        """Номер и данные заказчика в виде cleaned_data формы InvoiceGenerationForm"""
+        return {
+            'number': self.number,
+            'customer_name': self.customer_name,
+            'customer_address': self.customer_address,
+            'customer_inn': self.customer_inn,
+            'date': self.date,
+            'payment_due_date': self.payment_due_date,
+        }
+
+
+class InvoiceNumberSequence(models.Model):
+    """Счётчик номеров счетов предпринимателя в пределах года"""
+    entrepreneur = models.ForeignKey(
+        EntrepreneurProfile,
+        on_delete=models.CASCADE,
+        related_name='invoice_sequences',
+        verbose_name='Предприниматель'
+    )
+    
+    year = models.PositiveSmallIntegerField(verbose_name='Год')
+    last_number = models.PositiveIntegerField(default=0, verbose_name='Последний выданный номер')
+    
+    class Meta:
+        verbose_name = 'Нумерация счетов'
+        verbose_name_plural = 'Нумерация счетов'
+        constraints = [
+            models.UniqueConstraint(fields=['entrepreneur', 'year'], name='invoice_sequence_unique'),
+        ]
+    
+    def __str__(self):
+        return f"{self.entrepreneur.company_name}, {self.year}: {self.last_number}"
+
+
+class SpareInvoiceNumber(models.Model):
+    """Номер счёта вне счётчика: зарезервированный пакетной генерацией или освободившийся.
+
+    Пока leased_until в будущем, номер держит пачка holder: её файлы уже
+    содержат этот номер. Номера с истёкшим или снятым резервом свободны и
+    выдаются allocate_invoice_numbers раньше новых, поэтому упавшая пачка не
+    оставляет пропусков в нумерации.
+    """
+    entrepreneur = models.ForeignKey(
+        EntrepreneurProfile,
+        on_delete=models.CASCADE,
+        related_name='spare_invoice_numbers',
+        verbose_name='Предприниматель'
+    )
+    
+    year = models.PositiveSmallIntegerField(verbose_name='Год')
+    number = models.PositiveIntegerField(verbose_name='Номер')
+    holder = models.CharField(max_length=32, blank=True, db_index=True, verbose_name='Пачка')
+    leased_until = models.DateTimeField(null=True, blank=True, verbose_name='Зарезервирован до')
+    
+    class Meta:
+        verbose_name = 'Резервный номер счёта'
+        verbose_name_plural = 'Резервные номера счетов'
+        constraints = [
+            models.UniqueConstraint(fields=['entrepreneur', 'year', 'number'], name='spare_invoice_number_unique'),
+        ]
+    
+    def __str__(self):
+        return f"{self.entrepreneur.company_name}, {self.year}: № {self.number}"
+
+
+class InvoiceLine(models.Model):
+    invoice = models.ForeignKey(
+        Invoice,
+        on_delete=models.CASCADE,
+        related_name='lines',
+        verbose_name='Счёт'
+    )
+    
+    position = models.PositiveIntegerField(verbose_name='№ п/п')
+    description = models.CharField(max_length=255, verbose_name='Наименование товара/услуги')
+    quantity = models.DecimalField(max_digits=10, decimal_places=2, verbose_name='Количество')
+    unit = models.CharField(max_length=20, verbose_name='Единица измерения')
+    price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name='Цена за единицу')
+    vat_rate = models.DecimalField(max_digits=4, decimal_places=2, default=0, verbose_name='Ставка НДС (%)')
+    # Сумма без НДС: количество × цена, округлённое до копейки (totals.line_amount)
+    amount = models.DecimalField(max_digits=20, decimal_places=4, verbose_name='Сумма')
+    
+    class Meta:
+        verbose_name = 'Строка счёта'
+        verbose_name_plural = 'Строки счёта'
+        # invoice_id, а не invoice: иначе сортировка идёт по порядку счетов через JOIN
+        ordering = ['invoice_id', 'position']
+        constraints = [
+            models.UniqueConstraint(fields=['invoice', 'position'], name='invoice_line_position_unique'),
+        ]
+    
+    def __str__(self):
+        return self.description
+
+
+class DocumentJob(models.Model):
+    """Задание очереди генерации документа (очередь хранится в БД, без брокера)"""
+    document = models.OneToOneField(
+        GeneratedDocument,
+        on_delete=models.CASCADE,
+        related_name='job',
+        verbose_name='Документ'
+    )
+    
+    payload = models.JSONField(verbose_name='Данные для генерации')
+    attempts = models.PositiveIntegerField(default=0, verbose_name='Число попыток')
+    run_after = models.DateTimeField(db_index=True, verbose_name='Выполнить не раньше')
+    locked_at = models.DateTimeField(null=True, blank=True, verbose_name='Взято в работу')
+    locked_by = models.CharField(max_length=100, blank=True, verbose_name='Обработчик')
+    last_error = models.TextField(blank=True, verbose_name='Последняя ошибка')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    
+    class Meta:
+        verbose_name = 'Задание генерации'
+        verbose_name_plural = 'Задания генерации'
+        ordering = ['run_after', 'id']
+    
+    def __str__(self):
+        return f"Задание для документа #{self.document_id}"
+
+
+class Customer(models.Model):
+    """Заказчик из справочника предпринимателя; пополняется при формировании счетов"""
+    entrepreneur = models.ForeignKey(
+        EntrepreneurProfile,
+        on_delete=models.CASCADE,
+        related_name='customers',
+        verbose_name='Предприниматель'
+    )
+    
+    name = models.CharField(max_length=255, verbose_name='Имя заказчика')
+    address = models.CharField(max_length=255, verbose_name='Адрес заказчика')
+    inn = models.CharField(max_length=12, verbose_name='ИНН заказчика')
+    # Имя для поиска по началу строки (entrepreneurs.customers.search_key)
+    search_name = models.CharField(max_length=255, editable=False, verbose_name='Имя для поиска')
+    last_used_at = models.DateTimeField(verbose_name='Последний счёт')
+    
+    class Meta:
+        verbose_name = 'Заказчик'
+        verbose_name_plural = 'Заказчики'
+        ordering = ['search_name']
+        constraints = [
+            models.UniqueConstraint(fields=['entrepreneur', 'inn'], name='customer_inn_unique'),
+        ]
+        indexes = [
+            # Поиск по началу имени и ИНН для автодополнения. varchar_pattern_ops
+            # нужен PostgreSQL для LIKE 'префикс%' при любой сортировке БД;
+            # остальные СУБД класс операторов не учитывают
+            models.Index(
+                fields=['entrepreneur', 'search_name'],
+                name='customer_name_prefix_idx',
+                opclasses=['', 'varchar_pattern_ops']
+            ),
+            models.Index(
+                fields=['entrepreneur', 'inn'],
+                name='customer_inn_prefix_idx',
+                opclasses=['', 'varchar_pattern_ops']
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.name} (ИНН {self.inn})"
+
+
+class DocumentSearchText(models.Model):
+    """Текст документа для полнотекстового поиска (entrepreneurs.search).
+
+    Индекс по тексту создаёт миграция 0012: в SQLite — таблица FTS5 с
+    триггерами, в PostgreSQL — GIN-индекс по to_tsvector.
+    """
+    document = models.OneToOneField(
+        GeneratedDocument,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='search_text',
+        verbose_name='Документ'
+    )
+    
+    # Нормализованный текст: entrepreneurs.search.normalize
+    content = models.TextField(verbose_name='Текст')
+    
+    class Meta:
+        verbose_name = 'Текст для поиска'
+        verbose_name_plural = 'Тексты для поиска'
     
     def __str__(self):
-        return f"{self.document_type} от {self.created_at.strftime('%d.%m.%Y')}"
\ No newline at end of file
+        return f"Текст документа #{self.document_id}"
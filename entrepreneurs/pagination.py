@@ -0,0 +1,56 @@
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+
+
+def encode_cursor(created_at, pk):
+    raw = f'{created_at.isoformat()}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Возвращает (created_at, pk); при некорректном курсоре — ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, pk = raw.split('|')
+        return datetime.fromisoformat(created_at), int(pk)
+    except (TypeError, UnicodeDecodeError, ValueError, base64.binascii.Error):
+        raise ValueError('Некорректный курсор страницы')
+
+
+def _page_queryset(queryset, cursor, per_page):
+    queryset = queryset.order_by('-created_at', '-id')
+    if cursor:
+        created_at, pk = decode_cursor(cursor)
+        queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+    # Лишняя строка показывает, есть ли следующая страница
+    return queryset[:per_page + 1]
+
+
+def keyset_page(queryset, cursor=None, per_page=50):
+    """Страница по ключу (created_at, id) в порядке убывания.
+
+    В отличие от OFFSET запрос не просматривает предыдущие страницы, поэтому
+    время выборки не зависит от номера страницы и общего числа строк при
+    наличии индекса (entrepreneur, -created_at, -id). Строки могут быть
+    объектами модели или словарями из values().
+    """
+    return _split_page(list(_page_queryset(queryset, cursor, per_page)), per_page)
+
+
+async def akeyset_page(queryset, cursor=None, per_page=50):
+    """Асинхронная версия keyset_page"""
+    return _split_page([row async for row in _page_queryset(queryset, cursor, per_page)], per_page)
+
+
+def _split_page(rows, per_page):
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        last = rows[-1]
+        if isinstance(last, dict):
+            next_cursor = encode_cursor(last['created_at'], last['id'])
+        else:
+            next_cursor = encode_cursor(last.created_at, last.pk)
+    return rows, next_cursor
@@ -0,0 +1,421 @@
+"""Минимальная запись PDF без сторонних библиотек.
+
+Поддерживается ровно то, что нужно для документов: страницы A4, текст
+встроенным TrueType-шрифтом (подмножество глифов, кодировка Identity-H,
+поэтому кириллица отображается и копируется) и линии. Документ пишется в
+выходной поток постранично, размер памяти не зависит от числа страниц.
+Вывод детерминирован: одинаковые данные дают одинаковые байты.
+"""
+import hashlib
+import os
+import re
+import struct
+import zlib
+from functools import lru_cache
+
+A4 = (595.28, 841.89)
+
+# Таблицы, нужные для встраивания шрифта в PDF (PDF 32000, 9.9)
+_EMBEDDED_TABLES = ('cvt ', 'fpgm', 'glyf', 'head', 'hhea', 'hmtx', 'loca', 'maxp', 'prep')
+
+# Флаги составных глифов
+_ARG_1_AND_2_ARE_WORDS = 0x0001
+_WE_HAVE_A_SCALE = 0x0008
+_MORE_COMPONENTS = 0x0020
+_WE_HAVE_AN_X_AND_Y_SCALE = 0x0040
+_WE_HAVE_A_TWO_BY_TWO = 0x0080
+
+_TEXT_CACHE_SIZE = 4096
+
+
+def _checksum(data):
+    data += b'\0' * (-len(data) % 4)
+    return sum(struct.unpack(f'>{len(data) // 4}I', data)) & 0xFFFFFFFF
+
+
+def _build_sfnt(tables):
+    tags = sorted(tables)
+    count = len(tags)
+    entry_selector = count.bit_length() - 1
+    search_range = 16 * 2 ** entry_selector
+    header = [struct.pack('>IHHHH', 0x00010000, count, search_range, entry_selector, count * 16 - search_range)]
+    body = []
+    offset = 12 + 16 * count
+    for tag in tags:
+        data = tables[tag]
+        header.append(struct.pack('>4sIII', tag.encode('latin-1'), _checksum(data), offset, len(data)))
+        data += b'\0' * (-len(data) % 4)
+        body.append(data)
+        offset += len(data)
+    return b''.join(header + body)
+
+
+class TrueTypeFont:
+    """Метрики и глифы TrueType-шрифта (только outlines glyf)"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            self.data = data = file.read()
+        self.name = re.sub(r'[^A-Za-z0-9-]', '', os.path.splitext(os.path.basename(path))[0])
+
+        self.tables = {}
+        for index in range(struct.unpack_from('>H', data, 4)[0]):
+            tag, _, offset, length = struct.unpack_from('>4sIII', data, 12 + 16 * index)
+            self.tables[tag.decode('latin-1')] = (offset, length)
+        if 'glyf' not in self.tables:
+            raise ValueError(f'{path}: поддерживаются только TrueType-шрифты с таблицей glyf')
+
+        head = self.tables['head'][0]
+        units_per_em = struct.unpack_from('>H', data, head + 18)[0]
+        self.scale = 1000 / units_per_em
+        self.bbox = [round(value * self.scale) for value in struct.unpack_from('>4h', data, head + 36)]
+        self.long_loca = struct.unpack_from('>h', data, head + 50)[0] == 1
+
+        hhea = self.tables['hhea'][0]
+        ascent, descent = struct.unpack_from('>hh', data, hhea + 4)
+        self.ascent = round(ascent * self.scale)
+        self.descent = round(descent * self.scale)
+        metrics_count = struct.unpack_from('>H', data, hhea + 34)[0]
+        self.glyph_count = struct.unpack_from('>H', data, self.tables['maxp'][0] + 4)[0]
+
+        self.cap_height = self.ascent
+        if 'OS/2' in self.tables:
+            os2 = self.tables['OS/2'][0]
+            if struct.unpack_from('>H', data, os2)[0] >= 2:
+                self.cap_height = round(struct.unpack_from('>h', data, os2 + 88)[0] * self.scale)
+
+        advances = struct.unpack_from(f'>{metrics_count * 2}H', data, self.tables['hmtx'][0])[::2]
+        advances += (advances[-1],) * (self.glyph_count - metrics_count)
+        # Ширины в единицах PDF (1/1000 кегля)
+        self.widths = [round(advance * self.scale) for advance in advances]
+
+        loca = self.tables['loca'][0]
+        if self.long_loca:
+            self.loca = struct.unpack_from(f'>{self.glyph_count + 1}I', data, loca)
+        else:
+            self.loca = [offset * 2 for offset in struct.unpack_from(f'>{self.glyph_count + 1}H', data, loca)]
+
+        self.cmap = self._read_cmap()
+        self.char_widths = {chr(code): self.widths[glyph] for code, glyph in self.cmap.items()}
+
+    def _read_cmap(self):
+        data = self.data
+        cmap = self.tables['cmap'][0]
+        subtable = None
+        for index in range(struct.unpack_from('>H', data, cmap + 2)[0]):
+            platform, encoding, offset = struct.unpack_from('>HHI', data, cmap + 4 + 8 * index)
+            if (platform, encoding) in ((3, 1), (0, 3)) and struct.unpack_from('>H', data, cmap + offset)[0] == 4:
+                subtable = cmap + offset
+                break
+        if subtable is None:
+            raise ValueError(f'{self.name}: нет таблицы cmap формата 4')
+
+        segments = struct.unpack_from('>H', data, subtable + 6)[0] // 2
+        ends_at = subtable + 14
+        starts_at = ends_at + 2 * segments + 2
+        deltas_at = starts_at + 2 * segments
+        range_offsets_at = deltas_at + 2 * segments
+        ends = struct.unpack_from(f'>{segments}H', data, ends_at)
+        starts = struct.unpack_from(f'>{segments}H', data, starts_at)
+        deltas = struct.unpack_from(f'>{segments}h', data, deltas_at)
+        range_offsets = struct.unpack_from(f'>{segments}H', data, range_offsets_at)
+
+        cmap = {}
+        for index, (start, end, delta, range_offset) in enumerate(zip(starts, ends, deltas, range_offsets)):
+            for code in range(start, min(end, 0xFFFE) + 1):
+                if range_offset:
+                    address = range_offsets_at + 2 * index + range_offset + 2 * (code - start)
+                    glyph = struct.unpack_from('>H', data, address)[0]
+                    if glyph:
+                        glyph = (glyph + delta) & 0xFFFF
+                else:
+                    glyph = (code + delta) & 0xFFFF
+                if glyph:
+                    cmap[code] = glyph
+        return cmap
+
+    def _glyph(self, glyph):
+        start = self.tables['glyf'][0]
+        return self.data[start + self.loca[glyph]:start + self.loca[glyph + 1]]
+
+    def _components(self, glyph_data):
+        if len(glyph_data) < 10 or struct.unpack_from('>h', glyph_data, 0)[0] >= 0:
+            return
+        position = 10
+        while True:
+            flags, component = struct.unpack_from('>HH', glyph_data, position)
+            yield component
+            position += 4 + (4 if flags & _ARG_1_AND_2_ARE_WORDS else 2)
+            if flags & _WE_HAVE_A_SCALE:
+                position += 2
+            elif flags & _WE_HAVE_AN_X_AND_Y_SCALE:
+                position += 4
+            elif flags & _WE_HAVE_A_TWO_BY_TWO:
+                position += 8
+            if not flags & _MORE_COMPONENTS:
+                return
+
+    @lru_cache(maxsize=64)
+    def subset(self, glyphs):
+        """Файл шрифта, в котором оставлены только glyphs (frozenset) и их компоненты.
+
+        Номера глифов сохраняются, остальные глифы становятся пустыми, поэтому
+        ширины и CIDToGIDMap /Identity остаются верными. Возвращает
+        (длина несжатого файла, сжатый файл).
+        """
+        keep = set(glyphs) | {0}
+        pending = list(keep)
+        while pending:
+            for component in self._components(self._glyph(pending.pop())):
+                if component not in keep:
+                    keep.add(component)
+                    pending.append(component)
+
+        glyf = []
+        loca = [0]
+        offset = 0
+        for glyph in range(self.glyph_count):
+            if glyph in keep:
+                glyph_data = self._glyph(glyph)
+                glyph_data += b'\0' * (-len(glyph_data) % 4)
+                glyf.append(glyph_data)
+                offset += len(glyph_data)
+            loca.append(offset)
+
+        tables = {}
+        for tag in _EMBEDDED_TABLES:
+            if tag in self.tables:
+                start, length = self.tables[tag]
+                tables[tag] = self.data[start:start + length]
+        head = bytearray(tables['head'])
+        head[8:12] = b'\0\0\0\0'  # checkSumAdjustment
+        head[50:52] = struct.pack('>h', 1)  # длинный формат loca
+        tables['head'] = bytes(head)
+        tables['glyf'] = b''.join(glyf)
+        tables['loca'] = struct.pack(f'>{len(loca)}I', *loca)
+
+        font_file = _build_sfnt(tables)
+        return len(font_file), zlib.compress(font_file, 6)
+
+
+@lru_cache(maxsize=None)
+def load_font(path):
+    """Шрифт читается и разбирается один раз на процесс"""
+    return TrueTypeFont(path)
+
+
+class PdfFont:
+    """Шрифт внутри одного документа: запоминает использованные глифы"""
+
+    def __init__(self, font, resource_name, object_id):
+        self.font = font
+        self.resource_name = resource_name
+        self.object_id = object_id
+        self.used = {}
+        # В счетах много повторяющихся строк (единицы, цены), поэтому ширины
+        # и коды кешируются на время документа; размер кеша ограничен, чтобы
+        # память не росла с числом строк
+        self._widths = {}
+        self._encoded = {}
+
+    def width(self, text, size):
+        width = self._widths.get(text)
+        if width is None:
+            char_widths = self.font.char_widths
+            missing = self.font.widths[0]
+            if len(self._widths) >= _TEXT_CACHE_SIZE:
+                self._widths.clear()
+            width = self._widths[text] = sum([char_widths.get(char, missing) for char in text])
+        return width * size / 1000
+
+    def encode(self, text):
+        encoded = self._encoded.get(text)
+        if encoded is None:
+            cmap = self.font.cmap
+            glyphs = []
+            for char in text:
+                glyph = cmap.get(ord(char), 0)
+                self.used.setdefault(glyph, char)
+                glyphs.append(f'{glyph:04X}')
+            if len(self._encoded) >= _TEXT_CACHE_SIZE:
+                self._encoded.clear()
+            encoded = self._encoded[text] = ''.join(glyphs)
+        return encoded
+
+
+def _number(value):
+    return f'{value:.2f}'
+
+
+class PdfWriter:
+    """Пишет объекты PDF в поток и запоминает их смещения для таблицы xref"""
+
+    def __init__(self, out):
+        self.out = out
+        self.position = 0
+        self.offsets = {}
+        self.next_id = 1
+        self._write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def _write(self, data):
+        self.out.write(data)
+        self.position += len(data)
+
+    def reserve(self):
+        object_id = self.next_id
+        self.next_id += 1
+        return object_id
+
+    def write_object(self, object_id, body):
+        self.offsets[object_id] = self.position
+        self._write(f'{object_id} 0 obj\n{body}\nendobj\n'.encode('latin-1'))
+
+    def write_stream(self, object_id, chunks, dictionary=''):
+        """Сжимает и пишет поток по частям; длина пишется отдельным объектом после него"""
+        length_id = self.reserve()
+        self.offsets[object_id] = self.position
+        self._write(
+            f'{object_id} 0 obj\n<< /Length {length_id} 0 R /Filter /FlateDecode {dictionary}>>\nstream\n'
+            .encode('latin-1')
+        )
+        compressor = zlib.compressobj(6)
+        length = 0
+        for chunk in chunks:
+            data = compressor.compress(chunk)
+            if data:
+                self._write(data)
+                length += len(data)
+        data = compressor.flush()
+        self._write(data)
+        length += len(data)
+        self._write(b'\nendstream\nendobj\n')
+        self.write_object(length_id, str(length))
+
+    def write_compressed(self, object_id, data, dictionary=''):
+        self.offsets[object_id] = self.position
+        self._write(
+            f'{object_id} 0 obj\n<< /Length {len(data)} /Filter /FlateDecode {dictionary}>>\nstream\n'
+            .encode('latin-1')
+        )
+        self._write(data)
+        self._write(b'\nendstream\nendobj\n')
+
+    def close(self, root_id):
+        xref_position = self.position
+        lines = [f'xref\n0 {self.next_id}\n0000000000 65535 f \n']
+        lines.extend(f'{self.offsets[object_id]:010d} 00000 n \n' for object_id in range(1, self.next_id))
+        lines.append(f'trailer\n<< /Size {self.next_id} /Root {root_id} 0 R >>\nstartxref\n{xref_position}\n%%EOF\n')
+        self._write(''.join(lines).encode('latin-1'))
+
+
+class PdfDocument:
+    """Документ из страниц одного размера, которые пишутся в поток по мере готовности.
+
+    fonts — {ключ: путь к TrueType-шрифту}; в text() передаётся ключ.
+    """
+
+    def __init__(self, out, fonts, page_size=A4):
+        self.writer = PdfWriter(out)
+        self.page_size = page_size
+        self.pages_id = self.writer.reserve()
+        self.fonts = {
+            key: PdfFont(load_font(path), f'F{number}', self.writer.reserve())
+            for number, (key, path) in enumerate(sorted(fonts.items()), 1)
+        }
+        self.page_ids = []
+        self._content = None
+
+    def new_page(self):
+        self._finish_page()
+        self._content = [b'0.5 w\n']
+
+    def text(self, x, y, text, font, size):
+        font = self.fonts[font]
+        self._content.append(
+            f'BT /{font.resource_name} {_number(size)} Tf {_number(x)} {_number(y)} Td <{font.encode(text)}> Tj ET\n'
+            .encode('latin-1')
+        )
+
+    def lines(self, segments):
+        """Рисует отрезки [(x1, y1, x2, y2)] одним контуром"""
+        path = ''.join(f'{x1:.2f} {y1:.2f} m {x2:.2f} {y2:.2f} l ' for x1, y1, x2, y2 in segments)
+        self._content.append(f'{path}S\n'.encode('latin-1'))
+
+    def width(self, text, font, size):
+        return self.fonts[font].width(text, size)
+
+    def _finish_page(self):
+        if self._content is None:
+            return
+        writer = self.writer
+        content_id = writer.reserve()
+        page_id = writer.reserve()
+        writer.write_stream(content_id, [b''.join(self._content)])
+        fonts = ' '.join(f'/{font.resource_name} {font.object_id} 0 R' for font in self.fonts.values())
+        width, height = self.page_size
+        writer.write_object(
+            page_id,
+            f'<< /Type /Page /Parent {self.pages_id} 0 R /MediaBox [0 0 {_number(width)} {_number(height)}] '
+            f'/Resources << /Font << {fonts} >> >> /Contents {content_id} 0 R >>'
+        )
+        self.page_ids.append(page_id)
+        self._content = None
+
+    def _write_font(self, font):
+        writer = self.writer
+        descendant_id, descriptor_id, file_id, to_unicode_id = (writer.reserve() for _ in range(4))
+        glyphs = sorted(font.used)
+        # Тег подмножества зависит только от набора глифов — вывод детерминирован
+        tag = ''.join(chr(65 + byte % 26) for byte in hashlib.sha256(repr(glyphs).encode()).digest()[:6])
+        base_font = f'{tag}+{font.font.name}'
+        widths = ' '.join(f'{glyph} [{font.font.widths[glyph]}]' for glyph in glyphs)
+
+        writer.write_object(
+            font.object_id,
+            f'<< /Type /Font /Subtype /Type0 /BaseFont /{base_font} /Encoding /Identity-H '
+            f'/DescendantFonts [{descendant_id} 0 R] /ToUnicode {to_unicode_id} 0 R >>'
+        )
+        writer.write_object(
+            descendant_id,
+            f'<< /Type /Font /Subtype /CIDFontType2 /BaseFont /{base_font} '
+            f'/CIDSystemInfo << /Registry (Adobe) /Ordering (Identity) /Supplement 0 >> '
+            f'/FontDescriptor {descriptor_id} 0 R /W [{widths}] /CIDToGIDMap /Identity >>'
+        )
+        writer.write_object(
+            descriptor_id,
+            f'<< /Type /FontDescriptor /FontName /{base_font} /Flags 32 '
+            f'/FontBBox [{" ".join(map(str, font.font.bbox))}] /ItalicAngle 0 '
+            f'/Ascent {font.font.ascent} /Descent {font.font.descent} /CapHeight {font.font.cap_height} '
+            f'/StemV 80 /FontFile2 {file_id} 0 R >>'
+        )
+        length, data = font.font.subset(frozenset(glyphs))
+        writer.write_compressed(file_id, data, f'/Length1 {length} ')
+        writer.write_stream(to_unicode_id, [_to_unicode_cmap(font.used)])
+
+    def close(self):
+        self._finish_page()
+        for font in self.fonts.values():
+            self._write_font(font)
+        kids = ' '.join(f'{page_id} 0 R' for page_id in self.page_ids)
+        self.writer.write_object(self.pages_id, f'<< /Type /Pages /Kids [{kids}] /Count {len(self.page_ids)} >>')
+        catalog_id = self.writer.reserve()
+        self.writer.write_object(catalog_id, f'<< /Type /Catalog /Pages {self.pages_id} 0 R >>')
+        self.writer.close(catalog_id)
+
+
+def _to_unicode_cmap(used):
+    lines = [
+        '/CIDInit /ProcSet findresource begin\n12 dict begin\nbegincmap\n'
+        '/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) /Supplement 0 >> def\n'
+        '/CMapName /Adobe-Identity-UCS def\n/CMapType 2 def\n'
+        '1 begincodespacerange\n<0000> <FFFF>\nendcodespacerange\n'
+    ]
+    mapping = sorted(used.items())
+    # В одном блоке bfchar допускается не более 100 записей
+    for start in range(0, len(mapping), 100):
+        block = mapping[start:start + 100]
+        lines.append(f'{len(block)} beginbfchar\n')
+        lines.extend(f'<{glyph:04X}> <{char.encode("utf-16-be").hex().upper()}>\n' for glyph, char in block)
+        lines.append('endbfchar\n')
+    lines.append('endcmap\nCMapName currentdict /CMap defineresource pop\nend\nend\n')
+    return ''.join(lines).encode('latin-1')
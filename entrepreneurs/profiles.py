@@ -0,0 +1,103 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.http import Http404
+
+from .models import BankDetails, EntrepreneurProfile
+
+_REQUEST_ATTR = '_entrepreneur_profile'
+
+
+def _cache():
+    return caches[settings.ENTREPRENEUR_CACHE_ALIAS]
+
+
+def cache_timeout(cache, timeout):
+    """Время жизни записи: в кеше процесса не дольше ENTREPRENEUR_LOCAL_CACHE_TIMEOUT.
+
+    Сброс кеша при изменении данных доходит только до кеша того процесса,
+    который их изменил, поэтому в LocMemCache остальные процессы видят
+    старые данные не дольше этого срока. В общем кеше (Redis, Memcached)
+    действует timeout.
+    """
+    if isinstance(cache, LocMemCache):
+        return min(timeout, settings.ENTREPRENEUR_LOCAL_CACHE_TIMEOUT)
+    return timeout
+
+
+def _cache_key(user_id):
+    return f'entrepreneur-profile:{user_id}'
+
+
+def get_entrepreneur(request):
+    """Профиль предпринимателя текущего пользователя вместе с банковскими реквизитами.
+
+    Профиль загружается одним запросом с select_related('bank_details') и
+    кешируется на время запроса и в кеше ENTREPRENEUR_CACHE_ALIAS, поэтому
+    entrepreneur.bank_details не обращается к БД (а при отсутствии реквизитов
+    сразу бросает BankDetails.DoesNotExist). Данные могут отставать от БД на
+    время жизни кеша (cache_timeout), поэтому для записи реквизиты нужно
+    читать из БД заново. Возвращает None, если профиля нет.
+    """
+    if hasattr(request, _REQUEST_ATTR):
+        return getattr(request, _REQUEST_ATTR)
+
+    key = _cache_key(request.user.pk)
+    entrepreneur = _cache().get(key)
+    if entrepreneur is None:
+        entrepreneur = (
+            EntrepreneurProfile.objects.select_related('bank_details').filter(user_id=request.user.pk).first()
+        )
+        if entrepreneur is not None:
+            _cache().set(key, entrepreneur, cache_timeout(_cache(), settings.ENTREPRENEUR_CACHE_TIMEOUT))
+    setattr(request, _REQUEST_ATTR, entrepreneur)
+    return entrepreneur
+
+
+def get_entrepreneur_or_404(request):
+    entrepreneur = get_entrepreneur(request)
+    if entrepreneur is None:
+        raise Http404('Профиль предпринимателя не найден')
+    return entrepreneur
+
+
+async def aget_entrepreneur(request):
+    """Асинхронная версия get_entrepreneur для асинхронных представлений"""
+    if hasattr(request, _REQUEST_ATTR):
+        return getattr(request, _REQUEST_ATTR)
+
+    key = _cache_key(request.user.pk)
+    entrepreneur = await _cache().aget(key)
+    if entrepreneur is None:
+        entrepreneur = await (
+            EntrepreneurProfile.objects.select_related('bank_details').filter(user_id=request.user.pk).afirst()
+        )
+        if entrepreneur is not None:
+            await _cache().aset(key, entrepreneur, cache_timeout(_cache(), settings.ENTREPRENEUR_CACHE_TIMEOUT))
+    setattr(request, _REQUEST_ATTR, entrepreneur)
+    return entrepreneur
+
+
+async def aget_entrepreneur_or_404(request):
+    entrepreneur = await aget_entrepreneur(request)
+    if entrepreneur is None:
+        raise Http404('Профиль предпринимателя не найден')
+    return entrepreneur
+
+
+def invalidate_entrepreneur(user_id):
+    _cache().delete(_cache_key(user_id))
+
+
+@receiver([post_save, post_delete], sender=EntrepreneurProfile)
+def _profile_changed(sender, instance, **kwargs):
+    invalidate_entrepreneur(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=BankDetails)
+def _bank_details_changed(sender, instance, **kwargs):
+    user_id = EntrepreneurProfile.objects.filter(pk=instance.entrepreneur_id).values_list('user_id', flat=True).first()
+    if user_id is not None:
+        invalidate_entrepreneur(user_id)
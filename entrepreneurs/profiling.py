@@ -0,0 +1,304 @@
+"""Профилирование запросов: время ответа, запросы к БД и время шаблонов.
+
+RequestProfilingMiddleware включается настройкой REQUEST_PROFILING и копит
+статистику в памяти процесса, по имени представления: гистограмму времени
+ответа с экспоненциальными корзинами (p50/p95/p99 по ней), число и время
+запросов к БД и время участков, отмеченных timed(). Статистика у каждого
+процесса своя; при нескольких процессах её собирают с каждого через
+текстовую страницу метрик.
+
+Middleware работает и в синхронной, и в асинхронной цепочке. Запросы к БД
+считает обёртка, которая ставится на соединения каждого потока и берёт
+замеры текущего запроса из contextvar, поэтому учитываются и вызовы ORM
+из потоков sync_to_async.
+"""
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.template.backends.django import DjangoTemplates
+
+# Верхние границы корзин в секундах: от 1 мс до ~1 минуты с шагом 25%,
+# поэтому оценка перцентиля ошибается не больше чем на ширину корзины
+BUCKETS = tuple(0.001 * 1.25 ** n for n in range(50))
+QUANTILES = (0.5, 0.95, 0.99)
+
+_current = ContextVar('request_profile', default=None)
+
+
+class RequestProfile:
+    """Замеры одного запроса"""
+
+    __slots__ = ('queries', 'db_time', 'sections')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.sections = {}
+
+    def add(self, section, elapsed):
+        self.sections[section] = self.sections.get(section, 0.0) + elapsed
+
+    def db_wrapper(self, execute, sql, params, many, context):
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += perf_counter() - started
+
+
+@contextmanager
+def timed(section):
+    """Добавляет время блока к участку section текущего запроса (если профилирование включено)"""
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+    started = perf_counter()
+    try:
+        yield
+    finally:
+        profile.add(section, perf_counter() - started)
+
+
+class ViewStats:
+    __slots__ = ('count', 'buckets', 'total', 'queries', 'db_time', 'sections')
+
+    def __init__(self):
+        self.count = 0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.queries = 0
+        self.db_time = 0.0
+        self.sections = {}
+
+    def quantile(self, q):
+        """Оценка перцентиля линейной интерполяцией внутри корзины"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.buckets):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = BUCKETS[index - 1] if index else 0.0
+                upper = BUCKETS[index] if index < len(BUCKETS) else lower
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return BUCKETS[-1]
+
+
+class ProfileRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def record(self, view, elapsed, profile):
+        bucket = bisect_left(BUCKETS, elapsed)
+        with self._lock:
+            stats = self._views.get(view)
+            if stats is None:
+                stats = self._views[view] = ViewStats()
+            stats.count += 1
+            stats.buckets[bucket] += 1
+            stats.total += elapsed
+            stats.queries += profile.queries
+            stats.db_time += profile.db_time
+            for section, section_time in profile.sections.items():
+                stats.sections[section] = stats.sections.get(section, 0.0) + section_time
+
+    def snapshot(self):
+        """Копия статистики {представление: ViewStats}, согласованная на момент вызова"""
+        with self._lock:
+            snapshot = {}
+            for view, stats in self._views.items():
+                copy = snapshot[view] = ViewStats()
+                copy.count, copy.total = stats.count, stats.total
+                copy.queries, copy.db_time = stats.queries, stats.db_time
+                copy.buckets = list(stats.buckets)
+                copy.sections = dict(stats.sections)
+            return snapshot
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+
+registry = ProfileRegistry()
+
+
+def _db_wrapper(execute, sql, params, many, context):
+    profile = _current.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    return profile.db_wrapper(execute, sql, params, many, context)
+
+
+def _instrument(connection):
+    if _db_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_db_wrapper)
+
+
+def _instrument_connections():
+    """Ставит обёртку на соединения текущего потока"""
+    for connection in connections.all():
+        _instrument(connection)
+
+
+@receiver(connection_created)
+def _instrument_new_connection(sender, connection, **kwargs):
+    if settings.REQUEST_PROFILING:
+        _instrument(connection)
+
+
+class RequestProfilingMiddleware:
+    """Замеряет каждый запрос; без REQUEST_PROFILING Django не подключает middleware"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_PROFILING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        _instrument_connections()
+        profile = RequestProfile()
+        token = _current.set(profile)
+        started = perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self._record(request, perf_counter() - started, profile)
+        return response
+
+    async def __acall__(self, request):
+        # ORM асинхронных представлений работает в потоке sync_to_async
+        await sync_to_async(_instrument_connections)()
+        profile = RequestProfile()
+        token = _current.set(profile)
+        started = perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self._record(request, perf_counter() - started, profile)
+        return response
+
+    def _record(self, request, elapsed, profile):
+        match = request.resolver_match
+        registry.record(match.view_name if match else '<не найдено>', elapsed, profile)
+
+
+class _ProfiledTemplate:
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        with timed('template'):
+            return self.template.render(context, request)
+
+
+class ProfiledDjangoTemplates(DjangoTemplates):
+    """Шаблоны Django с замером времени рендеринга для профилирования"""
+
+    def from_string(self, template_code):
+        return _ProfiledTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return _ProfiledTemplate(super().get_template(template_name))
+
+
+def _label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"')
+
+
+def render_metrics(snapshot):
+    """Статистика в текстовом формате Prometheus"""
+    lines = [
+        '# HELP diplom_request_duration_seconds Время ответа по представлениям',
+        '# TYPE diplom_request_duration_seconds histogram',
+    ]
+    for view, stats in sorted(snapshot.items()):
+        label = f'view="{_label(view)}"'
+        cumulative = 0
+        for upper, bucket_count in zip(BUCKETS, stats.buckets):
+            cumulative += bucket_count
+            lines.append(f'diplom_request_duration_seconds_bucket{{{label},le="{upper:.6g}"}} {cumulative}')
+        lines.append(f'diplom_request_duration_seconds_bucket{{{label},le="+Inf"}} {stats.count}')
+        lines.append(f'diplom_request_duration_seconds_sum{{{label}}} {stats.total:.6f}')
+        lines.append(f'diplom_request_duration_seconds_count{{{label}}} {stats.count}')
+
+    lines += [
+        '# HELP diplom_request_duration_quantile_seconds Оценка перцентилей времени ответа',
+        '# TYPE diplom_request_duration_quantile_seconds gauge',
+    ]
+    for view, stats in sorted(snapshot.items()):
+        for q in QUANTILES:
+            lines.append(
+                f'diplom_request_duration_quantile_seconds{{view="{_label(view)}",quantile="{q}"}} '
+                f'{stats.quantile(q):.6f}'
+            )
+
+    lines += [
+        '# HELP diplom_request_db_queries_total Запросы к БД',
+        '# TYPE diplom_request_db_queries_total counter',
+    ]
+    lines += [
+        f'diplom_request_db_queries_total{{view="{_label(view)}"}} {stats.queries}'
+        for view, stats in sorted(snapshot.items())
+    ]
+    lines += [
+        '# HELP diplom_request_db_seconds_total Время запросов к БД',
+        '# TYPE diplom_request_db_seconds_total counter',
+    ]
+    lines += [
+        f'diplom_request_db_seconds_total{{view="{_label(view)}"}} {stats.db_time:.6f}'
+        for view, stats in sorted(snapshot.items())
+    ]
+    lines += [
+        '# HELP diplom_request_section_seconds_total Время участков запроса (шаблоны; рендеринг счетов при DOCUMENT_JOBS_EAGER)',
+        '# TYPE diplom_request_section_seconds_total counter',
+    ]
+    for view, stats in sorted(snapshot.items()):
+        for section, section_time in sorted(stats.sections.items()):
+            lines.append(
+                f'diplom_request_section_seconds_total{{view="{_label(view)}",section="{_label(section)}"}} '
+                f'{section_time:.6f}'
+            )
+    return '\n'.join(lines) + '\n'
+
+
+def summary(snapshot):
+    """Строки для страницы производительности: перцентили и средние на запрос, в миллисекундах"""
+    rows = []
+    for view, stats in sorted(snapshot.items(), key=lambda item: -item[1].total):
+        rows.append({
+            'view': view,
+            'count': stats.count,
+            'p50': stats.quantile(0.5) * 1000,
+            'p95': stats.quantile(0.95) * 1000,
+            'p99': stats.quantile(0.99) * 1000,
+            'mean': stats.total / stats.count * 1000,
+            'queries': stats.queries / stats.count,
+            'db': stats.db_time / stats.count * 1000,
+            'template': stats.sections.get('template', 0.0) / stats.count * 1000,
+        })
+    return rows
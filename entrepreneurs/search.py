@@ -0,0 +1,115 @@
+"""Полнотекстовый поиск по сформированным документам.
+
+Для каждого документа хранится нормализованный текст (DocumentSearchText):
+номер, заказчик, ИНН, адрес, даты, суммы и наименования позиций. Текст
+пишется в той же транзакции, что и счёт (index_invoices), а для документов,
+сформированных раньше, его восстанавливает команда index_documents, в том
+числе из DOCX-файлов. Индекс строит сама БД (миграция 0012): в SQLite —
+таблица FTS5, в PostgreSQL — GIN-индекс по to_tsvector.
+"""
+import re
+
+from django.db import connections
+from django.db.models.expressions import RawSQL
+from docx import Document
+
+from .models import DocumentSearchText
+
+# Конфигурация to_tsvector в PostgreSQL: русская морфология («счета» находит
+# «счёт»). Менять вместе с индексом из миграции 0012
+SEARCH_CONFIG = 'russian'
+FTS_TABLE = 'entrepreneurs_documentsearch_fts'
+
+_WORD_RE = re.compile(r'[^\W_]+')
+
+
+def words(text):
+    """Слова текста в нижнем регистре, ё → е; точки и дефисы в датах и суммах — разделители"""
+    return _WORD_RE.findall(text.lower().replace('ё', 'е'))
+
+
+def normalize(*parts):
+    """Текст для индекса: слова частей через пробел.
+
+    Обе СУБД получают одинаково разбитый текст, поэтому «01.06.2025» и
+    «1206.00» в запросе ищутся как фразы из тех же слов.
+    """
+    return ' '.join(word for part in parts if part for word in words(str(part)))
+
+
+def invoice_search_text(invoice, descriptions):
+    dates = [invoice.date, invoice.payment_due_date]
+    return normalize(
+        f'Счёт на оплату № {invoice.number}' if invoice.number else 'Счёт на оплату',
+        invoice.customer_name,
+        invoice.customer_address,
+        f'ИНН {invoice.customer_inn}',
+        *(f'{value:%d.%m.%Y} {value.isoformat()}' for value in dates),
+        *(f'{value:.2f}' for value in (invoice.net_total, invoice.vat_total, invoice.total)),
+        *descriptions,
+    )
+
+
+def docx_text(path):
+    """Текст DOCX-файла: абзацы и ячейки таблиц (выполняется в пуле процессов index_documents)"""
+    document = Document(path)
+    parts = [paragraph.text for paragraph in document.paragraphs]
+    for table in document.tables:
+        for row in table.rows:
+            previous = None
+            for cell in row.cells:
+                # Объединённая ячейка повторяется в row.cells для каждой колонки
+                if cell.text != previous:
+                    parts.append(cell.text)
+                previous = cell.text
+    return normalize(*parts)
+
+
+def store_texts(texts):
+    """Сохраняет {id документа: текст}; тексты уже проиндексированных документов заменяются"""
+    DocumentSearchText.objects.bulk_create(
+        [DocumentSearchText(document_id=pk, content=content) for pk, content in texts.items()],
+        update_conflicts=True,
+        unique_fields=['document'],
+        update_fields=['content'],
+        batch_size=500,
+    )
+
+
+def index_invoices(invoices):
+    """Индексирует документы счетов: [(счёт с document_id, наименования позиций)].
+
+    Вызывается в транзакции, создающей документы, поэтому документ находится
+    поиском сразу, как появился в списке.
+    """
+    store_texts({
+        invoice.document_id: invoice_search_text(invoice, descriptions)
+        for invoice, descriptions in invoices
+    })
+
+
+def search_documents(documents, query):
+    """Документы из queryset documents, в тексте которых есть все слова запроса.
+
+    Слова, записанные слитно через знаки препинания («01.06.2025»), ищутся
+    фразой; последнее слово фразы — по началу, чтобы поиск работал по мере
+    набора. Совпадения выбираются по полнотекстовому индексу подзапросом,
+    сортировка и постраничный вывод остаются за вызывающим кодом.
+    """
+    phrases = [phrase for phrase in map(words, query.split()) if phrase]
+    if not phrases:
+        return documents.none()
+
+    if connections[documents.db].vendor == 'sqlite':
+        match = ' '.join('"{}"*'.format(' '.join(phrase)) for phrase in phrases)
+        matches = RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', (match,))
+    else:
+        # Импорт здесь: django.contrib.postgres требует драйвер PostgreSQL
+        from django.contrib.postgres.search import SearchQuery, SearchVector
+        tsquery = ' & '.join(' <-> '.join(phrase) + ':*' for phrase in phrases)
+        matches = DocumentSearchText.objects.annotate(
+            vector=SearchVector('content', config=SEARCH_CONFIG)
+        ).filter(
+            vector=SearchQuery(tsquery, config=SEARCH_CONFIG, search_type='raw')
+        ).values('document_id')
+    return documents.filter(pk__in=matches)
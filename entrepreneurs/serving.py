@@ -0,0 +1,167 @@
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import content_disposition_header
+
+from .storage import BLOBS_DIR
+
+SERVE_PYTHON = 'python'
+SERVE_X_SENDFILE = 'x-sendfile'
+SERVE_X_ACCEL_REDIRECT = 'x-accel-redirect'
+
+RANGE_CHUNK_SIZE = 64 * 1024
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+_BLOB_RE = re.compile(rf'^{BLOBS_DIR}/[0-9a-f]{{2}}/[0-9a-f]{{2}}/([0-9a-f]{{64}})[^/]*$')
+
+
+def file_etag(file):
+    """ETag файла документа.
+
+    Для файлов хранилища по содержимому это хеш из имени — без обращения к
+    диску; для старых файлов — слабый тег по размеру и времени изменения.
+    """
+    match = _BLOB_RE.match(file.name)
+    if match:
+        return f'"{match.group(1)}"'
+    stat = os.stat(file.path)
+    return f'W/"{stat.st_size:x}-{int(stat.st_mtime):x}"'
+
+
+def parse_range(header, size):
+    """Разбирает заголовок Range с одним диапазоном.
+
+    Возвращает (start, end) включительно, None, если заголовок не поддерживается
+    (тогда отдаётся весь файл), или ValueError для невыполнимого диапазона.
+    """
+    match = _RANGE_RE.match(header.replace(' ', ''))
+    if not match or match.groups() == ('', ''):
+        return None
+    start, end = match.groups()
+    if not start:
+        # bytes=-N: последние N байт
+        length = int(end)
+        if not length:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start > end:
+        raise ValueError(header)
+    return start, end
+
+
+def _read_range(file, start, length):
+    with file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(RANGE_CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+async def _aread_range(file, start, length):
+    """Как _read_range, но читает файл в пуле потоков, не блокируя цикл событий.
+
+    Пока медленный клиент принимает очередной фрагмент, ASGI-сервер обслуживает
+    другие запросы, а не держит под скачивание отдельный поток.
+    """
+    read = sync_to_async(file.read, thread_sensitive=False)
+    try:
+        await sync_to_async(file.seek, thread_sensitive=False)(start)
+        while length > 0:
+            chunk = await read(min(RANGE_CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        file.close()
+
+
+def _python_response(request, document, etag, asynchronous=False):
+    read_range = _aread_range if asynchronous else _read_range
+    file = document.file.open('rb')
+    size = document.file.size
+    byte_range = None
+    range_header = request.META.get('HTTP_RANGE')
+    # If-Range с другим ETag означает, что у клиента устаревшая часть файла.
+    # Слабый ETag для If-Range не годится (RFC 9110, 13.1.5): отдаём весь файл
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if range_header and (if_range is None or (if_range == etag and not etag.startswith('W/'))):
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            file.close()
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    if byte_range is None:
+        response = StreamingHttpResponse(read_range(file, 0, size))
+        response['Content-Length'] = str(size)
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(read_range(file, start, end - start + 1), status=206)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(end - start + 1)
+    return response
+
+
+def _offloaded_response(document, mode):
+    # Тело и диапазоны отдаёт фронтовой веб-сервер
+    response = HttpResponse()
+    if mode == SERVE_X_SENDFILE:
+        response['X-Sendfile'] = document.file.path
+    else:
+        prefix = settings.DOCUMENT_ACCEL_REDIRECT_PREFIX.rstrip('/')
+        response['X-Accel-Redirect'] = f'{prefix}/{quote(document.file.name)}'
+    return response
+
+
+def serve_document(request, document, asynchronous=False):
+    """Отдаёт файл документа, права на который уже проверены вызывающим.
+
+    Режим задаёт DOCUMENT_SERVE_MODE: python — файл читает Django (для
+    разработки), x-sendfile (Apache mod_xsendfile) или x-accel-redirect (nginx) —
+    Django возвращает только внутреннее перенаправление. If-None-Match
+    обрабатывается в любом режиме, Range — в режиме python, в остальных его
+    выполняет веб-сервер. asynchronous=True отдаёт тело асинхронным итератором
+    (для ASGI); под WSGI Django пришлось бы сначала прочитать его целиком.
+    """
+    mode = settings.DOCUMENT_SERVE_MODE
+    etag = file_etag(document.file)
+
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        if mode == SERVE_PYTHON:
+            response = _python_response(request, document, etag, asynchronous)
+        elif mode in (SERVE_X_SENDFILE, SERVE_X_ACCEL_REDIRECT):
+            response = _offloaded_response(document, mode)
+        else:
+            raise ValueError(f'Неизвестный DOCUMENT_SERVE_MODE: {mode}')
+
+        if response.status_code != 416:
+            filename = document.download_name
+            response['Content-Type'] = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+            response['Content-Disposition'] = content_disposition_header(True, filename)
+            response['Accept-Ranges'] = 'bytes'
+
+    response['ETag'] = etag
+    # Ответ зависит от пользователя; браузер переспрашивает с If-None-Match
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+async def aserve_document(request, document):
+    """Асинхронная версия serve_document: заголовки готовятся в пуле потоков
+    (stat и открытие файла), тело читается асинхронно"""
+    return await sync_to_async(serve_document, thread_sensitive=False)(request, document, asynchronous=True)
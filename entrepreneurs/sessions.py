@@ -0,0 +1,38 @@
+"""Сессии в локальном кеше процесса с записью в БД.
+
+Подключается через SESSION_ENGINE = 'entrepreneurs.sessions'. Чтение идёт из
+кеша SESSION_CACHE_ALIAS, запись — в кеш и в django_session, как у
+django.contrib.sessions.backends.cached_db. Отличие в том, что данные живут в
+кеше не дольше SESSION_LOCAL_CACHE_TIMEOUT: у каждого процесса свой кеш, и
+выход из системы, сделанный в одном процессе, виден в остальных не позже
+этого срока.
+"""
+from django.conf import settings
+from django.contrib.sessions.backends import cached_db
+
+
+class SessionStore(cached_db.SessionStore):
+    cache_key_prefix = 'entrepreneurs.sessions'
+
+    def _cache_timeout(self, **kwargs):
+        return min(self.get_expiry_age(**kwargs), settings.SESSION_LOCAL_CACHE_TIMEOUT)
+
+    def load(self):
+        try:
+            data = self._cache.get(self.cache_key)
+        except Exception:
+            # Некорректный ключ для бэкенда кеша — сессия начинается заново
+            data = None
+
+        if data is None:
+            session = self._get_session_from_db()
+            if session:
+                data = self.decode(session.session_data)
+                self._cache.set(self.cache_key, data, self._cache_timeout(expiry=session.expire_date))
+            else:
+                data = {}
+        return data
+
+    def save(self, must_create=False):
+        super(cached_db.SessionStore, self).save(must_create)
+        self._cache.set(self.cache_key, self._session, self._cache_timeout())
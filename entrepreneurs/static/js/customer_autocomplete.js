@@ -0,0 +1,83 @@
+document.addEventListener('DOMContentLoaded', function() {
+    const container = document.getElementById('customer-fields');
+    const menu = document.getElementById('customer-suggestions');
+    const nameInput = document.getElementById('id_customer_name');
+    const addressInput = document.getElementById('id_customer_address');
+    const innInput = document.getElementById('id_customer_inn');
+    if (!container || !menu || !nameInput || !addressInput || !innInput) {
+        return;
+    }
+
+    // Ответы уже запрошенных префиксов: при стирании символов запросов нет
+    const answers = new Map();
+    let timer = null;
+    let lastQuery = '';
+
+    function hide() {
+        menu.classList.remove('show');
+        menu.replaceChildren();
+    }
+
+    function fill(customer) {
+        nameInput.value = customer.name;
+        addressInput.value = customer.address;
+        innInput.value = customer.inn;
+        hide();
+    }
+
+    function show(input, customers) {
+        menu.replaceChildren();
+        customers.forEach(customer => {
+            const item = document.createElement('button');
+            item.type = 'button';
+            item.className = 'dropdown-item';
+            item.textContent = customer.name + ' — ИНН ' + customer.inn;
+            item.addEventListener('mousedown', event => {
+                // mousedown раньше blur поля, иначе список скроется до выбора
+                event.preventDefault();
+                fill(customer);
+            });
+            menu.appendChild(item);
+        });
+        menu.style.top = (input.offsetTop + input.offsetHeight) + 'px';
+        menu.style.left = input.offsetLeft + 'px';
+        menu.classList.toggle('show', customers.length > 0);
+    }
+
+    function suggest(input) {
+        const query = input.value.trim();
+        lastQuery = query;
+        if (!query) {
+            hide();
+            return;
+        }
+        if (answers.has(query)) {
+            show(input, answers.get(query));
+            return;
+        }
+        fetch(container.dataset.url + '?q=' + encodeURIComponent(query))
+            .then(response => response.json())
+            .then(data => {
+                answers.set(query, data.customers);
+                // Ответ на устаревший запрос не показываем
+                if (query === lastQuery) {
+                    show(input, data.customers);
+                }
+            })
+            .catch(hide);
+    }
+
+    [nameInput, innInput].forEach(input => {
+        input.setAttribute('autocomplete', 'off');
+        input.addEventListener('input', () => {
+            clearTimeout(timer);
+            timer = setTimeout(() => suggest(input), 150);
+        });
+        input.addEventListener('blur', hide);
+    });
+    document.addEventListener('keydown', event => {
+        if (event.key === 'Escape') {
+            hide();
+        }
+    });
+});
@@ -0,0 +1,77 @@
+document.addEventListener('DOMContentLoaded', function() {
+    const loadMore = document.getElementById('load-more');
+    const tbody = document.getElementById('documents-body');
+    if (!loadMore || !tbody) {
+        return;
+    }
+
+    function cell(content) {
+        const td = document.createElement('td');
+        if (content instanceof Node) {
+            td.appendChild(content);
+        } else {
+            td.textContent = content;
+        }
+        return td;
+    }
+
+    function link(href, text, className) {
+        const a = document.createElement('a');
+        a.href = href;
+        a.textContent = text;
+        a.className = className;
+        return a;
+    }
+
+    function appendRow(doc) {
+        const row = document.createElement('tr');
+        const checkbox = document.createElement('input');
+        const actions = document.createElement('span');
+
+        if (doc.status === 'ready') {
+            checkbox.type = 'checkbox';
+            checkbox.className = 'form-check-input';
+            checkbox.name = 'ids';
+            checkbox.value = doc.id;
+        }
+
+        actions.appendChild(link(doc.detail_url, 'Просмотр', 'btn btn-sm btn-info'));
+        if (doc.status === 'ready') {
+            actions.appendChild(document.createTextNode(' '));
+            actions.appendChild(link(doc.download_url, 'Скачать', 'btn btn-sm btn-success'));
+        }
+
+        row.appendChild(doc.status === 'ready' ? cell(checkbox) : cell(''));
+        row.appendChild(cell(doc.document_type));
+        row.appendChild(cell(doc.created_at));
+        row.appendChild(cell(doc.status_display));
+        row.appendChild(cell(actions));
+        tbody.appendChild(row);
+    }
+
+    // Подгружаем следующую страницу по курсору без перезагрузки
+    loadMore.addEventListener('click', function(event) {
+        event.preventDefault();
+        loadMore.classList.add('disabled');
+
+        // Строка поиска передаётся вместе с курсором: следующая страница тех же результатов
+        const params = new URLSearchParams({cursor: loadMore.dataset.cursor});
+        if (loadMore.dataset.query) {
+            params.set('q', loadMore.dataset.query);
+        }
+        fetch(loadMore.dataset.url + '?' + params)
+            .then(response => response.json())
+            .then(data => {
+                data.documents.forEach(appendRow);
+                if (data.next_cursor) {
+                    loadMore.dataset.cursor = data.next_cursor;
+                    params.set('cursor', data.next_cursor);
+                    loadMore.href = '?' + params;
+                    loadMore.classList.remove('disabled');
+                } else {
+                    loadMore.remove();
+                }
+            })
+            .catch(() => loadMore.classList.remove('disabled'));
+    });
+});
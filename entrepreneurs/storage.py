@@ -0,0 +1,79 @@
+import hashlib
+import os
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+BLOBS_DIR = 'blobs'
+
+
+@deconstructible(path='entrepreneurs.storage.ContentAddressedStorage')
+class ContentAddressedStorage(FileSystemStorage):
+    """Файловое хранилище с адресацией по содержимому.
+
+    Файл сохраняется под именем blobs/ab/cd/<sha256><расширение>, поэтому
+    одинаковое содержимое хранится на диске один раз, сколько бы документов
+    на него ни ссылалось. Ссылки — это строки GeneratedDocument с тем же
+    именем файла; неиспользуемые blob-файлы удаляет команда collect_document_blobs.
+    Файлы, сохранённые до появления хранилища, открываются по прежним путям.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # Имя определяется содержимым в _save, подбирать свободное не нужно
+        return name
+
+    def blob_name(self, digest, extension):
+        return f'{BLOBS_DIR}/{digest[:2]}/{digest[2:4]}/{digest}{extension}'
+
+    def _save(self, name, content):
+        extension = os.path.splitext(name)[1].lower()
+        directory = self.path(BLOBS_DIR)
+        os.makedirs(directory, exist_ok=True)
+
+        # Пишем во временный файл, одновременно считая хеш, затем атомарно
+        # переименовываем. Параллельная запись того же содержимого безопасна:
+        # os.replace заменит файл идентичным.
+        digest = hashlib.sha256()
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as temp_file:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    temp_file.write(chunk)
+
+            blob_name = self.blob_name(digest.hexdigest(), extension)
+            full_path = self.path(blob_name)
+            if os.path.exists(full_path):
+                # Обновляем mtime, чтобы сборщик мусора не удалил blob в окне
+                # между сохранением файла и записью ссылки в БД
+                os.utime(full_path)
+                os.remove(temp_path)
+                return blob_name
+
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            if self.file_permissions_mode is not None:
+                os.chmod(temp_path, self.file_permissions_mode)
+            os.replace(temp_path, full_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        return blob_name
+
+    def iter_blobs(self):
+        """Перебирает (имя, размер, mtime) файлов в каталоге blob-ов.
+
+        Временные файлы прерванных записей тоже попадают в выборку.
+        """
+        root = self.path(BLOBS_DIR)
+        for dirpath, dirnames, filenames in os.walk(root):
+            for filename in filenames:
+                full_path = os.path.join(dirpath, filename)
+                stat = os.stat(full_path)
+                name = os.path.relpath(full_path, self.location).replace(os.sep, '/')
+                yield name, stat.st_size, stat.st_mtime
+
+
+document_storage = ContentAddressedStorage()
@@ -1,3 +1,1411 @@
-from django.test import TestCase
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import tracemalloc
+import zlib
+from bisect import bisect_left
+from datetime import date, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+from zipfile import ZipFile
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.messages.middleware import MessageMiddleware
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.core.cache import cache, caches
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.http import Http404
+from django.test import (
+    AsyncRequestFactory,
+    Client,
+    LiveServerTestCase,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.urls import resolve, reverse
+from django.utils import timezone
+
+from . import profiling, views
+from .accounts import save_new_user, users_by_email
+from .archive import ARCHIVE_CHUNK_SIZE, stream_documents_zip
+from .batch import BatchError, clean_batch, generate_batch, read_batch
+from .benchmarks import compare, measure, sample_invoice
+from .checks import EMAIL_INDEX, SEARCH_INDEX, SEARCH_TRIGGERS, check_email_index, check_search_index
+from .customers import autocomplete, find_customers, remember_customers, search_customers
+from .database import is_locked_error, retry_on_locked
+from .documents import generate_invoice, generate_invoice_docx, render_invoices, stream_invoice
+from .forms import CustomAuthenticationForm, EntrepreneurRegistrationForm
+from .invoices import allocate_invoice_numbers, save_invoice_draft
+from .jobs import claim_job, enqueue_invoice, work
+from .management.commands.benchmark_totals import reference_totals, sample_items
+from .models import (
+    BankDetails,
+    Customer,
+    DocumentJob,
+    DocumentSearchText,
+    EntrepreneurProfile,
+    GeneratedDocument,
+    Invoice,
+    InvoiceLine,
+    SpareInvoiceNumber,
+)
+from .profiles import cache_timeout
+from .search import search_documents
+from .storage import document_storage
+from .totals import compute_totals, footer_rows, totals_from_net
+
+
+def package_parts(file_stream):
+    with ZipFile(file_stream) as package:
+        return {info.filename: package.read(info) for info in package.infolist()}
+
+
+class InvoiceTemplateTests(SimpleTestCase):
+    def test_parts_match_python_docx(self):
+        for items_count in (0, 1, 300):
+            invoice = sample_invoice(items_count)
+            self.assertEqual(
+                package_parts(generate_invoice(*invoice)),
+                package_parts(generate_invoice_docx(*invoice)),
+            )
+
+    def test_special_characters_match_python_docx(self):
+        entrepreneur, bank_details, items, form_data = sample_invoice(1)
+        entrepreneur.company_name = 'Рога & <Копыта>'
+        form_data['customer_address'] = ' адрес\tс табуляцией\nи переносом '
+        for description in (' пробелы ', 'a\r\nb', ']]>', '\t', '"кавычки\''):
+            items.append(type(items[0])(
+                description=description, quantity=Decimal('1'), unit='', price=Decimal('0.5'), vat_rate=Decimal('0'),
+            ))
+        invoice = (entrepreneur, bank_details, items, form_data)
+        self.assertEqual(
+            package_parts(generate_invoice(*invoice)),
+            package_parts(generate_invoice_docx(*invoice)),
+        )
+
+    def test_invalid_xml_characters_rejected(self):
+        entrepreneur, bank_details, items, form_data = sample_invoice(1)
+        items[0].description = 'NUL\x00'
+        with self.assertRaises(ValueError):
+            generate_invoice(entrepreneur, bank_details, items, form_data)
+
+
+class StreamingInvoiceTests(SimpleTestCase):
+    def stream(self, items_count):
+        entrepreneur, bank_details, _, form_data = sample_invoice(0)
+        items = (
+            SimpleNamespace(description=f'Артикул {n}', quantity=Decimal('3.00'), unit='шт', price=Decimal('149.90'))
+            for n in range(items_count)
+        )
+        totals = totals_from_net({Decimal('20'): Decimal('449.70') * items_count})
+        return stream_invoice(entrepreneur, bank_details, items, form_data, totals)
+
+    def test_matches_buffered_generation(self):
+        invoice = sample_invoice(300)
+        with stream_invoice(*invoice, compute_totals(invoice[2])) as file:
+            self.assertEqual(package_parts(file.file), package_parts(generate_invoice(*invoice)))
+
+    @override_settings(INVOICE_SPOOL_MAX_SIZE=64 * 1024)
+    def test_memory_does_not_grow_with_line_count(self):
+        peaks = []
+        for items_count in (1000, 10000):
+            tracemalloc.start()
+            try:
+                with self.stream(items_count) as file:
+                    self.assertIsNone(ZipFile(file.file).testzip())
+                peaks.append(tracemalloc.get_traced_memory()[1])
+            finally:
+                tracemalloc.stop()
+        self.assertLess(peaks[1], peaks[0] * 1.5)
+
+
+class InvoiceTotalsTests(SimpleTestCase):
+    def test_matches_reference_loop(self):
+        for seed in range(20):
+            items = sample_items(200, seed)
+            totals = compute_totals(items)
+            amounts, net, vat_by_rate, gross = reference_totals(items)
+            self.assertEqual(totals.amounts, amounts)
+            self.assertEqual((totals.net, totals.vat_by_rate, totals.gross), (net, vat_by_rate, gross))
+            self.assertEqual(totals.gross, totals.net + totals.vat)
+            self.assertEqual(sum(totals.amounts), totals.net)
+
+    def test_vat_is_rounded_once_per_rate(self):
+        # 3 × 0.33 с НДС 20% построчно дало бы 0.21, от суммы — 0.20
+        items = [SimpleNamespace(quantity=1, price=Decimal('0.33'), vat_rate=Decimal('20'))] * 3
+        totals = compute_totals(items)
+        self.assertEqual((totals.net, totals.vat, totals.gross), (Decimal('0.99'), Decimal('0.20'), Decimal('1.19')))
+        self.assertEqual(
+            footer_rows(totals),
+            [('Итого:', '0.99'), ('НДС 20%:', '0.20'), ('Всего к оплате:', '1.19')],
+        )
+
+
+@skipUnless(all(os.path.exists(path) for path in settings.INVOICE_PDF_FONTS.values()), 'нет шрифтов для PDF')
+class PdfRendererTests(SimpleTestCase):
+    def render(self, items_count):
+        return generate_invoice(*sample_invoice(items_count), document_format='pdf').getvalue()
+
+    def test_valid_structure(self):
+        content = self.render(10)
+        self.assertTrue(content.startswith(b'%PDF-1.4'))
+        xref = int(re.search(rb'startxref\n(\d+)', content).group(1))
+        offsets = re.findall(rb'(\d{10}) 00000 n', content[xref:])
+        for object_id, offset in enumerate(offsets, 1):
+            self.assertTrue(content[int(offset):].startswith(f'{object_id} 0 obj'.encode()))
+        # Кириллица копируется из PDF благодаря ToUnicode
+        self.assertIn(f'<{ord("С"):04X}>'.encode(), self.decompressed_streams(content))
+
+    def test_long_table_spans_pages_and_is_reproducible(self):
+        content = self.render(300)
+        self.assertGreater(int(re.search(rb'/Count (\d+)', content).group(1)), 1)
+        self.assertEqual(content, self.render(300))
+
+    def decompressed_streams(self, content):
+        return b''.join(
+            zlib.decompress(stream)
+            for stream in re.findall(rb'/FlateDecode >>\nstream\n(.*?)\nendstream', content, re.S)
+        )
+
+
+def create_entrepreneur(n=1, with_bank_details=True):
+    user = User.objects.create_user(f'ip_{n:012d}', f'user{n}@example.com', 'Secret-pass-123')
+    entrepreneur = EntrepreneurProfile.objects.create(
+        user=user,
+        company_name=f'Предприниматель {n}',
+        inn=f'{n:012d}',
+        ogrnip=f'{n:015d}',
+        phone='+7 (900) 000-00-00',
+    )
+    if with_bank_details:
+        BankDetails.objects.create(
+            entrepreneur=entrepreneur,
+            bank_name='ПАО Сбербанк',
+            bik='044525225',
+            correspondent_account='30101810400000000225',
+            payment_account='40802810900000000001',
+        )
+    return entrepreneur
+
+
+def create_invoice_draft(entrepreneur, items_count=2, customer_name='ООО «Ромашка»'):
+    items = [
+        {'description': f'Товар {i}', 'quantity': Decimal('2'), 'unit': 'шт', 'price': Decimal('100.50'), 'vat_rate': Decimal('20')}
+        for i in range(1, items_count + 1)
+    ]
+    form_data = {
+        'customer_name': customer_name,
+        'customer_address': 'г. Москва',
+        'customer_inn': '7701234567',
+        'date': date(2025, 6, 1),
+        'payment_due_date': date(2025, 6, 15),
+    }
+    return save_invoice_draft(entrepreneur, form_data, items)
+
+
+def invoice_post_data(lines):
+    data = {
+        'customer_name': 'ООО «Ромашка»',
+        'customer_address': 'г. Москва',
+        'customer_inn': '7701234567',
+        'date': '2025-06-01',
+        'payment_due_date': '2025-06-15',
+        'form-TOTAL_FORMS': str(len(lines)),
+        'form-INITIAL_FORMS': '0',
+        'form-MIN_NUM_FORMS': '0',
+        'form-MAX_NUM_FORMS': '1000',
+    }
+    for n, (description, quantity, price) in enumerate(lines):
+        data.update({
+            f'form-{n}-description': description,
+            f'form-{n}-quantity': quantity,
+            f'form-{n}-unit': 'шт',
+            f'form-{n}-price': price,
+            f'form-{n}-vat_rate': '0',
+        })
+    return data
+
+
+class MediaRootMixin:
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+
+@override_settings(DOCUMENT_JOBS_EAGER=False, DOCUMENT_JOB_MAX_ATTEMPTS=2, DOCUMENT_JOB_RETRY_BACKOFF=10)
+class DocumentJobTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.entrepreneur = create_entrepreneur()
+        # Как и тестовый клиент Django, не закрываем соединение внутри транзакции теста
+        patcher = mock.patch('entrepreneurs.jobs.close_old_connections')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_preview_enqueues_and_worker_renders(self):
+        self.client.force_login(self.entrepreneur.user)
+        invoice = create_invoice_draft(self.entrepreneur)
+
+        response = self.client.post(reverse('entrepreneurs:preview_invoice', args=[invoice.pk]), {'generate': '1'})
+        document = GeneratedDocument.objects.get()
+        self.assertRedirects(response, reverse('entrepreneurs:document_detail', args=[document.pk]))
+        self.assertEqual(document.status, GeneratedDocument.STATUS_PENDING)
+        self.assertEqual(
+            self.client.get(reverse('entrepreneurs:document_status', args=[document.pk])).json()['status'],
+            GeneratedDocument.STATUS_PENDING,
+        )
+
+        self.assertEqual(work('test-worker', once=True), 1)
+        document.refresh_from_db()
+        self.assertEqual(document.status, GeneratedDocument.STATUS_READY)
+        self.assertTrue(document.file.name.endswith('.docx'))
+        self.assertEqual(document.invoice, invoice)
+        self.assertFalse(DocumentJob.objects.exists())
+
+    def test_preview_generates_pdf(self):
+        self.client.force_login(self.entrepreneur.user)
+        invoice = create_invoice_draft(self.entrepreneur)
+        self.client.post(
+            reverse('entrepreneurs:preview_invoice', args=[invoice.pk]), {'generate': '1', 'document_format': 'pdf'}
+        )
+        self.assertEqual(work('test-worker', once=True), 1)
+        document = GeneratedDocument.objects.get()
+        self.assertTrue(document.download_name.endswith('.pdf'))
+        with document.file.open('rb') as file:
+            self.assertEqual(file.read(5), b'%PDF-')
+
+    def test_job_claimed_once(self):
+        enqueue_invoice(create_invoice_draft(self.entrepreneur))
+        self.assertIsNotNone(claim_job('first'))
+        self.assertIsNone(claim_job('second'))
+
+    def test_failed_job_retried_with_backoff_then_marked_failed(self):
+        document, _ = enqueue_invoice(create_invoice_draft(self.entrepreneur))
+        with mock.patch('entrepreneurs.jobs.stream_invoice', side_effect=RuntimeError('boom')):
+            self.assertEqual(work('test-worker', once=True), 1)
+            job = DocumentJob.objects.get()
+            self.assertEqual(job.attempts, 1)
+            self.assertIn('boom', job.last_error)
+            self.assertGreater(job.run_after, timezone.now() + timedelta(seconds=5))
+
+            DocumentJob.objects.update(run_after=timezone.now())
+            self.assertEqual(work('test-worker', once=True), 1)
+
+        document.refresh_from_db()
+        self.assertEqual(document.status, GeneratedDocument.STATUS_FAILED)
+        self.assertIsNone(claim_job('test-worker'))
+
+        # Документ с ошибкой не мешает сформировать такой же счёт заново
+        _, created = enqueue_invoice(create_invoice_draft(self.entrepreneur))
+        self.assertTrue(created)
+
+    def test_job_abandoned_on_last_attempt_marked_failed(self):
+        document, _ = enqueue_invoice(create_invoice_draft(self.entrepreneur))
+        DocumentJob.objects.update(
+            attempts=settings.DOCUMENT_JOB_MAX_ATTEMPTS,
+            locked_at=timezone.now() - timedelta(seconds=settings.DOCUMENT_JOB_LOCK_TIMEOUT + 1),
+            locked_by='dead-worker',
+        )
+        self.assertEqual(work('test-worker', once=True), 0)
+
+        document.refresh_from_db()
+        self.assertEqual(document.status, GeneratedDocument.STATUS_FAILED)
+        job = DocumentJob.objects.get()
+        self.assertIsNone(job.locked_at)
+        self.assertTrue(job.last_error)
+
+    def test_repeated_generation_reuses_document(self):
+        self.client.force_login(self.entrepreneur.user)
+        invoice = create_invoice_draft(self.entrepreneur)
+        url = reverse('entrepreneurs:preview_invoice', args=[invoice.pk])
+        self.client.post(url, {'generate': '1'})
+        document = GeneratedDocument.objects.get()
+
+        # Повторная отправка того же черновика и черновик с теми же данными
+        duplicate = create_invoice_draft(self.entrepreneur)
+        for pk in (invoice.pk, duplicate.pk):
+            response = self.client.post(reverse('entrepreneurs:preview_invoice', args=[pk]), {'generate': '1'})
+            self.assertRedirects(response, reverse('entrepreneurs:document_detail', args=[document.pk]))
+
+        self.assertEqual(GeneratedDocument.objects.count(), 1)
+        self.assertEqual(DocumentJob.objects.count(), 1)
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.document, document)
+        # Черновик с теми же данными не удаляется и остаётся без номера
+        duplicate.refresh_from_db()
+        self.assertTrue(duplicate.is_draft)
+        self.assertIsNone(duplicate.number)
+
+        _, created = enqueue_invoice(create_invoice_draft(self.entrepreneur, customer_name='ООО «Василёк»'))
+        self.assertTrue(created)
+
+
+BATCH_CSV = """customer_name;customer_address;customer_inn;date;payment_due_date;description;quantity;unit;price;vat_rate
+ООО «Альфа»;г. Москва;7701234567;2025-06-01;2025-06-15;Консультация;2;ч;1500.00;0
+ООО «Альфа»;г. Москва;7701234567;2025-06-01;2025-06-15;Доставка;1;шт;300.00;0
+ООО «Бета»;г. Казань;1655123456;2025-06-01;2025-06-15;Консультация;1;ч;1500.00;0
+ООО «Гамма»;г. Тверь;6901234567;2025-06-02;2025-06-16;Аренда;1;мес;20000.00;20
+"""
+
+
+class BatchInvoiceTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.entrepreneur = create_entrepreneur()
+
+    def test_command_generates_documents_from_csv(self):
+        path = os.path.join(tempfile.mkdtemp(), 'invoices.csv')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(BATCH_CSV)
+
+        call_command(
+            'generate_invoices', path, inn=self.entrepreneur.inn, workers=2, chunk_size=1,
+            stdout=io.StringIO(),
+        )
+
+        documents = GeneratedDocument.objects.filter(entrepreneur=self.entrepreneur)
+        self.assertEqual(documents.count(), 3)
+        invoice = Invoice.objects.get(customer_inn='7701234567')
+        self.assertEqual(invoice.total, Decimal('3300'))
+        self.assertEqual(invoice.lines.count(), 2)
+        self.assertEqual(invoice.document.status, GeneratedDocument.STATUS_READY)
+        for document in documents:
+            self.assertEqual(document.status, GeneratedDocument.STATUS_READY)
+            with document.file.open('rb') as file:
+                self.assertIn('word/document.xml', ZipFile(file).namelist())
+
+    def test_command_reports_batch_without_rate(self):
+        path = os.path.join(tempfile.mkdtemp(), 'invoices.csv')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(BATCH_CSV)
+
+        out = io.StringIO()
+        with mock.patch('entrepreneurs.batch.time.perf_counter', return_value=0.0):
+            call_command('generate_invoices', path, inn=self.entrepreneur.inn, workers=1, stdout=out)
+        self.assertIn('Создано документов: 3 за 0.00 с\n', out.getvalue())
+
+    def test_endpoint_rejects_invalid_invoice(self):
+        self.client.force_login(self.entrepreneur.user)
+        invoices = [{'customer_name': 'ООО «Альфа»', 'customer_inn': '12', 'items': []}]
+        response = self.client.post(reverse('entrepreneurs:batch_invoices'), {
+            'file': SimpleUploadedFile('invoices.json', json.dumps(invoices).encode()),
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(GeneratedDocument.objects.exists())
+
+    def test_endpoint_generates_documents_from_json(self):
+        self.client.force_login(self.entrepreneur.user)
+        invoices = [
+            {
+                'customer_name': f'Заказчик {n}',
+                'customer_address': 'г. Москва',
+                'customer_inn': '7701234567',
+                'date': '2025-06-01',
+                'payment_due_date': '2025-06-15',
+                'items': [{'description': 'Услуга', 'quantity': 1, 'unit': 'шт', 'price': '100.00', 'vat_rate': 0}],
+            }
+            for n in range(5)
+        ]
+        response = self.client.post(reverse('entrepreneurs:batch_invoices'), {
+            'file': SimpleUploadedFile('invoices.json', json.dumps(invoices).encode()),
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], 5)
+        self.assertEqual(GeneratedDocument.objects.filter(entrepreneur=self.entrepreneur).count(), 5)
+
+        # Повторная загрузка того же файла не рендерит счета заново
+        response = self.client.post(reverse('entrepreneurs:batch_invoices'), {
+            'file': SimpleUploadedFile('invoices.json', json.dumps(invoices + invoices[:1]).encode()),
+        })
+        data = response.json()
+        self.assertEqual((data['count'], data['reused']), (0, 6))
+        self.assertEqual(data['documents'][-1], data['documents'][0])
+        self.assertEqual(GeneratedDocument.objects.filter(entrepreneur=self.entrepreneur).count(), 5)
+
+    def test_failed_render_returns_numbers(self):
+        invoices = clean_batch(read_batch(io.StringIO(BATCH_CSV)))
+        with mock.patch('entrepreneurs.batch.render_invoices', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                generate_batch(self.entrepreneur, invoices, workers=1)
+        self.assertFalse(GeneratedDocument.objects.exists())
+        self.assertEqual(list(allocate_invoice_numbers(self.entrepreneur, 2025)), [1])
+
+    def test_expired_reservation_is_reused_and_batch_rejected(self):
+        invoices = clean_batch(read_batch(io.StringIO(BATCH_CSV)))
+
+        def expire_and_take(supplier, bank, chunk, document_format='docx'):
+            # Пачка рендерилась дольше резерва, и номер 1 получил другой счёт
+            SpareInvoiceNumber.objects.update(leased_until=timezone.now() - timedelta(seconds=1))
+            self.assertEqual(list(allocate_invoice_numbers(self.entrepreneur, 2025)), [1])
+            return render_invoices(supplier, bank, chunk, document_format)
+
+        with mock.patch('entrepreneurs.batch.render_invoices', side_effect=expire_and_take):
+            with self.assertRaises(BatchError):
+                generate_batch(self.entrepreneur, invoices, workers=1)
+        self.assertFalse(Invoice.objects.exists())
+        self.assertEqual(list(allocate_invoice_numbers(self.entrepreneur, 2025, 3)), [2, 3, 4])
+
+
+def create_document(entrepreneur, content=b'docx', name='invoice.docx'):
+    document = GeneratedDocument(entrepreneur=entrepreneur, document_type='Счёт на оплату', filename=name)
+    document.file.save(name, ContentFile(content))
+    return document
+
+
+class AsyncDocumentViewsTests(MediaRootMixin, TestCase):
+    # Несколько фрагментов по RANGE_CHUNK_SIZE
+    content = bytes(range(256)) * 1024
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.entrepreneur = create_entrepreneur()
+        self.other = create_entrepreneur(2)
+        self.document = create_document(self.entrepreneur, self.content, 'Счет.docx')
+
+    def request(self, user, **extra):
+        request = AsyncRequestFactory().get('/', **extra)
+        request.user = user
+        return request
+
+    async def test_download_streams_asynchronously(self):
+        response = await views.adownload_document(self.request(self.entrepreneur.user), self.document.pk)
+        self.assertTrue(response.is_async)
+        self.assertEqual(b''.join([chunk async for chunk in response]), self.content)
+
+        response = await views.adownload_document(
+            self.request(self.entrepreneur.user, headers={'Range': 'bytes=70000-70009'}), self.document.pk
+        )
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join([chunk async for chunk in response]), self.content[70000:70010])
+
+    async def test_foreign_document_and_anonymous_user(self):
+        for view in (views.adownload_document, views.adocument_detail):
+            with self.assertRaises(Http404):
+                await view(self.request(self.other.user), self.document.pk)
+            response = await view(self.request(AnonymousUser()), self.document.pk)
+            self.assertEqual(response.status_code, 302)
+
+    async def test_documents_list(self):
+        response = await views.adocuments_list(self.request(self.entrepreneur.user))
+        self.assertContains(response, reverse('entrepreneurs:download_document', args=[self.document.pk]))
+
+        response = await views.adocuments_list(self.request(self.other.user))
+        self.assertNotContains(response, reverse('entrepreneurs:download_document', args=[self.document.pk]))
+
+        response = await views.adocuments_list(self.request(self.entrepreneur.user, data={'cursor': '!'}))
+        self.assertRedirects(response, reverse('entrepreneurs:documents'), fetch_redirect_response=False)
+
+    async def test_fresh_session_through_middleware(self):
+        # Как под ASGI: сессия и пользователь ещё не загружены, когда вызывается представление
+        client = Client()
+        await sync_to_async(client.force_login)(self.entrepreneur.user)
+        session_key = client.cookies[settings.SESSION_COOKIE_NAME].value
+
+        async def detail(request):
+            return await views.adocument_detail(request, self.document.pk)
+
+        for view, url in (
+            (views.adocuments_list, reverse('entrepreneurs:documents')),
+            (detail, reverse('entrepreneurs:document_detail', args=[self.document.pk])),
+        ):
+            cache.clear()
+            handler = SessionMiddleware(AuthenticationMiddleware(MessageMiddleware(view)))
+            request = AsyncRequestFactory().get(url)
+            request.COOKIES[settings.SESSION_COOKIE_NAME] = session_key
+            response = await handler(request)
+            self.assertContains(response, reverse('entrepreneurs:download_document', args=[self.document.pk]))
+
+
+class DocumentArchiveTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.entrepreneur = create_entrepreneur()
+        self.client.force_login(self.entrepreneur.user)
+
+    def archive_names(self, response):
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        archive = ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertIsNone(archive.testzip())
+        return sorted(archive.namelist())
+
+    def test_archive_of_selected_documents(self):
+        first = create_document(self.entrepreneur, b'first', 'first.docx')
+        create_document(self.entrepreneur, b'second', 'second.docx')
+        foreign = create_document(create_entrepreneur(2), b'foreign', 'foreign.docx')
+
+        response = self.client.get(reverse('entrepreneurs:download_archive'), {'ids': [first.pk, foreign.pk]})
+        self.assertEqual(self.archive_names(response), ['first.docx'])
+
+    def test_archive_by_date_range(self):
+        create_document(self.entrepreneur, b'first', 'first.docx')
+        create_document(self.entrepreneur, b'second', 'second.docx')
+        today = timezone.now().date()
+
+        response = self.client.get(reverse('entrepreneurs:download_archive'), {
+            'date_from': today.isoformat(), 'date_to': today.isoformat(),
+        })
+        self.assertEqual(self.archive_names(response), ['first.docx', 'second.docx'])
+
+    def test_archive_requires_selection(self):
+        response = self.client.get(reverse('entrepreneurs:download_archive'))
+        self.assertRedirects(response, reverse('entrepreneurs:documents'))
+
+    def test_archive_streamed_in_bounded_chunks(self):
+        create_document(self.entrepreneur, os.urandom(ARCHIVE_CHUNK_SIZE * 8), 'large.docx')
+        documents = GeneratedDocument.objects.filter(entrepreneur=self.entrepreneur)
+        chunks = list(stream_documents_zip(documents.iterator()))
+        self.assertLess(max(len(chunk) for chunk in chunks), ARCHIVE_CHUNK_SIZE * 2)
+        self.assertEqual(len(ZipFile(io.BytesIO(b''.join(chunks))).read('large.docx')), ARCHIVE_CHUNK_SIZE * 8)
+
+
+class DocumentStorageTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.entrepreneur = create_entrepreneur()
+
+    def test_identical_content_stored_once(self):
+        first = create_document(self.entrepreneur, b'same', 'first.docx')
+        second = create_document(self.entrepreneur, b'same', 'second.docx')
+
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertEqual(len(list(document_storage.iter_blobs())), 1)
+        self.assertEqual(second.download_name, 'second.docx')
+
+        self.client.force_login(self.entrepreneur.user)
+        response = self.client.get(reverse('entrepreneurs:download_archive'), {'ids': [first.pk, second.pk]})
+        archive = ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(sorted(archive.namelist()), ['first.docx', 'second.docx'])
+
+    def test_rendered_invoice_is_reproducible(self):
+        invoice = sample_invoice(3)
+        self.assertEqual(generate_invoice(*invoice).getvalue(), generate_invoice(*invoice).getvalue())
+
+    def test_collect_removes_only_old_unreferenced_blobs(self):
+        kept = create_document(self.entrepreneur, b'kept', 'kept.docx')
+        orphan = create_document(self.entrepreneur, b'orphan', 'orphan.docx')
+        fresh = create_document(self.entrepreneur, b'fresh', 'fresh.docx')
+        GeneratedDocument.objects.filter(pk__in=[orphan.pk, fresh.pk]).delete()
+
+        old = time.time() - 48 * 3600
+        for document in (kept, orphan):
+            os.utime(document_storage.path(document.file.name), (old, old))
+
+        call_command('collect_document_blobs', grace_hours=24, stdout=io.StringIO())
+
+        self.assertTrue(document_storage.exists(kept.file.name))
+        self.assertFalse(document_storage.exists(orphan.file.name))
+        self.assertTrue(document_storage.exists(fresh.file.name))
+
+
+class DocumentDownloadTests(MediaRootMixin, TestCase):
+    content = bytes(range(256)) * 4
+
+    def setUp(self):
+        super().setUp()
+        self.entrepreneur = create_entrepreneur()
+        self.client.force_login(self.entrepreneur.user)
+        self.document = create_document(self.entrepreneur, self.content, 'Счет.docx')
+        self.url = reverse('entrepreneurs:download_document', args=[self.document.pk])
+
+    def test_full_download(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn("filename*=utf-8''", response['Content-Disposition'])
+
+    def test_range_requests(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(self.content)}')
+        self.assertEqual(b''.join(response.streaming_content), self.content[10:20])
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-5')
+        self.assertEqual(b''.join(response.streaming_content), self.content[-5:])
+
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.content)}-')
+        self.assertEqual(response.status_code, 416)
+
+        # Диапазон к устаревшей версии файла — отдаётся весь файл
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-19', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_if_range_needs_strong_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-19', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+
+        # Файл, сохранённый до хранилища по содержимому, получает слабый ETag
+        os.makedirs(document_storage.path('legacy'))
+        with open(document_storage.path('legacy/Счет.docx'), 'wb') as file:
+            file.write(self.content)
+        GeneratedDocument.objects.filter(pk=self.document.pk).update(file='legacy/Счет.docx')
+        etag = self.client.get(self.url)['ETag']
+        self.assertTrue(etag.startswith('W/'))
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-19', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=10-19').status_code, 206)
+
+    def test_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    @override_settings(DOCUMENT_SERVE_MODE='x-accel-redirect', DOCUMENT_ACCEL_REDIRECT_PREFIX='/protected-media/')
+    def test_accel_redirect(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.document.file.name}')
+        self.assertEqual(response.content, b'')
+
+        self.client.force_login(create_entrepreneur(2).user)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+
+@override_settings(DOCUMENTS_PER_PAGE=3)
+class EntrepreneurCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.entrepreneur = create_entrepreneur()
+        self.invoice = create_invoice_draft(self.entrepreneur)
+        self.client.force_login(self.entrepreneur.user)
+
+    def test_views_query_counts(self):
+        # Профиль берётся из кеша: сессия, пользователь и собственные данные страницы
+        views = (
+            (reverse('entrepreneurs:dashboard'), 2),
+            (reverse('entrepreneurs:bank_details'), 2),
+            (reverse('entrepreneurs:create_invoice'), 2),
+            (reverse('entrepreneurs:preview_invoice', args=[self.invoice.pk]), 4),
+            (reverse('entrepreneurs:documents'), 3),
+        )
+        self.client.get(reverse('entrepreneurs:dashboard'))
+        for url, queries in views:
+            with self.subTest(url=url), self.assertNumQueries(queries):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_saving_bank_details_invalidates_cache(self):
+        self.client.get(reverse('entrepreneurs:bank_details'))
+        bank_details = BankDetails.objects.get()
+        bank_details.bank_name = 'АО Тинькофф Банк'
+        bank_details.save()
+        response = self.client.get(reverse('entrepreneurs:preview_invoice', args=[self.invoice.pk]))
+        self.assertEqual(response.context['bank_details'].bank_name, 'АО Тинькофф Банк')
+
+        bank_details.delete()
+        response = self.client.get(reverse('entrepreneurs:create_invoice'))
+        self.assertRedirects(response, reverse('entrepreneurs:bank_details'))
+
+    def test_saving_bank_details_rereads_stale_profile(self):
+        entrepreneur = create_entrepreneur(2, with_bank_details=False)
+        self.client.force_login(entrepreneur.user)
+        url = reverse('entrepreneurs:bank_details')
+        self.client.get(url)
+        # Реквизиты сохранены другим процессом: кеш этого процесса не сброшен
+        BankDetails.objects.bulk_create([BankDetails(
+            entrepreneur=entrepreneur,
+            bank_name='ПАО Сбербанк',
+            bik='044525225',
+            correspondent_account='30101810400000000225',
+            payment_account='40802810900000000001',
+        )])
+
+        response = self.client.post(url, {
+            'bank_name': 'АО Тинькофф Банк',
+            'bik': '044525974',
+            'correspondent_account': '30101810145250000974',
+            'payment_account': '40802810900000000002',
+        })
+        self.assertRedirects(response, reverse('entrepreneurs:documents'))
+        self.assertEqual(BankDetails.objects.get(entrepreneur=entrepreneur).bank_name, 'АО Тинькофф Банк')
+
+    def test_process_cache_timeout_is_short(self):
+        timeout = cache_timeout(caches['default'], settings.ENTREPRENEUR_CACHE_TIMEOUT)
+        self.assertEqual(timeout, settings.ENTREPRENEUR_LOCAL_CACHE_TIMEOUT)
+
+    @override_settings(SESSION_ENGINE='entrepreneurs.sessions')
+    def test_session_survives_cache_loss(self):
+        # Сессия записывается и в БД, поэтому переживает сброс кеша процесса
+        self.client.get(reverse('entrepreneurs:dashboard'))
+        caches[settings.SESSION_CACHE_ALIAS].clear()
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get(reverse('entrepreneurs:dashboard')).status_code, 200)
+        with self.assertNumQueries(1):
+            self.client.get(reverse('entrepreneurs:dashboard'))
+
+
+class DocumentsPaginationTests(TestCase):
+    def setUp(self):
+        self.entrepreneur = create_entrepreneur()
+        self.client.force_login(self.entrepreneur.user)
+        GeneratedDocument.objects.bulk_create([
+            GeneratedDocument(entrepreneur=self.entrepreneur, document_type=f'Документ {n}', file=f'{n}.docx')
+            for n in range(7)
+        ])
+        # Одинаковое время создания у части строк проверяет разрешение по id
+        same_time = timezone.now() - timedelta(days=1)
+        GeneratedDocument.objects.filter(document_type__in=['Документ 2', 'Документ 3', 'Документ 4']).update(
+            created_at=same_time
+        )
+        self.expected = list(GeneratedDocument.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+    def test_html_pages_cover_all_documents_once(self):
+        seen = []
+        cursor = None
+        while True:
+            response = self.client.get(reverse('entrepreneurs:documents'), {'cursor': cursor} if cursor else {})
+            seen.extend(document.pk for document in response.context['documents'])
+            cursor = response.context['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(seen, self.expected)
+
+    def test_json_pages_cover_all_documents_once(self):
+        seen = []
+        params = {}
+        while True:
+            data = self.client.get(reverse('entrepreneurs:documents_page'), params).json()
+            seen.extend(document['id'] for document in data['documents'])
+            if not data['next_cursor']:
+                break
+            params = {'cursor': data['next_cursor']}
+        self.assertEqual(seen, self.expected)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('entrepreneurs:documents_page'), {'cursor': 'broken'})
+        self.assertEqual(response.status_code, 400)
+
+
+class InvoiceDraftTests(TestCase):
+    def setUp(self):
+        self.entrepreneur = create_entrepreneur()
+        self.client.force_login(self.entrepreneur.user)
+
+    def test_create_stores_draft_with_exact_totals(self):
+        response = self.client.post(
+            reverse('entrepreneurs:create_invoice'),
+            invoice_post_data([('Товар', '3', '0.10'), ('Услуга', '1.5', '33.33')]),
+        )
+        invoice = Invoice.objects.get()
+        self.assertRedirects(response, reverse('entrepreneurs:preview_invoice', args=[invoice.pk]))
+        self.assertTrue(invoice.is_draft)
+        # Суммы строк округляются до копейки, половина копейки — вверх
+        self.assertEqual((invoice.net_total, invoice.vat_total, invoice.total), (Decimal('50.30'), 0, Decimal('50.30')))
+        self.assertEqual(
+            list(invoice.lines.values_list('position', 'description', 'amount')),
+            [(1, 'Товар', Decimal('0.30')), (2, 'Услуга', Decimal('50.00'))],
+        )
+        self.assertEqual(invoice.get_totals().gross, invoice.total)
+        self.assertNotIn('invoice_items', self.client.session)
+        self.assertContains(self.client.get(response.url), 'Услуга')
+
+    def test_edit_replaces_lines(self):
+        invoice = create_invoice_draft(self.entrepreneur, items_count=3)
+        response = self.client.get(reverse('entrepreneurs:edit_invoice', args=[invoice.pk]))
+        self.assertEqual(len(response.context['formset'].forms), 3)
+
+        self.client.post(
+            reverse('entrepreneurs:edit_invoice', args=[invoice.pk]),
+            invoice_post_data([('Новая позиция', '1', '10.00')]),
+        )
+        invoice.refresh_from_db()
+        self.assertEqual(Invoice.objects.count(), 1)
+        self.assertEqual(list(invoice.lines.values_list('description', flat=True)), ['Новая позиция'])
+        self.assertEqual(invoice.total, Decimal('10'))
+
+    def test_foreign_draft_not_accessible(self):
+        invoice = create_invoice_draft(create_entrepreneur(2))
+        response = self.client.get(reverse('entrepreneurs:preview_invoice', args=[invoice.pk]))
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(REQUEST_PROFILING=True, DOCUMENT_JOBS_EAGER=True, PROFILING_METRICS_TOKEN='secret')
+class RequestProfilingTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        profiling.registry.reset()
+        self.entrepreneur = create_entrepreneur()
+        self.client.force_login(self.entrepreneur.user)
+
+    def test_records_view_timings(self):
+        invoice = create_invoice_draft(self.entrepreneur)
+        url = reverse('entrepreneurs:preview_invoice', args=[invoice.pk])
+        self.client.get(url)
+        self.client.post(url, {'generate': '1'})
+
+        stats = profiling.registry.snapshot()['entrepreneurs:preview_invoice']
+        self.assertEqual(stats.count, 2)
+        self.assertGreater(stats.queries, 0)
+        self.assertGreater(stats.sections['template'], 0)
+        self.assertGreater(stats.sections['render'], 0)
+        self.assertLessEqual(stats.quantile(0.5), stats.quantile(0.99))
+
+    async def test_async_chain_stays_async(self):
+        document = await sync_to_async(create_document)(self.entrepreneur)
+        url = reverse('entrepreneurs:document_detail', args=[document.pk])
+
+        async def get_response(request):
+            request.resolver_match = resolve(url)
+            return await views.adocument_detail(request, document.pk)
+
+        middleware = profiling.RequestProfilingMiddleware(get_response)
+        self.assertTrue(iscoroutinefunction(middleware))
+        request = AsyncRequestFactory().get(url)
+        request.user = self.entrepreneur.user
+        response = await middleware(request)
+
+        self.assertEqual(response.status_code, 200)
+        stats = profiling.registry.snapshot()['entrepreneurs:document_detail']
+        self.assertEqual(stats.count, 1)
+        self.assertGreater(stats.queries, 0)
+
+    def test_quantiles_from_histogram(self):
+        stats = profiling.ViewStats()
+        for elapsed in [0.010] * 90 + [0.200] * 10:
+            stats.count += 1
+            stats.buckets[bisect_left(profiling.BUCKETS, elapsed)] += 1
+        self.assertAlmostEqual(stats.quantile(0.5), 0.010, delta=0.0025)
+        self.assertAlmostEqual(stats.quantile(0.99), 0.200, delta=0.05)
+
+    def test_dashboard_and_metrics_are_staff_only(self):
+        self.client.get(reverse('entrepreneurs:documents'))
+        self.assertEqual(self.client.get(reverse('entrepreneurs:performance')).status_code, 302)
+        self.assertEqual(self.client.get(reverse('entrepreneurs:performance_metrics')).status_code, 403)
+
+        metrics = self.client.get(
+            reverse('entrepreneurs:performance_metrics'), HTTP_AUTHORIZATION='Bearer secret'
+        ).content.decode()
+        self.assertIn('diplom_request_duration_seconds_count{view="entrepreneurs:documents"} 1', metrics)
+
+        User.objects.filter(pk=self.entrepreneur.user.pk).update(is_staff=True)
+        self.assertContains(self.client.get(reverse('entrepreneurs:performance')), 'entrepreneurs:documents')
+
+
+class QueryPlanMixin:
+    """Проверки плана запроса через EXPLAIN (SQLite и PostgreSQL)"""
+
+    def explain(self, queryset):
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                # На маленьких тестовых таблицах планировщик выбрал бы полный просмотр
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+            return queryset.explain()
+
+    def assertUsesIndex(self, queryset, index_name=None):
+        """Запрос читает таблицу по индексу index_name (или любому) и не сортирует строки отдельно"""
+        plan = self.explain(queryset)
+        index_pattern = re.escape(index_name) if index_name else r'\w+'
+        self.assertRegex(plan, rf'USING (COVERING )?INDEX {index_pattern}\b|Index (Only )?Scan using {index_pattern}\b')
+        if queryset.ordered:
+            self.assertNotRegex(plan, r'TEMP B-TREE|\bSort\b', plan)
+
+
+class LookupIndexTests(QueryPlanMixin, TestCase):
+    def setUp(self):
+        self.entrepreneur = create_entrepreneur()
+
+    def test_hot_queries_use_indexes(self):
+        self.assertUsesIndex(users_by_email('User1@Example.com'), 'auth_user_email_ci_unique')
+        self.assertUsesIndex(
+            GeneratedDocument.objects.filter(entrepreneur=self.entrepreneur).order_by('-created_at', '-id'),
+            'document_entrepreneur_page_idx',
+        )
+        self.assertUsesIndex(create_invoice_draft(self.entrepreneur).lines.all())
+
+    def test_email_is_unique_and_found_case_insensitively(self):
+        form = CustomAuthenticationForm(data={'username': 'USER1@example.COM', 'password': 'Secret-pass-123'})
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.get_user(), self.entrepreneur.user)
+
+        form = EntrepreneurRegistrationForm(data={'email': 'User1@Example.com'})
+        self.assertIn('email', form.errors)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            User.objects.create_user('other', 'User1@Example.com')
+        # Пустой email не участвует в уникальности
+        User.objects.create_user('no_email_1')
+        User.objects.create_user('no_email_2')
+
+    def test_check_detects_missing_email_index(self):
+        self.assertEqual(check_email_index(None, databases=['default']), [])
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(f'DROP INDEX {EMAIL_INDEX}')
+            errors = check_email_index(None, databases=['default'])
+            transaction.set_rollback(True)
+        self.assertEqual([error.id for error in errors], ['entrepreneurs.E001'])
+
+
+def customer_data(name, inn):
+    return {'customer_name': name, 'customer_address': 'г. Москва', 'customer_inn': inn}
+
+
+class CustomerDirectoryTests(QueryPlanMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.entrepreneur = create_entrepreneur()
+        self.client.force_login(self.entrepreneur.user)
+
+    def remember(self, *customers, entrepreneur=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            remember_customers((entrepreneur or self.entrepreneur).pk, [customer_data(*c) for c in customers])
+
+    def test_generated_invoices_fill_directory(self):
+        draft = create_invoice_draft(self.entrepreneur)
+        self.assertFalse(Customer.objects.exists())
+        enqueue_invoice(draft)
+        enqueue_invoice(create_invoice_draft(self.entrepreneur, customer_name='ООО «Ромашка и Ко»'))
+        customer = Customer.objects.get()
+        self.assertEqual((customer.name, customer.inn), ('ООО «Ромашка и Ко»', '7701234567'))
+        self.assertEqual(customer.search_name, 'ромашка и ко')
+
+    def test_search_by_name_and_inn_prefix(self):
+        self.remember(
+            ('ООО «Ромашка»', '7701234567'), ('ИП Ёлкин Пётр', '500100732259'), ('АО «Роза»', '7702000000'),
+        )
+        self.remember(('ООО «Ромб»', '7703000000'), entrepreneur=create_entrepreneur(2))
+
+        def names(query):
+            return sorted(customer['name'] for customer in find_customers(self.entrepreneur.pk, query))
+
+        self.assertEqual(names('ром'), ['ООО «Ромашка»'])
+        self.assertEqual(names('ООО  ро'), ['АО «Роза»', 'ООО «Ромашка»'])
+        self.assertEqual(names('елк'), ['ИП Ёлкин Пётр'])
+        self.assertEqual(names('7702'), ['АО «Роза»'])
+        self.assertEqual(names('рома*'), ['ООО «Ромашка»'])
+        self.assertEqual(names(' «» '), [])
+        self.assertUsesIndex(search_customers(self.entrepreneur.pk, 'ром')[:10])
+        self.assertUsesIndex(search_customers(self.entrepreneur.pk, '7702')[:10])
+
+    def test_answers_cached_until_directory_changes(self):
+        self.remember(('ООО «Ромашка»', '7701234567'))
+        with self.assertNumQueries(1):
+            self.assertEqual(len(autocomplete(self.entrepreneur.pk, 'ром')), 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(len(autocomplete(self.entrepreneur.pk, 'ООО «Ром')), 1)
+
+        self.remember(('ООО «Ромео»', '7704000000'))
+        with self.assertNumQueries(1):
+            self.assertEqual(len(autocomplete(self.entrepreneur.pk, 'ром')), 2)
+
+    def test_answer_read_before_change_is_not_served_after_it(self):
+        self.remember(('ООО «Ромашка»', '7701234567'))
+
+        def find_then_change(entrepreneur_id, query):
+            # Справочник изменился между чтением из БД и записью ответа в кеш
+            customers = find_customers(entrepreneur_id, query)
+            self.remember(('ООО «Ромео»', '7704000000'))
+            return customers
+
+        with mock.patch('entrepreneurs.customers.find_customers', side_effect=find_then_change):
+            self.assertEqual(len(autocomplete(self.entrepreneur.pk, 'ром')), 1)
+        self.assertEqual(len(autocomplete(self.entrepreneur.pk, 'ром')), 2)
+
+    def test_autocomplete_endpoint(self):
+        self.remember(('ООО «Ромашка»', '7701234567'))
+        url = reverse('entrepreneurs:customer_autocomplete')
+        response = self.client.get(url, {'q': 'Ром'})
+        self.assertEqual(
+            response.json(), {'customers': [{'name': 'ООО «Ромашка»', 'address': 'г. Москва', 'inn': '7701234567'}]}
+        )
+        self.client.logout()
+        self.assertEqual(self.client.get(url, {'q': 'Ром'}).status_code, 302)
+
+
+class DocumentSearchTests(QueryPlanMixin, MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.entrepreneur = create_entrepreneur()
+        self.client.force_login(self.entrepreneur.user)
+
+    def found(self, query, entrepreneur=None):
+        documents = GeneratedDocument.objects.filter(entrepreneur=entrepreneur or self.entrepreneur)
+        return set(search_documents(documents, query).values_list('pk', flat=True))
+
+    def test_generated_documents_are_searchable(self):
+        invoice = create_invoice_draft(self.entrepreneur)
+        document, _ = enqueue_invoice(invoice)
+        other, _ = enqueue_invoice(create_invoice_draft(self.entrepreneur, items_count=1, customer_name='АО «Лютик»'))
+        enqueue_invoice(create_invoice_draft(create_entrepreneur(2)))
+
+        self.assertEqual(self.found('ромашк'), {document.pk})
+        self.assertEqual(self.found('Ромашка товар 2'), {document.pk})
+        self.assertEqual(self.found('7701234567'), {document.pk, other.pk})
+        self.assertEqual(self.found('01.06.2025'), {document.pk, other.pk})
+        self.assertEqual(self.found(f'{invoice.total:.2f}'.replace('.', ',')), {document.pk})
+        self.assertEqual(self.found('лютик 2025-06-15'), {other.pk})
+        self.assertEqual(self.found('ромашка лютик'), set())
+        self.assertEqual(self.found(' «» '), set())
+
+        document.delete()
+        self.assertEqual(self.found('7701234567'), {other.pk})
+
+    def test_search_uses_full_text_index(self):
+        enqueue_invoice(create_invoice_draft(self.entrepreneur))
+        plan = self.explain(search_documents(GeneratedDocument.objects.all(), 'ромашка'))
+        self.assertRegex(plan, r'VIRTUAL TABLE INDEX|document_search_content_gin')
+
+    def test_check_detects_missing_search_index(self):
+        self.assertEqual(check_search_index(None, databases=['default']), [])
+        statements = (
+            [f'DROP TRIGGER {trigger}' for trigger in SEARCH_TRIGGERS] if connection.vendor == 'sqlite'
+            else [f'DROP INDEX {SEARCH_INDEX}']
+        )
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                for statement in statements:
+                    cursor.execute(statement)
+            errors = check_search_index(None, databases=['default'])
+            transaction.set_rollback(True)
+        self.assertEqual([error.id for error in errors], ['entrepreneurs.E002'])
+
+    def test_documents_list_filters_by_query(self):
+        document, _ = enqueue_invoice(create_invoice_draft(self.entrepreneur))
+        enqueue_invoice(create_invoice_draft(self.entrepreneur, customer_name='АО «Лютик»'))
+
+        response = self.client.get(reverse('entrepreneurs:documents'), {'q': 'ромашка'})
+        self.assertEqual([d.pk for d in response.context['documents']], [document.pk])
+        self.assertContains(response, 'value="ромашка"')
+        response = self.client.get(reverse('entrepreneurs:documents'), {'q': 'василёк'})
+        self.assertContains(response, 'ничего не найдено')
+
+        response = self.client.get(reverse('entrepreneurs:documents_page'), {'q': 'ромашка'})
+        self.assertEqual([d['id'] for d in response.json()['documents']], [document.pk])
+
+    def test_backfill_extracts_text_from_docx(self):
+        supplier, bank, items, form_data = sample_invoice(3)
+        form_data['customer_name'] = 'ООО «Василёк»'
+        legacy = create_document(self.entrepreneur, generate_invoice(supplier, bank, items, form_data).getvalue())
+        same_file = create_document(self.entrepreneur, generate_invoice(supplier, bank, items, form_data).getvalue())
+        broken = create_document(self.entrepreneur, b'not a docx', name='broken.docx')
+        document, _ = enqueue_invoice(create_invoice_draft(self.entrepreneur))
+        DocumentSearchText.objects.all().delete()
+
+        out, err = io.StringIO(), io.StringIO()
+        call_command('index_documents', workers=2, stdout=out, stderr=err)
+        self.assertIn('Готово: 4 документов', out.getvalue())
+        self.assertIn('не удалось извлечь текст: 1', out.getvalue())
+        self.assertEqual(DocumentSearchText.objects.count(), 4)
+        self.assertEqual(self.found('василек 7701234567 товар 3'), {legacy.pk, same_file.pk})
+        self.assertEqual(self.found('ромашка'), {document.pk})
+        self.assertEqual(self.found('счет на оплату'), {legacy.pk, same_file.pk, broken.pk, document.pk})
+
+        call_command('index_documents', stdout=out)
+        self.assertIn('Готово: 0 документов', out.getvalue())
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class RegistrationTests(TestCase):
+    def register(self, inn):
+        return self.client.post(reverse('entrepreneurs:register'), {
+            'email': f'ip{inn}@example.com',
+            'company_name': f'ИП {inn}',
+            'inn': inn,
+            'ogrnip': f'{inn}000',
+            'phone': '+7 (900) 000-00-00',
+            'password1': 'Secret-pass-123',
+            'password2': 'Secret-pass-123',
+        })
+
+    def test_username_from_inn_without_extra_queries(self):
+        # Свободное имя: одна вставка в точке сохранения, без проверок заранее
+        with self.assertNumQueries(3):
+            user = save_new_user(User(email='new@example.com'), 'ip_123456789012')
+        self.assertEqual(user.username, 'ip_123456789012')
+
+    def test_taken_username_gets_next_suffix(self):
+        for username in ('ip_123456789012', 'ip_123456789012_3', 'ip_123456789012_x'):
+            User.objects.create_user(username)
+        response = self.register('123456789012')
+        self.assertRedirects(response, reverse('entrepreneurs:dashboard'))
+        self.assertEqual(EntrepreneurProfile.objects.get().user.username, 'ip_123456789012_4')
+
+    def test_login_by_email(self):
+        self.register('123456789012')
+        self.client.post(reverse('entrepreneurs:logout'))
+        response = self.client.post(reverse('entrepreneurs:login'), {
+            'username': 'IP123456789012@example.com',
+            'password': 'Secret-pass-123',
+        })
+        self.assertRedirects(response, reverse('entrepreneurs:dashboard'))
+
+
+class BenchmarkTests(SimpleTestCase):
+    def report(self, **timings):
+        return {'results': {name: {'median': value, 'min': value} for name, value in timings.items()}}
+
+    def test_compare_reports_slowdown_past_threshold(self):
+        baseline = self.report(login=0.2, invoice_flow=0.04, removed=1.0)
+        report = self.report(login=0.29, invoice_flow=0.07, added=5.0)
+        self.assertEqual(compare(report, baseline, 0.5), [('invoice_flow', 0.04, 0.07)])
+
+    def test_measure_batches_fast_calls(self):
+        calls = []
+        result = measure(lambda: calls.append(1), iterations=3)
+        self.assertGreater(len(calls), 3 * 100)
+        self.assertLessEqual(result['min'], result['median'])
+
+
+
+@override_settings(DOCUMENT_JOBS_EAGER=True)
+class LoadTestHarnessTests(MediaRootMixin, LiveServerTestCase):
+    def test_seed_and_drive_local_server(self):
+        call_command('seed_load_data', tenants=3, documents=4, batch_size=5, stdout=io.StringIO())
+        self.assertEqual(EntrepreneurProfile.objects.filter(bank_details__isnull=False).count(), 3)
+        self.assertEqual(GeneratedDocument.objects.count(), 12)
+        self.assertEqual(len(set(GeneratedDocument.objects.values_list('file', flat=True))), 2)
+
+        output = io.StringIO()
+        call_command(
+            'load_test', url=self.live_server_url, users=2, duration=1, seed=1,
+            mix='list=1,create=1,download=1', stdout=output, stderr=output
+        )
+        report = output.getvalue()
+        self.assertIn('ошибок: 0', report)
+        for scenario in ('list', 'create', 'download'):
+            self.assertRegex(report, rf'{scenario}\s+[1-9]\d*\s+0\s')
+        self.assertTrue(GeneratedDocument.objects.filter(document_type='Счёт на оплату', content_key__gt='').exists())
+
+
+class InvoiceNumberingTests(TestCase):
+    def setUp(self):
+        self.entrepreneur = create_entrepreneur()
+
+    def test_numbers_are_per_entrepreneur_and_year(self):
+        other = create_entrepreneur(2)
+        self.assertEqual(list(allocate_invoice_numbers(self.entrepreneur, 2025)), [1])
+        self.assertEqual(list(allocate_invoice_numbers(self.entrepreneur, 2025, 3)), [2, 3, 4])
+        self.assertEqual(list(allocate_invoice_numbers(self.entrepreneur, 2026)), [1])
+        self.assertEqual(list(allocate_invoice_numbers(other, 2025)), [1])
+
+    def test_rolled_back_allocation_leaves_no_gap(self):
+        allocate_invoice_numbers(self.entrepreneur, 2025)
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                allocate_invoice_numbers(self.entrepreneur, 2025, 5)
+                raise RuntimeError
+        self.assertEqual(list(allocate_invoice_numbers(self.entrepreneur, 2025)), [2])
+
+    @override_settings(DOCUMENT_JOBS_EAGER=False)
+    def test_generated_invoice_gets_number(self):
+        first = create_invoice_draft(self.entrepreneur, customer_name='ООО «Ромашка»')
+        second = create_invoice_draft(self.entrepreneur, customer_name='ООО «Василёк»')
+        enqueue_invoice(second)
+        enqueue_invoice(first)
+        first.refresh_from_db()
+        self.assertEqual((first.number_year, first.number), (2025, 2))
+        self.assertIsNone(create_invoice_draft(self.entrepreneur).number)
+
+
+class InvoiceNumberingConcurrencyTests(TransactionTestCase):
+    threads = 8
+    allocations = 20
+
+    def test_concurrent_allocation_has_no_duplicates_or_gaps(self):
+        entrepreneur = create_entrepreneur()
+        allocated = []
+        errors = []
+        lock = threading.Lock()
+
+        def allocate(block_size):
+            try:
+                for _ in range(self.allocations):
+                    numbers = allocate_invoice_numbers(entrepreneur.pk, 2025, block_size)
+                    with lock:
+                        allocated.extend(numbers)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=allocate, args=(n % 3 + 1,)) for n in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(allocated), list(range(1, len(allocated) + 1)))
+
+
+class BatchNumberingConcurrencyTests(MediaRootMixin, TransactionTestCase):
+    threads = 6
+    batches = 3
+
+    def batch(self, prefix, size):
+        return clean_batch([
+            {
+                'customer_name': f'{prefix} {n}',
+                'customer_address': 'г. Москва',
+                'customer_inn': '7701234567',
+                'date': '2025-06-01',
+                'payment_due_date': '2025-06-15',
+                'items': [{'description': 'Услуга', 'quantity': 1, 'unit': 'шт', 'price': '100.00', 'vat_rate': 0}],
+            }
+            for n in range(size)
+        ])
+
+    def test_concurrent_batches_have_no_duplicates_or_gaps(self):
+        entrepreneur = create_entrepreneur()
+        errors = []
+
+        def flaky_render(supplier, bank, invoices, document_format='docx'):
+            if any(form_data['customer_name'].startswith('Сбой') for _, form_data in invoices):
+                raise RuntimeError('сбой рендера')
+            return render_invoices(supplier, bank, invoices, document_format)
+
+        def generate(thread):
+            try:
+                for n in range(self.batches):
+                    prefix = 'Сбой' if (thread + n) % 3 == 0 else 'Заказчик'
+                    try:
+                        generate_batch(entrepreneur, self.batch(f'{prefix} {thread}-{n}', n + 1), workers=1)
+                    except RuntimeError:
+                        pass
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        with override_settings(SQLITE_WRITE_RETRY_BACKOFF=0.01):
+            with mock.patch('entrepreneurs.batch.render_invoices', side_effect=flaky_render):
+                workers = [threading.Thread(target=generate, args=(n,)) for n in range(self.threads)]
+                for worker in workers:
+                    worker.start()
+                for worker in workers:
+                    worker.join()
+
+        self.assertEqual(errors, [])
+        numbers = list(Invoice.objects.values_list('number', flat=True))
+        self.assertEqual(len(numbers), len(set(numbers)))
+        # Номера упавших пачек свободны и выдаются следующим счетам
+        spare = list(SpareInvoiceNumber.objects.values_list('number', flat=True))
+        self.assertFalse(SpareInvoiceNumber.objects.exclude(holder='').exists())
+        self.assertEqual(sorted(numbers + spare), list(range(1, len(numbers) + len(spare) + 1)))
+
+        generate_batch(entrepreneur, self.batch('Заказчик', len(spare) + 1), workers=1)
+        numbers = sorted(Invoice.objects.values_list('number', flat=True))
+        self.assertEqual(numbers, list(range(1, len(numbers) + 1)))
+        self.assertFalse(SpareInvoiceNumber.objects.exists())
+
+
+@override_settings(
+    DOCUMENT_JOBS_EAGER=True,
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+)
+class SQLiteConcurrencyTests(MediaRootMixin, TransactionTestCase):
+    threads = 6
+    operations = 5
+
+    @skipUnless(connection.vendor == 'sqlite', 'только для SQLite')
+    def test_journal_mode_is_wal(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+
+    def test_retry_on_locked_repeats_write(self):
+        write = mock.Mock(side_effect=[OperationalError('database is locked')] * 2 + ['ok'])
+        with override_settings(SQLITE_WRITE_RETRY_BACKOFF=0):
+            self.assertEqual(retry_on_locked(write)(), 'ok')
+        self.assertEqual(write.call_count, 3)
+
+    def test_draft_save_retried_when_locked(self):
+        entrepreneur = create_entrepreneur()
+        bulk_create = InvoiceLine.objects.bulk_create
+        calls = []
+
+        def locked_once(objs, *args, **kwargs):
+            calls.append(objs)
+            if len(calls) == 1:
+                raise OperationalError('database is locked')
+            return bulk_create(objs, *args, **kwargs)
+
+        with override_settings(SQLITE_WRITE_RETRY_BACKOFF=0):
+            with mock.patch.object(InvoiceLine.objects, 'bulk_create', side_effect=locked_once):
+                invoice = create_invoice_draft(entrepreneur)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(list(Invoice.objects.values_list('pk', flat=True)), [invoice.pk])
+        self.assertEqual(invoice.lines.count(), 2)
+
+    def test_parallel_registrations_and_generations(self):
+        entrepreneur = create_entrepreneur()
+        drafts = [
+            create_invoice_draft(entrepreneur, customer_name=f'Заказчик {n}')
+            for n in range(self.threads * self.operations)
+        ]
+        errors = []
+        lock = threading.Lock()
+
+        def register(n):
+            client = Client()
+            for i in range(self.operations):
+                number = 10 ** 11 + n * 100 + i
+                response = client.post(reverse('entrepreneurs:register'), {
+                    'email': f'user{number}@example.com',
+                    'company_name': f'ИП {number}',
+                    'inn': str(number),
+                    'ogrnip': str(number * 1000),
+                    'phone': '+7 (900) 000-00-00',
+                    'password1': 'Secret-pass-123',
+                    'password2': 'Secret-pass-123',
+                })
+                if response.status_code != 302:
+                    raise AssertionError(response.status_code)
+                client.post(reverse('entrepreneurs:logout'))
+
+        def generate(n):
+            for invoice in drafts[n::self.threads]:
+                document, _ = enqueue_invoice(invoice)
+                if document.status != GeneratedDocument.STATUS_READY:
+                    raise AssertionError(document.status)
+
+        def run(target, n):
+            try:
+                target(n)
+            except Exception as e:
+                with lock:
+                    errors.append(e)
+            finally:
+                connection.close()
+
+        workers = [
+            threading.Thread(target=run, args=(target, n))
+            for n in range(self.threads) for target in (register, generate)
+        ]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started
+
+        operations = 2 * self.threads * self.operations
+        locked = sum(is_locked_error(e) for e in errors)
+        self.assertEqual(
+            errors, [], f'{operations / elapsed:.1f} операций/с, ошибок блокировки: {locked} из {len(errors)}'
+        )
+        self.assertEqual(EntrepreneurProfile.objects.count(), self.threads * self.operations + 1)
+        self.assertEqual(
+            GeneratedDocument.objects.filter(status=GeneratedDocument.STATUS_READY).count(), len(drafts)
+        )
@@ -0,0 +1,71 @@
+from collections import namedtuple
+from decimal import ROUND_HALF_UP, Decimal
+
+KOPECK = Decimal('0.01')
+ZERO = Decimal('0.00')
+
+InvoiceTotals = namedtuple('InvoiceTotals', ['amounts', 'net', 'vat_by_rate', 'vat', 'gross'])
+InvoiceTotals.__doc__ = """Итоги счёта.
+
+amounts — суммы строк без НДС, net — итого без НДС, vat_by_rate — {ставка: НДС}
+по возрастанию ставки, vat — НДС всего, gross — всего к оплате. Все суммы в
+рублях с копейками.
+"""
+
+
+def line_amount(quantity, price):
+    """Сумма строки: количество × цена, округлённое до копейки (половина — вверх)"""
+    return (quantity * price).quantize(KOPECK, ROUND_HALF_UP)
+
+
+def totals_from_net(net_by_rate, amounts=()):
+    """Итоги по суммам строк без НДС, сгруппированным по ставке.
+
+    НДС считается от суммы строк каждой ставки и округляется до копейки один
+    раз на ставку, а не построчно, поэтому копейки округления не накапливаются.
+    """
+    vat_by_rate = {}
+    net = ZERO
+    vat = ZERO
+    for rate in sorted(net_by_rate):
+        rate_net = net_by_rate[rate]
+        rate_vat = (rate_net * rate / 100).quantize(KOPECK, ROUND_HALF_UP)
+        net += rate_net
+        vat += rate_vat
+        vat_by_rate[rate] = rate_vat
+    return InvoiceTotals(list(amounts), net, vat_by_rate, vat, net + vat)
+
+
+def compute_totals(items):
+    """Считает суммы строк и итоги счёта за один проход по items.
+
+    items — объекты с quantity, price и vat_rate (строки счёта, позиции формы).
+    Используется и при сохранении счёта, и при рендеринге, и в отчётах, поэтому
+    суммы везде совпадают до копейки.
+    """
+    amounts = []
+    append = amounts.append
+    net_by_rate = {}
+    get = net_by_rate.get
+    for item in items:
+        amount = (item.quantity * item.price).quantize(KOPECK, ROUND_HALF_UP)
+        append(amount)
+        rate = item.vat_rate
+        net_by_rate[rate] = get(rate, ZERO) + amount
+    return totals_from_net(net_by_rate, amounts)
+
+
+def format_rate(rate):
+    return f'{Decimal(rate).normalize():f}'
+
+
+def footer_rows(totals):
+    """Строки-итоги под таблицей счёта: [(подпись, сумма)]"""
+    rows = [('Итого:', f'{totals.net:.2f}')]
+    taxed = [(rate, vat) for rate, vat in totals.vat_by_rate.items() if rate]
+    if taxed:
+        rows.extend((f'НДС {format_rate(rate)}%:', f'{vat:.2f}') for rate, vat in taxed)
+    else:
+        rows.append(('Без налога (НДС)', '-'))
+    rows.append(('Всего к оплате:', f'{totals.gross:.2f}'))
+    return rows
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
@@ -9,10 +10,26 @@ urlpatterns = [
     path('register/', views.register_entrepreneur, name='register'),
     path('dashboard/', views.dashboard, name='dashboard'),
     path('logout/', views.CustomLogoutView.as_view(), name='logout'),
-    path('documents/', views.documents_list, name='documents'),
+    path('documents/', views.adocuments_list if settings.ASYNC_VIEWS else views.documents_list, name='documents'),
+    path('documents/page/', views.documents_page, name='documents_page'),
+    path('documents/archive/', views.download_archive, name='download_archive'),
     path('documents/bank/', views.bank_details, name='bank_details'),
     path('documents/invoice/', views.create_invoice, name='create_invoice'),
-    path('documents/invoice/preview/', views.preview_invoice, name='preview_invoice'),
-    path('documents/<int:pk>/', views.document_detail, name='document_detail'),
-    path('documents/<int:pk>/download/', views.download_document, name='download_document'),
+    path('documents/invoice/<int:pk>/edit/', views.create_invoice, name='edit_invoice'),
+    path('documents/invoice/<int:pk>/preview/', views.preview_invoice, name='preview_invoice'),
+    path('documents/invoice/batch/', views.batch_invoices, name='batch_invoices'),
+    path('documents/customers/', views.customer_autocomplete, name='customer_autocomplete'),
+    path(
+        'documents/<int:pk>/',
+        views.adocument_detail if settings.ASYNC_VIEWS else views.document_detail,
+        name='document_detail'
+    ),
+    path('documents/<int:pk>/status/', views.document_status, name='document_status'),
+    path(
+        'documents/<int:pk>/download/',
+        views.adownload_document if settings.ASYNC_VIEWS else views.download_document,
+        name='download_document'
+    ),
+    path('performance/', views.performance_dashboard, name='performance'),
+    path('performance/metrics/', views.performance_metrics, name='performance_metrics'),
 ]
\ No newline at end of file
@@ -1,6 +1,7 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.contrib.auth import login, authenticate
-from django.contrib.auth.views import LoginView, LogoutView
+from django.contrib.auth import login
+from django.contrib.auth.views import LoginView, LogoutView, redirect_to_login
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.urls import reverse
 from django.utils.decorators import method_decorator
@@ -8,13 +9,30 @@ from django.views.decorators.http import require_POST
 from .forms import EntrepreneurRegistrationForm
 from django.contrib.auth.views import LoginView
 from .forms import CustomAuthenticationForm  
-from django.http import HttpResponse, FileResponse
-from .models import EntrepreneurProfile, BankDetails, GeneratedDocument, InvoiceItem
-from .forms import BankDetailsForm, InvoiceItemFormSet, InvoiceGenerationForm
-from .documents import generate_invoice
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from .models import EntrepreneurProfile, BankDetails, GeneratedDocument, Invoice, InvoiceItem
+from .forms import BankDetailsForm, InvoiceItemFormSet, InvoiceGenerationForm, BatchInvoiceForm, DocumentArchiveForm, DocumentFormatForm
+from .database import retry_on_locked
+from .jobs import enqueue_invoice
+from .invoices import LINE_FIELDS, save_invoice_draft
+from .batch import BatchError, clean_batch, generate_batch, read_batch
+from .customers import autocomplete
+from .search import search_documents
+from .archive import stream_documents_zip
+from .pagination import akeyset_page, keyset_page
+from .profiles import aget_entrepreneur_or_404, get_entrepreneur, get_entrepreneur_or_404
+from . import profiling
+from .serving import aserve_document, serve_document
+from .totals import compute_totals, footer_rows
 from django.contrib import messages
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils.timezone import localtime
+from asgiref.sync import sync_to_async
+import hmac
 import os
 from datetime import datetime
+from functools import wraps
 
 class CustomLoginView(LoginView):
     redirect_authenticated_user = True
@@ -43,27 +61,33 @@ def home_redirect(request):
     else:
         return redirect('entrepreneurs:login')
 
+@retry_on_locked
+def create_entrepreneur_account(form):
+    """Создаёт пользователя и профиль одной транзакцией, чтобы повтор не оставил пользователя без профиля"""
+    form.instance.pk = None
+    with transaction.atomic():
+        user = form.save()
+        EntrepreneurProfile.objects.create(
+            user=user,
+            company_name=form.cleaned_data['company_name'],
+            inn=form.cleaned_data['inn'],
+            ogrnip=form.cleaned_data['ogrnip'],
+            phone=form.cleaned_data['phone']
+        )
+    return user
+
 def register_entrepreneur(request):
     if request.method == 'POST':
         form = EntrepreneurRegistrationForm(request.POST)
         if form.is_valid():
-            user = form.save()
-            
-            EntrepreneurProfile.objects.create(
-                user=user,
-                company_name=form.cleaned_data['company_name'],
-                inn=form.cleaned_data['inn'],
-                ogrnip=form.cleaned_data['ogrnip'],
-                phone=form.cleaned_data['phone']
-            )
-            
-            user = authenticate(
-                username=user.username,
-                password=form.cleaned_data['password1']
-            )
-            
-            if user is not None:
-                login(request, user)
+            try:
+                user = create_entrepreneur_account(form)
+            except IntegrityError:
+                # Параллельная регистрация с теми же ИНН, ОГРНИП или email
+                form.add_error(None, 'Предприниматель с такими данными уже зарегистрирован')
+            else:
+                # Пароль только что задан, повторная проверка через authenticate не нужна
+                login(request, user, backend='django.contrib.auth.backends.ModelBackend')
                 return redirect('entrepreneurs:dashboard')
     else:
         form = EntrepreneurRegistrationForm()
@@ -72,9 +96,8 @@ def register_entrepreneur(request):
 
 @login_required
 def dashboard(request):
-    try:
-        profile = request.user.entrepreneur_profile
-    except EntrepreneurProfile.DoesNotExist:
+    profile = get_entrepreneur(request)
+    if profile is None:
         return redirect('profile_create')
     
     return render(request, 'dashboard.html', {
@@ -84,7 +107,7 @@ def dashboard(request):
 
 @login_required
 def bank_details(request):
-    entrepreneur = get_object_or_404(EntrepreneurProfile, user=request.user)
+    entrepreneur = get_entrepreneur_or_404(request)
     
     try:
         bank_details = entrepreneur.bank_details
@@ -92,11 +115,14 @@ def bank_details(request):
         bank_details = None
     
     if request.method == 'POST':
+        # Профиль мог прийти из кеша до того, как реквизиты сохранил другой
+        # процесс: без перечитывания из БД создались бы вторые реквизиты
+        bank_details = BankDetails.objects.filter(entrepreneur=entrepreneur).first()
         form = BankDetailsForm(request.POST, instance=bank_details)
         if form.is_valid():
             bank_details = form.save(commit=False)
             bank_details.entrepreneur = entrepreneur
-            bank_details.save()
+            retry_on_locked(bank_details.save)()
             messages.success(request, 'Банковские реквизиты успешно сохранены!')
             return redirect('entrepreneurs:documents')
     else:
@@ -108,8 +134,8 @@ def bank_details(request):
     })
 
 @login_required
-def create_invoice(request):
-    entrepreneur = get_object_or_404(EntrepreneurProfile, user=request.user)
+def create_invoice(request, pk=None):
+    entrepreneur = get_entrepreneur_or_404(request)
     
     try:
         bank_details = entrepreneur.bank_details
@@ -117,36 +143,37 @@ def create_invoice(request):
         messages.warning(request, 'Пожалуйста, сначала заполните банковские реквизиты!')
         return redirect('entrepreneurs:bank_details')
     
+    # Редактирование сохранённого черновика
+    invoice = None
+    if pk is not None:
+        invoice = get_object_or_404(Invoice, pk=pk, entrepreneur=entrepreneur, document__isnull=True)
+    
     if request.method == 'POST':
         form = InvoiceGenerationForm(request.POST)
-        formset = InvoiceItemFormSet(request.POST)
+        formset = InvoiceItemFormSet(request.POST, queryset=InvoiceItem.objects.none())
         
         if form.is_valid() and formset.is_valid():
-            items_data = []
-            for item_form in formset:
-                if item_form.cleaned_data and not item_form.cleaned_data.get('DELETE', False):
-                    cleaned_data = item_form.cleaned_data.copy()
-                    # Преобразуем Decimal в float для сериализации
-                    cleaned_data['quantity'] = float(cleaned_data['quantity'])
-                    cleaned_data['price'] = float(cleaned_data['price'])
-                    cleaned_data['vat_rate'] = float(cleaned_data['vat_rate'])
-                    items_data.append(cleaned_data)
-            
-            form_data = form.cleaned_data.copy()
-            # Преобразуем даты в строки
-            form_data['date'] = form_data['date'].isoformat()
-            form_data['payment_due_date'] = form_data['payment_due_date'].isoformat()
-            
-            request.session['invoice_items'] = items_data
-            request.session['invoice_form_data'] = form_data
-            
-            return redirect('entrepreneurs:preview_invoice')
+            items_data = [
+                item_form.cleaned_data
+                for item_form in formset
+                if item_form.cleaned_data and not item_form.cleaned_data.get('DELETE', False)
+            ]
+            invoice = save_invoice_draft(entrepreneur, form.cleaned_data, items_data, invoice)
+            return redirect('entrepreneurs:preview_invoice', pk=invoice.pk)
+    elif invoice is not None:
+        form = InvoiceGenerationForm(initial=invoice.form_data)
+        lines = [
+            {field: getattr(line, field) for field in LINE_FIELDS}
+            for line in invoice.lines.all()
+        ]
+        formset = InvoiceItemFormSet(queryset=InvoiceItem.objects.none(), initial=lines)
+        formset.extra = max(len(lines), 1)
     else:
         form = InvoiceGenerationForm(initial={
             'date': datetime.now().date(),
             'payment_due_date': datetime.now().date()
         })
-        formset = InvoiceItemFormSet()
+        formset = InvoiceItemFormSet(queryset=InvoiceItem.objects.none())
     
     return render(request, 'entrepreneurs/create_invoice.html', {
         'form': form,
@@ -155,57 +182,71 @@ def create_invoice(request):
     })
 
 @login_required
-def preview_invoice(request):
-    if 'invoice_items' not in request.session or 'invoice_form_data' not in request.session:
-        return redirect('entrepreneurs:create_invoice')
-    
-    entrepreneur = get_object_or_404(EntrepreneurProfile, user=request.user)
-    bank_details = get_object_or_404(BankDetails, entrepreneur=entrepreneur)
-    
-    # Восстанавливаем данные из сессии
-    items_data = request.session['invoice_items']
-    form_data = request.session['invoice_form_data'].copy()
-    
-    # Преобразуем строки обратно в даты
-    from datetime import datetime
-    form_data['date'] = datetime.strptime(form_data['date'], '%Y-%m-%d').date()
-    form_data['payment_due_date'] = datetime.strptime(form_data['payment_due_date'], '%Y-%m-%d').date()
-    
-    # Создаем временные объекты InvoiceItem
-    items = []
-    for item_data in items_data:
-        item = InvoiceItem(
-            description=item_data['description'],
-            quantity=item_data['quantity'],
-            unit=item_data['unit'],
-            price=item_data['price'],
-            vat_rate=item_data['vat_rate']
-        )
-        items.append(item)
+def customer_autocomplete(request):
+    """Подсказки заказчиков для формы счёта по началу имени или ИНН (JSON)"""
+    entrepreneur = get_entrepreneur_or_404(request)
+    return JsonResponse({'customers': autocomplete(entrepreneur.pk, request.GET.get('q', ''))})
+
+@login_required
+def preview_invoice(request, pk):
+    entrepreneur = get_entrepreneur_or_404(request)
+    try:
+        bank_details = entrepreneur.bank_details
+    except BankDetails.DoesNotExist:
+        raise Http404('Банковские реквизиты не заполнены')
+    invoice = get_object_or_404(Invoice, pk=pk, entrepreneur=entrepreneur)
     
-    if request.method == 'POST' and 'generate' in request.POST:
-        file_stream = generate_invoice(entrepreneur, bank_details, items, form_data)
-        
-        doc = GeneratedDocument.objects.create(
-            entrepreneur=entrepreneur,
-            document_type='Счёт на оплату',
-        )
-        doc.file.save(f'Счет_{entrepreneur.inn}_{datetime.now().strftime("%Y%m%d%H%M%S")}.docx', file_stream)
-        doc.save()
-        
-        del request.session['invoice_items']
-        del request.session['invoice_form_data']
+    if not invoice.is_draft:
+        return redirect('entrepreneurs:document_detail', pk=invoice.document_id)
+    
+    format_form = DocumentFormatForm(request.POST or None)
+    if request.method == 'POST' and 'generate' in request.POST and format_form.is_valid():
+        # Генерация выполняется обработчиками очереди (manage.py run_document_workers)
+        doc, created = enqueue_invoice(invoice, format_form.cleaned_data['document_format'] or 'docx')
         
-        messages.success(request, 'Документ успешно сгенерирован!')
+        if created:
+            messages.success(request, 'Документ поставлен в очередь на генерацию')
+        else:
+            messages.info(request, 'Такой счёт уже сформирован; черновик сохранён без изменений')
         return redirect('entrepreneurs:document_detail', pk=doc.pk)
     
+    lines = list(invoice.lines.all())
     return render(request, 'entrepreneurs/preview_invoice.html', {
         'entrepreneur': entrepreneur,
         'bank_details': bank_details,
-        'items': items,
-        'form_data': form_data
+        'invoice': invoice,
+        'lines': lines,
+        'footer': footer_rows(compute_totals(lines)),
+        'format_form': format_form
     })
 
+@login_required
+@require_POST
+def batch_invoices(request):
+    entrepreneur = get_entrepreneur_or_404(request)
+    
+    try:
+        entrepreneur.bank_details
+    except BankDetails.DoesNotExist:
+        return JsonResponse({'error': 'Сначала заполните банковские реквизиты'}, status=400)
+    
+    form = BatchInvoiceForm(request.POST, request.FILES)
+    if not form.is_valid():
+        return JsonResponse({'error': form.errors.get_json_data()}, status=400)
+    
+    try:
+        invoices = clean_batch(read_batch(form.cleaned_data['file'], form.cleaned_data['format'] or None))
+    except BatchError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    try:
+        result = generate_batch(
+            entrepreneur, invoices, document_format=form.cleaned_data['document_format'] or 'docx'
+        )
+    except BatchError as e:
+        return JsonResponse({'error': str(e)}, status=409)
+    return JsonResponse(result)
+
 @login_required
 def document_detail(request, pk):
     document = get_object_or_404(GeneratedDocument, pk=pk, entrepreneur__user=request.user)
@@ -214,16 +255,173 @@ def document_detail(request, pk):
     })
 
 @login_required
-def download_document(request, pk):
+def document_status(request, pk):
     document = get_object_or_404(GeneratedDocument, pk=pk, entrepreneur__user=request.user)
-    response = FileResponse(document.file.open('rb'), as_attachment=True)
-    response['Content-Disposition'] = f'attachment; filename="{os.path.basename(document.file.name)}"'
-    return response
+    return JsonResponse({
+        'status': document.status,
+        'status_display': document.get_status_display(),
+    })
+
+@login_required
+def download_document(request, pk):
+    document = get_object_or_404(
+        GeneratedDocument,
+        pk=pk,
+        entrepreneur__user=request.user,
+        status=GeneratedDocument.STATUS_READY
+    )
+    return serve_document(request, document)
+
+# Поля, которые выводятся в списке документов
+DOCUMENT_LIST_FIELDS = ('id', 'document_type', 'created_at', 'status')
+
+def _search(documents, query):
+    """Документы, найденные по строке поиска q; без запроса — все"""
+    return search_documents(documents, query) if query else documents
 
 @login_required
 def documents_list(request):
-    entrepreneur = get_object_or_404(EntrepreneurProfile, user=request.user)
-    documents = GeneratedDocument.objects.filter(entrepreneur=entrepreneur).order_by('-created_at')
+    entrepreneur = get_entrepreneur_or_404(request)
+    query = request.GET.get('q', '').strip()
+    documents = _search(GeneratedDocument.objects.filter(entrepreneur=entrepreneur), query).only(*DOCUMENT_LIST_FIELDS)
+    try:
+        documents, next_cursor = keyset_page(documents, request.GET.get('cursor'), settings.DOCUMENTS_PER_PAGE)
+    except ValueError:
+        return redirect('entrepreneurs:documents')
+    
     return render(request, 'entrepreneurs/documents_list.html', {
-        'documents': documents
-    })
\ No newline at end of file
+        'documents': documents,
+        'next_cursor': next_cursor,
+        'is_first_page': not request.GET.get('cursor'),
+        'query': query,
+        'archive_form': DocumentArchiveForm()
+    })
+
+# Асинхронные версии представлений документов для ASGI (включаются ASYNC_VIEWS):
+# пока медленный клиент скачивает файл, процесс не держит под него поток
+
+def async_login_required(view):
+    """login_required для асинхронных представлений (в Django 4.2 он их не поддерживает)"""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        # request.user ленивый: первое обращение читает сессию и пользователя из БД
+        if not await sync_to_async(lambda: request.user.is_authenticated)():
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+async def _arender(request, template_name, context):
+    # Шаблон и контекстные процессоры читают сессию, пользователя и БД
+    # синхронно, поэтому рендер идёт в потоке, а не в цикле событий
+    return await sync_to_async(render)(request, template_name, context)
+
+async def _aget_document_or_404(request, pk, **filters):
+    document = await GeneratedDocument.objects.filter(pk=pk, entrepreneur__user=request.user, **filters).afirst()
+    if document is None:
+        raise Http404('Документ не найден')
+    return document
+
+@async_login_required
+async def adocument_detail(request, pk):
+    document = await _aget_document_or_404(request, pk)
+    return await _arender(request, 'entrepreneurs/document_detail.html', {
+        'document': document
+    })
+
+@async_login_required
+async def adownload_document(request, pk):
+    document = await _aget_document_or_404(request, pk, status=GeneratedDocument.STATUS_READY)
+    return await aserve_document(request, document)
+
+@async_login_required
+async def adocuments_list(request):
+    entrepreneur = await aget_entrepreneur_or_404(request)
+    query = request.GET.get('q', '').strip()
+    documents = _search(GeneratedDocument.objects.filter(entrepreneur=entrepreneur), query).only(*DOCUMENT_LIST_FIELDS)
+    try:
+        documents, next_cursor = await akeyset_page(documents, request.GET.get('cursor'), settings.DOCUMENTS_PER_PAGE)
+    except ValueError:
+        return redirect('entrepreneurs:documents')
+    
+    return await _arender(request, 'entrepreneurs/documents_list.html', {
+        'documents': documents,
+        'next_cursor': next_cursor,
+        'is_first_page': not request.GET.get('cursor'),
+        'query': query,
+        'archive_form': DocumentArchiveForm()
+    })
+
+@login_required
+def documents_page(request):
+    """Следующая страница списка документов в JSON (для бесконечной прокрутки)"""
+    documents = GeneratedDocument.objects.filter(entrepreneur__user=request.user)
+    documents = _search(documents, request.GET.get('q', '').strip()).values(*DOCUMENT_LIST_FIELDS)
+    try:
+        documents, next_cursor = keyset_page(documents, request.GET.get('cursor'), settings.DOCUMENTS_PER_PAGE)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    status_display = dict(GeneratedDocument.STATUS_CHOICES)
+    return JsonResponse({
+        'documents': [
+            {
+                'id': document['id'],
+                'document_type': document['document_type'],
+                'created_at': localtime(document['created_at']).strftime('%d.%m.%Y %H:%M'),
+                'status': document['status'],
+                'status_display': status_display[document['status']],
+                'detail_url': reverse('entrepreneurs:document_detail', kwargs={'pk': document['id']}),
+                'download_url': reverse('entrepreneurs:download_document', kwargs={'pk': document['id']}),
+            }
+            for document in documents
+        ],
+        'next_cursor': next_cursor,
+    })
+
+@login_required
+def download_archive(request):
+    form = DocumentArchiveForm(request.GET)
+    if not form.is_valid():
+        messages.warning(request, 'Выберите документы или укажите период для архива')
+        return redirect('entrepreneurs:documents')
+    
+    documents = GeneratedDocument.objects.filter(
+        entrepreneur__user=request.user,
+        status=GeneratedDocument.STATUS_READY
+    ).exclude(file='').only('file', 'filename', 'created_at').order_by('created_at')
+    
+    if form.cleaned_data['ids']:
+        documents = documents.filter(pk__in=form.cleaned_data['ids'])
+    if form.cleaned_data['date_from']:
+        documents = documents.filter(created_at__date__gte=form.cleaned_data['date_from'])
+    if form.cleaned_data['date_to']:
+        documents = documents.filter(created_at__date__lte=form.cleaned_data['date_to'])
+    
+    response = StreamingHttpResponse(
+        stream_documents_zip(documents.iterator(chunk_size=500)),
+        content_type='application/zip'
+    )
+    response['Content-Disposition'] = 'attachment; filename="documents.zip"'
+    return response
+
+@staff_member_required
+def performance_dashboard(request):
+    """Время ответа и его составляющие по представлениям (для персонала)"""
+    return render(request, 'entrepreneurs/performance.html', {
+        'enabled': settings.REQUEST_PROFILING,
+        'rows': profiling.summary(profiling.registry.snapshot()),
+    })
+
+def performance_metrics(request):
+    """Метрики профилирования в формате Prometheus: для персонала или по токену"""
+    token = settings.PROFILING_METRICS_TOKEN
+    authorization = request.headers.get('Authorization', '')
+    if not (
+        request.user.is_active and request.user.is_staff
+        or token and hmac.compare_digest(authorization, f'Bearer {token}')
+    ):
+        return HttpResponse(status=403)
+    return HttpResponse(
+        profiling.render_metrics(profiling.registry.snapshot()),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
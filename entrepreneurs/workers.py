@@ -0,0 +1,17 @@
+"""Точка входа процессов-обработчиков очереди генерации.
+
+Модуль не импортирует модели на верхнем уровне, чтобы его можно было
+загрузить в дочернем процессе до django.setup() (метод запуска spawn).
+"""
+import django
+
+
+def worker_main(worker_id, poll_interval, once):
+    django.setup()
+
+    from .jobs import work
+
+    try:
+        work(worker_id, poll_interval=poll_interval, once=once)
+    except KeyboardInterrupt:
+        pass
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -42,6 +43,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Первым, чтобы замер включал всю цепочку; включается REQUEST_PROFILING
+    'entrepreneurs.profiling.RequestProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -55,7 +58,8 @@ ROOT_URLCONF = 'project.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates с замером времени рендеринга для профилирования
+        'BACKEND': 'entrepreneurs.profiling.ProfiledDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -74,13 +78,72 @@ WSGI_APPLICATION = 'project.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# По умолчанию SQLite. DB_ENGINE=postgresql включает PostgreSQL с параметрами
+# из окружения: POSTGRES_DB, POSTGRES_USER, POSTGRES_PASSWORD, POSTGRES_HOST,
+# POSTGRES_PORT, POSTGRES_SSLMODE. DB_CONN_MAX_AGE — сколько секунд держать
+# соединение между запросами (0 — закрывать после каждого, пусто — без
+# ограничения); перед повторным использованием соединение проверяется
+# (CONN_HEALTH_CHECKS), поэтому перезапуск сервера БД не роняет запросы.
+# DB_POOLER=pgbouncer — соединения идут через PgBouncer в режиме transaction:
+# серверные курсоры отключаются, так как между транзакциями пулер может
+# передать соединение другому клиенту
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+DB_POOLER = os.environ.get('DB_POOLER', '')
+
+if DB_ENGINE == 'postgresql':
+    conn_max_age = os.environ.get('DB_CONN_MAX_AGE', '60')
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'diplom'),
+            'USER': os.environ.get('POSTGRES_USER', 'diplom'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            'CONN_MAX_AGE': int(conn_max_age) if conn_max_age else None,
+            'CONN_HEALTH_CHECKS': True,
+            'DISABLE_SERVER_SIDE_CURSORS': DB_POOLER == 'pgbouncer',
+            'OPTIONS': {
+                'connect_timeout': 5,
+                'application_name': 'diplom',
+                'sslmode': os.environ.get('POSTGRES_SSLMODE', 'prefer'),
+            },
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            # Тестовая БД в файле, а не в памяти: иначе SQLite использует табличные
+            # блокировки общего кэша и параллельные тесты получают "table is locked"
+            'TEST': {
+                'NAME': BASE_DIR / 'test_db.sqlite3',
+            },
+        }
     }
+
+
+# PRAGMA для каждого соединения с SQLite (entrepreneurs.database): WAL
+# позволяет читать во время записи, synchronous=NORMAL в режиме WAL не теряет
+# целостность при сбое процесса, busy_timeout (мс) — ожидание чужой записи
+# вместо немедленной ошибки, mmap_size и cache_size (отрицательное — в КиБ)
+# ускоряют чтение. Пустой словарь оставляет настройки SQLite по умолчанию.
+# Режим WAL хранится в самом файле БД: db.sqlite3 в репозитории уже переведён
+# в WAL с контрольной точкой, поэтому подключение к нему не меняет файл
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,
 }
 
+# Повторы записи при «database is locked» (entrepreneurs.database.retry_on_locked):
+# число повторов и первая задержка в секундах, далее она удваивается
+SQLITE_WRITE_RETRIES = 5
+SQLITE_WRITE_RETRY_BACKOFF = 0.05
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -133,4 +196,114 @@ AUTHENTICATION_BACKENDS = [
     'django.contrib.auth.backends.ModelBackend',
 ]
 
-AUTH_USER_MODEL = 'auth.User'
\ No newline at end of file
+AUTH_USER_MODEL = 'auth.User'
+
+# Кеш процесса по умолчанию; для нескольких процессов или серверов укажите
+# общий бэкенд (Redis, Memcached)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'sessions': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'sessions',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+# Хранение сессий. По умолчанию django.contrib.sessions.backends.db — только
+# БД: выход из системы и смена ключа сессии сразу видны всем процессам.
+# django.contrib.sessions.backends.cached_db — общий кеш (Redis, Memcached) с
+# записью в БД. entrepreneurs.sessions (SESSION_ENGINE=entrepreneurs.sessions
+# в окружении) — локальный кеш процесса с записью в БД, без запроса к БД на
+# каждый запрос; но при нескольких процессах выход, flush() и cycle_key() в
+# одном из них остальные замечают только через SESSION_LOCAL_CACHE_TIMEOUT, и
+# до тех пор закрытая сессия там действует, а устаревшее чтение может
+# перезаписать более новые данные сессии. Подходит для одного процесса
+SESSION_ENGINE = os.environ.get('SESSION_ENGINE', 'django.contrib.sessions.backends.db')
+SESSION_CACHE_ALIAS = 'sessions'
+# Сколько секунд сессия живёт в кеше процесса (entrepreneurs.sessions):
+# за этот срок выход из системы доходит до остальных процессов
+SESSION_LOCAL_CACHE_TIMEOUT = 60
+
+# Очередь генерации документов (entrepreneurs.jobs)
+
+DOCUMENT_WORKER_CONCURRENCY = 2
+DOCUMENT_WORKER_POLL_INTERVAL = 1.0
+DOCUMENT_JOB_MAX_ATTEMPTS = 5
+DOCUMENT_JOB_RETRY_BACKOFF = 5
+DOCUMENT_JOB_LOCK_TIMEOUT = 300
+
+# Выполнять задания сразу в запросе (для разработки без запущенных обработчиков)
+DOCUMENT_JOBS_EAGER = False
+
+# Пакетная генерация счетов (entrepreneurs.batch)
+
+BATCH_INVOICE_WORKERS = None  # None — по числу процессоров
+BATCH_INVOICE_CHUNK_SIZE = 25
+BATCH_INVOICE_IO_THREADS = 8
+# Сколько секунд номера пачки зарезервированы за ней до сохранения счетов;
+# после этого номера упавшей пачки выдаются другим счетам
+INVOICE_NUMBER_LEASE_TIMEOUT = 3600
+
+DOCUMENTS_PER_PAGE = 50
+
+# Хранилище документов с адресацией по содержимому (entrepreneurs.storage):
+# collect_document_blobs не удаляет файлы моложе этого срока
+DOCUMENT_BLOB_GRACE_HOURS = 24
+
+# Отдача файлов документов (entrepreneurs.serving): python — через Django,
+# x-sendfile — Apache mod_xsendfile, x-accel-redirect — nginx. Для nginx
+# префикс должен вести на internal-location с alias на MEDIA_ROOT:
+#   location /protected-media/ { internal; alias /path/to/media/; }
+DOCUMENT_SERVE_MODE = 'python'
+DOCUMENT_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+
+# Асинхронные представления списка, карточки и скачивания документов: под
+# ASGI медленные скачивания не занимают потоки. project/asgi.py включает их
+# по умолчанию; под WSGI остаются синхронные (ASYNC_VIEWS=0), так как
+# асинхронный ответ там пришлось бы целиком собирать в памяти
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', '0') == '1'
+
+# TrueType-шрифты для PDF-счетов (entrepreneurs.documents.PdfInvoiceRenderer);
+# нужны шрифты с кириллицей и таблицей glyf
+INVOICE_PDF_FONTS = {
+    'regular': '/usr/share/fonts/truetype/dejavu/DejaVuSerif.ttf',
+    'bold': '/usr/share/fonts/truetype/dejavu/DejaVuSerif-Bold.ttf',
+}
+
+# Генерация счетов с большим числом позиций (entrepreneurs.documents.stream_invoice):
+# строк за один запрос к БД и размер документа, после которого он пишется на диск
+INVOICE_LINES_CHUNK_SIZE = 2000
+INVOICE_SPOOL_MAX_SIZE = 1024 * 1024
+
+# Кеш профиля предпринимателя с реквизитами (entrepreneurs.profiles): алиас
+# из CACHES и время жизни в секундах; сбрасывается при сохранении профиля и
+# реквизитов, но только в кеше процесса, который их сохранил. Поэтому в кеше
+# процесса (LocMemCache) запись живёт не дольше ENTREPRENEUR_LOCAL_CACHE_TIMEOUT,
+# а ENTREPRENEUR_CACHE_TIMEOUT действует для общего кеша (Redis, Memcached)
+ENTREPRENEUR_CACHE_ALIAS = 'default'
+ENTREPRENEUR_CACHE_TIMEOUT = 300
+ENTREPRENEUR_LOCAL_CACHE_TIMEOUT = 10
+
+# Справочник заказчиков (entrepreneurs.customers): подсказок в автодополнении,
+# время жизни кеша ответов в секундах (в кеше ENTREPRENEUR_CACHE_ALIAS; в кеше
+# процесса — не дольше ENTREPRENEUR_LOCAL_CACHE_TIMEOUT) и сколько последних
+# запросов предпринимателя в нём хранится
+CUSTOMER_AUTOCOMPLETE_LIMIT = 10
+CUSTOMER_CACHE_TIMEOUT = 300
+CUSTOMER_CACHE_QUERIES = 100
+
+# Профилирование запросов (entrepreneurs.profiling): время ответа по
+# представлениям, запросы к БД и шаблоны, в том числе под ASGI. Страница для
+# персонала — /performance/, метрики Prometheus — /performance/metrics/; для
+# сборщика метрик без входа в систему — заголовок Authorization: Bearer <токен>
+REQUEST_PROFILING = False
+PROFILING_METRICS_TOKEN = ''
+
+# Набор замеров производительности (manage.py run_benchmarks): эталон для
+# сравнения и допустимое замедление относительно него. Эталон снят на
+# конкретной машине; на другой его нужно переснять (--update-baseline), а на
+# общих CI-машинах с плавающей нагрузкой порог стоит держать не ниже 0.5
+BENCHMARK_BASELINE = BASE_DIR / 'benchmarks' / 'baseline.json'
+BENCHMARK_REGRESSION_THRESHOLD = 0.5